@@ -0,0 +1,432 @@
+"""
+Benchmark suite for the AI Suggestion Service
+Times the hot functions and every HTTP endpoint (in process, with the
+artificial delays patched out), writes the results to a JSON baseline and
+compares later runs against it
+
+    python bench.py                                  # run and print
+    python bench.py --save bench_baseline.json       # run and write a baseline
+    python bench.py --compare bench_baseline.json    # fail on regressions
+    python bench.py --check-serialisation            # fast responses match FastAPI's bytes
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import APIRoute, serialize_response
+from starlette.responses import JSONResponse
+
+import main
+from duplicates import DuplicateIndex
+from main import SuggestionType
+from similarity import SimilarityIndex
+from serialisation import FastJSONResponse
+
+BASELINE_FORMAT = 1
+
+# Each measurement repeats a timed batch; a batch runs for at least this long
+MIN_BATCH_SECONDS = 0.05
+DEFAULT_REPEAT = 7
+DEFAULT_THRESHOLD = 0.15
+
+STRATEGIES = ("exact_ending", "partial_word", "substring", "after_space", "fallback", "none")
+
+TITLES = {
+    "task": "Review the quarterly budget report",
+    "meeting": "Weekly engineering team sync",
+    "department": "Engineering",
+}
+
+
+def strategy_inputs(field_type: str) -> Dict[str, str]:
+    """Find one input text per completion strategy for a field type
+
+    Candidates are built from the loaded trigger table and checked against
+    the index, so the inputs follow the template pack.
+    """
+    index = main.TEMPLATE_STORE.current.completion_index(field_type)
+    candidates = []
+    for trigger in index.triggers:
+        first_word = trigger.split()[0]
+        candidates += [
+            f"Notes for the team: {trigger}",
+            f"Notes for the team {first_word[:3]}",
+            f"Notes for the team: {trigger}xyz",
+            f"Notes {first_word[:2]} ",
+        ]
+    candidates += ["Zzyzx qwv vvv www xyz", "zq"]
+
+    found = {}
+    for text in candidates:
+        match = index.match(text.lower().strip(), text.endswith(" "))
+        if match is not None:
+            strategy = match[2]
+        elif len(text) >= 15:
+            strategy = "fallback"
+        else:
+            strategy = "none"
+        found.setdefault(strategy, text)
+    return {strategy: found[strategy] for strategy in STRATEGIES if strategy in found}
+
+
+SIMILARITY_ITEMS = 20000
+
+
+def similarity_index(items: int = SIMILARITY_ITEMS) -> SimilarityIndex:
+    """Index of synthetic items whose words follow a Zipf distribution, like real titles"""
+    rng = random.Random(0)
+    vocabulary = [f"w{rank}" for rank in range(5000)]
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+    index = SimilarityIndex()
+    for item_id in range(items):
+        index.add(item_id, " ".join(rng.choices(vocabulary, weights, k=4)), " ".join(rng.choices(vocabulary, weights, k=20)))
+    return index
+
+
+def duplicate_index(items: int = SIMILARITY_ITEMS) -> DuplicateIndex:
+    """Index of synthetic open items with mostly distinct titles"""
+    rng = random.Random(0)
+    words = "budget review quarterly sync team onboarding release notes client proposal server migration".split()
+    index = DuplicateIndex()
+    for item_id in range(items):
+        index.add(item_id, f"{' '.join(rng.sample(words, 3))} {rng.randrange(10 ** 6)}")
+    return index
+
+
+def function_benchmarks() -> List[Tuple[str, Callable[[], object]]]:
+    """(name, zero-argument callable) for each hot function"""
+    benchmarks = []
+
+    for field_type in sorted(main.TEMPLATE_STORE.current.inline_completions):
+        for strategy, text in strategy_inputs(field_type).items():
+            benchmarks.append((
+                f"generate_inline_completion[{field_type}:{strategy}]",
+                lambda text=text, field_type=field_type: main.generate_inline_completion(text, field_type, SuggestionType.GENERAL),
+            ))
+        text = strategy_inputs(field_type).get("exact_ending")
+        if text:
+            benchmarks.append((
+                f"generate_ranked_completions[{field_type}:top5]",
+                lambda text=text, field_type=field_type: main.generate_ranked_completions(text, field_type, SuggestionType.GENERAL, 5),
+            ))
+
+    for field_type, model in sorted(main.TEMPLATE_STORE.current.completion_models.items()):
+        for text in ("Please review the quarterly budget and ", "Please review the quarterly budget and prov"):
+            shape = "next_word" if text.endswith(" ") else "partial_word"
+            benchmarks.append((f"NgramModel.complete[{field_type}:{shape}]", lambda model=model, text=text: model.complete(text)))
+            benchmarks.append((f"NgramModel.rank[{field_type}:{shape}:top5]", lambda model=model, text=text: model.rank(text, 5)))
+
+    index = similarity_index()
+    for shape, title in (("rare", "w1200 w3400 w2"), ("common", "w0 w1 w2 w3")):
+        benchmarks.append((f"SimilarityIndex.search[{shape}:top5]", lambda title=title: index.search(title, 5)))
+
+    duplicates = duplicate_index()
+    for shape, title in (("duplicate", "Quarterly budget review 123456"), ("new", "Office move planning")):
+        benchmarks.append((f"DuplicateIndex.check[{shape}]", lambda title=title: duplicates.check(title, None, 5, 0.6)))
+
+    benchmarks += [
+        ("detect_template_key", lambda: main.detect_template_key(TITLES["task"])),
+        ("detect_meeting_type", lambda: main.detect_meeting_type(TITLES["meeting"])),
+        ("detect_department_type", lambda: main.detect_department_type(TITLES["department"])),
+        ("extract_subject", lambda: main.extract_subject(TITLES["task"])),
+    ]
+
+    generators = {
+        "task": main.generate_task_description,
+        "meeting": main.generate_meeting_description,
+        "department": main.generate_department_description,
+    }
+    context = {"priority": "high", "duration": 30}
+    for kind, generate in generators.items():
+        title = TITLES[kind]
+        benchmarks.append((f"generate_{kind}_description", lambda generate=generate, title=title: generate(title, context)))
+        benchmarks.append((f"generate_{kind}_description[regenerate]", lambda generate=generate, title=title: generate(title, context, True)))
+
+    responses = {
+        "description": main.generate_description(TITLES["task"], SuggestionType.TASK, context),
+        "alternatives": main.generate_alternatives(TITLES["task"], SuggestionType.TASK, context),
+        "ranked_completion": main.generate_ranked_completions("Please ensure", "description", SuggestionType.GENERAL, 5),
+    }
+    for kind, content in responses.items():
+        benchmarks.append((f"FastJSONResponse[{kind}]", lambda content=content: FastJSONResponse(content)))
+
+    return benchmarks
+
+
+def endpoint_benchmarks() -> List[Tuple[str, Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]]]:
+    """(name, coroutine function taking a client) for each HTTP endpoint"""
+    description = {"title": TITLES["task"], "type": "task", "context": {"priority": "high"}}
+    regenerate = dict(description, regenerate=True)
+    completion = {"text": "Please ensure", "field_type": "description"}
+    batch = {"items": [{"title": f"{TITLES['task']} {n}", "type": "task"} for n in range(20)]}
+
+    return [
+        ("GET /", lambda client: client.get("/")),
+        ("POST /api/suggest/description", lambda client: client.post("/api/suggest/description", json=description)),
+        ("POST /api/suggest/description[regenerate]", lambda client: client.post("/api/suggest/description", json=regenerate)),
+        ("POST /api/suggest/completion", lambda client: client.post("/api/suggest/completion", json=completion)),
+        ("POST /api/suggest/completion[top_k]", lambda client: client.post("/api/suggest/completion", json=dict(completion, top_k=5))),
+        ("POST /api/suggest/completion[session]", lambda client: client.post("/api/suggest/completion", json=dict(completion, session_id="bench"))),
+        ("POST /api/suggest/alternatives", lambda client: client.post("/api/suggest/alternatives", json=description)),
+        ("POST /api/suggest/alternatives[regenerate]", lambda client: client.post("/api/suggest/alternatives", json=regenerate)),
+        ("POST /api/suggest/description/stream", lambda client: client.post("/api/suggest/description/stream", json=regenerate)),
+        ("POST /api/suggest/alternatives/stream", lambda client: client.post("/api/suggest/alternatives/stream?format=sse", json=regenerate)),
+        ("POST /api/suggest/batch[20]", lambda client: client.post("/api/suggest/batch", json=batch)),
+        ("GET /api/cache/stats", lambda client: client.get("/api/cache/stats")),
+    ]
+
+
+def serialisation_cases() -> List[Tuple[str, object]]:
+    """(route path, response content) for every shape the fast response path sends
+
+    Covers each suggestion type with and without context and regenerate,
+    each completion strategy with and without ranking, batches with
+    errors, awkward characters, and float confidences that only some
+    encoders format alike.
+    """
+    titles = list(TITLES.values()) + [
+        "Naïve café rota – Zürich", 'Review "draft" \\ notes\tnow', "Line\u2028break \x01 😀 sync",
+    ]
+    contexts = [None, {"priority": "high"}, {"duration": 45, "assignee": "Siân O'Neill"}, {"duration": "an hour"}]
+    cases = []
+    for title in titles:
+        for suggestion_type in SuggestionType:
+            for context in contexts:
+                for regenerate in (False, True):
+                    cases.append(("/api/suggest/description", main.generate_description(title, suggestion_type, context, regenerate)))
+                    cases.append(("/api/suggest/alternatives", main.generate_alternatives(title, suggestion_type, context, regenerate)))
+
+    for field_type in sorted(main.TEMPLATE_STORE.current.inline_completions):
+        texts = list(strategy_inputs(field_type).values()) + ["Café notes: please ensure", "Zürich – "]
+        for text in texts:
+            cases.append(("/api/suggest/completion", main.generate_inline_completion(text, field_type, SuggestionType.GENERAL)))
+            cases.append(("/api/suggest/completion", main.generate_ranked_completions(text, field_type, SuggestionType.GENERAL, 10)))
+    for confidence in (0, 1, 0.1 + 0.2, 1e-7, 5e-324):
+        cases.append(("/api/suggest/completion", main.InlineCompletionResponse(completion="", full_text="", confidence=confidence)))
+        cases.append(("/api/suggest/completion", main.RankedInlineCompletionResponse(completion="", full_text="", confidence=confidence)))
+
+    results = [main.BatchItemResult(index=0, result=main.generate_description(TITLES["task"], SuggestionType.TASK))]
+    results.append(main.BatchItemResult(index=1, error="title: String should have at least 1 character"))
+    cases.append(("/api/suggest/batch", main.BatchDescriptionResponse(results=results)))
+    return cases
+
+
+async def reference_body(route: APIRoute, content: object) -> bytes:
+    """The body FastAPI itself sends when the route returns content"""
+    if route.response_field is not None:
+        return await serialize_response(field=route.response_field, response_content=content, dump_json=True)
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def serialisation_mismatches(cases: List[Tuple[str, object]]) -> List[str]:
+    """Describe every case where FastJSONResponse differs from FastAPI's own response"""
+    routes = {route.path: route for route in main.app.routes if isinstance(route, APIRoute)}
+    mismatches = []
+    for path, content in cases:
+        expected = asyncio.run(reference_body(routes[path], content))
+        response = FastJSONResponse(content)
+        if response.body != expected:
+            mismatches.append(f"{path}: {response.body[:120]!r} != {expected[:120]!r}")
+        elif response.media_type != "application/json":
+            mismatches.append(f"{path}: media type {response.media_type}")
+    return mismatches
+
+
+class _NoDelayAsyncio:
+    """Stand-in for the asyncio module inside main whose sleep never waits"""
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    @staticmethod
+    def sleep(delay, result=None):
+        return asyncio.sleep(0, result)
+
+
+def without_response_delays():
+    """Patch main so its artificial response delays are skipped
+
+    Only main's reference to asyncio is replaced, so sleeps elsewhere are
+    unaffected and the handlers still yield to the loop.
+    """
+    return mock.patch.object(main, "asyncio", _NoDelayAsyncio())
+
+
+def summarise(per_call: List[float], number: int) -> Dict[str, float]:
+    return {
+        "median_us": round(statistics.median(per_call) * 1e6, 3),
+        "min_us": round(min(per_call) * 1e6, 3),
+        "mean_us": round(statistics.fmean(per_call) * 1e6, 3),
+        "stdev_us": round(statistics.pstdev(per_call) * 1e6, 3),
+        "number": number,
+        "repeat": len(per_call),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int) -> Dict[str, float]:
+    """Time fn in batches sized to take at least MIN_BATCH_SECONDS"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_BATCH_SECONDS:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(MIN_BATCH_SECONDS / elapsed) + 1))
+
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        per_call.append((time.perf_counter() - start) / number)
+    return summarise(per_call, number)
+
+
+async def measure_async(fn: Callable[[], Awaitable[object]], repeat: int) -> Dict[str, float]:
+    """Async counterpart of measure()"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_BATCH_SECONDS:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(MIN_BATCH_SECONDS / elapsed) + 1))
+
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            await fn()
+        per_call.append((time.perf_counter() - start) / number)
+    return summarise(per_call, number)
+
+
+async def run_endpoints(repeat: int, selected: Callable[[str], bool]) -> Dict[str, Dict[str, float]]:
+    """Time the endpoints through an in-process ASGI client, without the artificial delays"""
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    with without_response_delays():
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, request in endpoint_benchmarks():
+                if not selected(name):
+                    continue
+                response = await request(client)
+                response.raise_for_status()
+
+                async def call(request=request):
+                    response = await request(client)
+                    await response.aread()
+
+                results[name] = await measure_async(call, repeat)
+                print(format_result(name, results[name]), flush=True)
+    return results
+
+
+def run(repeat: int, pattern: Optional[str] = None, endpoints: bool = True) -> Dict[str, Dict[str, float]]:
+    selected = (lambda name: pattern in name) if pattern else (lambda name: True)
+    results = {}
+    for name, fn in function_benchmarks():
+        if not selected(name):
+            continue
+        fn()
+        results[name] = measure(fn, repeat)
+        print(format_result(name, results[name]), flush=True)
+    if endpoints:
+        results.update(asyncio.run(run_endpoints(repeat, selected)))
+    return results
+
+
+def format_result(name: str, result: Dict[str, float]) -> str:
+    return f"{name:<60} {result['median_us']:>12.2f} us  (min {result['min_us']:.2f}, n={result['number']}x{result['repeat']})"
+
+
+def write_baseline(path: str, results: Dict[str, Dict[str, float]]) -> None:
+    baseline = {
+        "format": BASELINE_FORMAT,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "template_pack": main.TEMPLATE_STORE.current.version,
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(path: str, results: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Print median changes against a baseline and return the regressed names"""
+    with open(path) as f:
+        baseline = json.load(f)
+    if baseline.get("format") != BASELINE_FORMAT:
+        raise SystemExit(f"{path}: unsupported baseline format {baseline.get('format')!r}")
+
+    regressions = []
+    print(f"\n{'benchmark':<60} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            print(f"{name:<60} {'-':>12} {result['median_us']:>12.2f}      new")
+            continue
+        change = result["median_us"] / previous["median_us"] - 1 if previous["median_us"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<60} {previous['median_us']:>12.2f} {result['median_us']:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the AI Suggestion Service")
+    parser.add_argument("--save", metavar="PATH", help="write the results to a baseline file")
+    parser.add_argument("--compare", metavar="PATH", help="compare against a baseline file and fail on regressions")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"allowed slowdown of the median as a fraction (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timed batches per benchmark")
+    parser.add_argument("-k", dest="pattern", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--no-endpoints", action="store_true", help="skip the endpoint benchmarks")
+    parser.add_argument("--check-serialisation", action="store_true",
+                        help="only check that fast responses are byte-identical to FastAPI's")
+    args = parser.parse_args(argv)
+
+    if args.check_serialisation:
+        cases = serialisation_cases()
+        mismatches = serialisation_mismatches(cases)
+        for mismatch in mismatches:
+            print(mismatch)
+        print(f"{len(cases)} responses checked, {len(mismatches)} mismatched")
+        return 1 if mismatches else 0
+
+    results = run(args.repeat, args.pattern, endpoints=not args.no_endpoints)
+
+    if args.save:
+        write_baseline(args.save, results)
+        print(f"\nWrote {len(results)} results to {args.save}")
+
+    if args.compare:
+        regressions = compare(args.compare, results, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            return 1
+        print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
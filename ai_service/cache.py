@@ -0,0 +1,109 @@
+"""
+In-process response cache for the AI Suggestion Service
+Bounded LRU with per-entry TTL and a total size budget
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Least-recently-used cache with expiry and size-based eviction
+
+    Entries expire ttl seconds after insertion, or after their last access
+    when sliding is set. When either max_entries or max_size (as measured by
+    sizeof) is exceeded, the least recently used entries are evicted until
+    both limits hold again.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl: float = 600.0,
+        max_size: Optional[int] = None,
+        sizeof: Callable[[Any], int] = lambda value: 1,
+        sliding: bool = False,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sliding = sliding
+        self.max_size = max_size
+        self.sizeof = sizeof
+
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, int]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value, or None when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, size = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                del self._entries[key]
+                self._size -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            if self.sliding:
+                self._entries[key] = (value, now + self.ttl, size)
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store a value, evicting least recently used entries if needed"""
+        size = self.sizeof(value)
+        if self.max_size is not None and size > self.max_size:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._size -= previous[2]
+
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._size += size
+
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_size is not None and self._size > self.max_size)
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every entry (counters are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return current counters and occupancy"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self._size,
+            "max_entries": self.max_entries,
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,53 @@
+"""
+Request coalescing for the AI Suggestion Service
+Single-flight execution: while a computation for a key is in flight,
+callers asking for the same key wait for its result instead of repeating it
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """At most one in-flight computation per key, shared by every caller
+
+    The computation runs as its own task, so a caller that goes away (for
+    example a client that disconnects) does not cancel it for the callers
+    still waiting. Its result or exception is delivered to all of them.
+    Keys are forgotten as soon as the computation finishes; caching results
+    is left to the caller.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def run(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        # A task left behind by a loop that was closed mid-flight cannot be awaited here
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            self.leaders += 1
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._finished(key, finished))
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Retrieve the outcome so an error nobody waited for is not logged as unhandled
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._in_flight)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._in_flight),
+            "leaders": self.leaders,
+            "followers": self.followers,
+        }
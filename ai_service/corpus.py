@@ -0,0 +1,420 @@
+"""
+Corpus builder for the AI Suggestion Service
+Streams JSONL or CSV exports of tasks, meetings and departments and builds
+the learned artefacts: one n-gram completion model per field type and
+keyword statistics per item kind
+
+    python corpus.py --output artefacts exports/tasks.jsonl exports/meetings.csv.gz
+    python corpus.py --output artefacts --update exports/2026-10-17.jsonl
+
+Records are read lazily and counted in chunks by a process pool. At most
+a few chunks are queued at a time, and merged counts are spilled to sorted
+run files whenever they grow past --spill-entries. The runs are merged in
+one streaming pass into counts.tsv.gz. That file keeps every count, so
+--update folds a new export into it without reading the history again.
+The same pass writes the n-grams each model keeps to a file per field,
+still sorted, and the models are built from those in one more pass.
+Memory therefore grows with the models' vocabularies, not with the size
+of the export or the number of n-grams kept.
+
+Each record is an object with a title (or a department name) and optional
+description and agenda fields. Its kind is taken from a "kind" field, or
+inferred: records with an agenda or scheduled_at are meetings, records with
+a name but no title are departments, and everything else is a task.
+"""
+
+import argparse
+import csv
+import gzip
+import heapq
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from itertools import groupby, islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ngram_model import DEFAULT_MIN_COUNT, DEFAULT_ORDER, ModelWriter, choose_surfaces, iter_ngrams, surface_forms, tokenize
+from template_store import TemplateLibrary
+from templates import extract_subject
+
+ARTEFACT_FORMAT = 1
+DEFAULT_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "packs", "default.json")
+DEFAULT_CHUNK_SIZE = 2000
+DEFAULT_SPILL_ENTRIES = 1_000_000
+
+COUNTS_FILE = "counts.tsv.gz"
+KEYWORDS_FILE = "keywords.json"
+MANIFEST_FILE = "manifest.json"
+
+# Text fields counted for completion models, by the field type they complete
+TEXT_FIELDS = ("title", "description", "agenda")
+# Counts of how words are written, shared by every field's model, are keyed under this name
+SURFACE_KEY = "surface"
+
+
+# Reading exports
+
+def _open_text(path: str):
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_records(path: str) -> Iterator[dict]:
+    """Records of a JSONL or CSV export (optionally gzipped), one at a time"""
+    name = path[:-3] if path.endswith(".gz") else path
+    f = _open_text(path)
+    try:
+        if name.endswith(".csv"):
+            csv.field_size_limit(sys.maxsize)
+            yield from csv.DictReader(f)
+            return
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON ({e})") from e
+            if isinstance(record, dict):
+                yield record
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def record_kind(record: dict) -> str:
+    kind = record.get("kind")
+    if kind in ("task", "meeting", "department"):
+        return kind
+    if record.get("agenda") is not None or "scheduled_at" in record:
+        return "meeting"
+    if record.get("name") and not record.get("title"):
+        return "department"
+    return "task"
+
+
+def normalise(text) -> str:
+    """Collapse whitespace; missing values become empty text"""
+    return " ".join(str(text).split()) if text else ""
+
+
+# Counting (runs in the worker processes)
+
+_library: Optional[TemplateLibrary] = None
+_order = DEFAULT_ORDER
+
+
+def _init_worker(pack_path: str, order: int) -> None:
+    global _library, _order
+    _library = TemplateLibrary.from_file(pack_path)
+    _order = order
+
+
+def count_chunk(records: List[dict]) -> dict:
+    """Count n-grams per text field and keyword statistics per kind for a chunk
+
+    N-grams are keyed "field<TAB>space-joined tokens", the sort key of
+    the counts file, so partial results merge and spill without rekeying.
+    Words as written are keyed "surface<TAB>word".
+    """
+    ngrams: Counter = Counter()
+    texts: Counter = Counter()
+    keywords: Dict[str, dict] = {}
+    for record in records:
+        kind = record_kind(record)
+        title = normalise(record.get("title") or record.get("name"))
+        fields = {
+            "title": title,
+            "description": normalise(record.get("description")),
+            "agenda": normalise(record.get("agenda")) if kind == "meeting" else "",
+        }
+        for field, text in fields.items():
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            texts[field] += 1
+            ngrams.update(f"{field}\t{' '.join(gram)}" for gram in iter_ngrams(tokens, _order))
+            ngrams.update(f"{SURFACE_KEY}\t{surface}" for surface in surface_forms(text))
+
+        if not title:
+            continue
+        stats = keywords.setdefault(kind, {"records": 0, "categories": Counter(), "subject_terms": Counter()})
+        stats["records"] += 1
+        # The same classification and subject the detect_* functions and extract_subject give the title
+        stats["categories"][_library.classifiers[kind].classify(title)] += 1
+        stats["subject_terms"].update(term for term in extract_subject(title).lower().split() if len(term) > 2)
+    return {"records": len(records), "ngrams": ngrams, "texts": texts, "keywords": keywords}
+
+
+# Merging
+
+def _parse_counts(lines: Iterable[str]) -> Iterator[Tuple[str, int]]:
+    for line in lines:
+        key, _, count = line.rstrip("\n").rpartition("\t")
+        yield key, int(count)
+
+
+def _merge_sorted(sources: List[Iterable[Tuple[str, int]]]) -> Iterator[Tuple[str, int]]:
+    """Merge sorted (key, count) streams, summing the counts of equal keys"""
+    for key, group in groupby(heapq.merge(*sources), key=lambda item: item[0]):
+        yield key, sum(count for _, count in group)
+
+
+class CountMerger:
+    """Accumulates chunk counts, spilling sorted runs to disk past a size limit"""
+
+    def __init__(self, spill_dir: str, spill_entries: int = DEFAULT_SPILL_ENTRIES):
+        self.spill_dir = spill_dir
+        self.spill_entries = spill_entries
+        self.ngrams: Counter = Counter()
+        self.texts: Counter = Counter()
+        self.keywords: Dict[str, dict] = {}
+        self.records = 0
+        self.runs: List[str] = []
+
+    def add(self, partial: dict) -> None:
+        self.records += partial["records"]
+        self.ngrams.update(partial["ngrams"])
+        self.texts.update(partial["texts"])
+        merge_keywords(self.keywords, partial["keywords"])
+        if len(self.ngrams) >= self.spill_entries:
+            self.spill()
+
+    def spill(self) -> None:
+        if not self.ngrams:
+            return
+        path = os.path.join(self.spill_dir, f"run-{len(self.runs):05d}.tsv")
+        with open(path, "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\t{count}\n" for key, count in sorted(self.ngrams.items()))
+        self.runs.append(path)
+        self.ngrams = Counter()
+
+    def sorted_counts(self, previous: Optional[str] = None) -> Iterator[Tuple[str, int]]:
+        """All counts in key order, folded together with a previous counts file"""
+        self.spill()
+        files = [open(path, encoding="utf-8") for path in self.runs]
+        if previous is not None:
+            files.append(gzip.open(previous, "rt", encoding="utf-8"))
+        try:
+            yield from _merge_sorted([_parse_counts(f) for f in files])
+        finally:
+            for f in files:
+                f.close()
+
+
+def merge_keywords(into: Dict[str, dict], other: Dict[str, dict]) -> None:
+    for kind, stats in other.items():
+        target = into.setdefault(kind, {"records": 0, "categories": Counter(), "subject_terms": Counter()})
+        target["records"] += stats["records"]
+        target["categories"].update(stats["categories"])
+        target["subject_terms"].update(stats["subject_terms"])
+
+
+def _chunks(records: Iterable[dict], size: int) -> Iterator[List[dict]]:
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def count_records(records: Iterable[dict], merger: CountMerger, pack_path: str, order: int,
+                  workers: int, chunk_size: int) -> None:
+    """Count records in chunks across a process pool, merging results as they finish"""
+    if workers <= 1:
+        _init_worker(pack_path, order)
+        for chunk in _chunks(records, chunk_size):
+            merger.add(count_chunk(chunk))
+        return
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(pack_path, order)) as pool:
+        pending = set()
+        for chunk in _chunks(records, chunk_size):
+            # Bound the chunks held in memory, queued or being counted
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merger.add(future.result())
+            pending.add(pool.submit(count_chunk, chunk))
+        for future in pending:
+            merger.add(future.result())
+
+
+# Artefacts
+
+def load_manifest(output: str) -> Optional[dict]:
+    path = os.path.join(output, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_keywords(output: str) -> Dict[str, dict]:
+    with open(os.path.join(output, KEYWORDS_FILE)) as f:
+        keywords = json.load(f)
+    return {
+        kind: {"records": stats["records"], "categories": Counter(stats["categories"]),
+               "subject_terms": Counter(stats["subject_terms"])}
+        for kind, stats in keywords.items()
+    }
+
+
+def _write_json(path: str, value) -> None:
+    temporary = f"{path}.tmp-{os.getpid()}"
+    with open(temporary, "w") as f:
+        json.dump(value, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(temporary, path)
+
+
+def input_signature(path: str) -> dict:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def build(inputs: List[str], output: str, pack_path: str = DEFAULT_PACK, order: int = DEFAULT_ORDER,
+          min_count: int = DEFAULT_MIN_COUNT, workers: int = 1, chunk_size: int = DEFAULT_CHUNK_SIZE,
+          spill_entries: int = DEFAULT_SPILL_ENTRIES, update: bool = False, organisation: Optional[str] = None) -> dict:
+    """Count the inputs, fold them into the existing artefacts when updating, and write everything
+
+    Returns the new manifest.
+    """
+    os.makedirs(output, exist_ok=True)
+    manifest = load_manifest(output) if update else None
+    if manifest is not None:
+        if manifest.get("format") != ARTEFACT_FORMAT:
+            raise ValueError(f"{output}: unsupported artefact format {manifest.get('format')!r}")
+        if manifest["order"] != order:
+            raise ValueError(f"{output} was built with order {manifest['order']}; rebuild to change it")
+        if manifest.get("organisation") != organisation:
+            raise ValueError(f"{output} was built for organisation {manifest.get('organisation')!r}")
+        folded = {(entry["path"], entry["size"], entry["mtime_ns"]) for entry in manifest["inputs"]}
+        for path in inputs:
+            if path != "-" and tuple(input_signature(path).values()) in folded:
+                raise ValueError(f"{path} has already been folded into {output}")
+
+    def selected(records: Iterable[dict]) -> Iterator[dict]:
+        for record in records:
+            if organisation is None or str(record.get("organization_id")) == organisation:
+                yield record
+
+    started = time.monotonic()
+    entries = []
+    with tempfile.TemporaryDirectory(prefix="corpus-", dir=output) as spill_dir:
+        merger = CountMerger(spill_dir, spill_entries)
+        for path in inputs:
+            before = merger.records
+            count_records(selected(read_records(path)), merger, pack_path, order, workers, chunk_size)
+            entry = input_signature(path) if path != "-" else {"path": "-"}
+            entry.update(records=merger.records - before, added=datetime.now(timezone.utc).isoformat(timespec="seconds"))
+            entries.append(entry)
+
+        texts = merger.texts
+        keywords = merger.keywords
+        if manifest is not None:
+            texts = texts + Counter(manifest["texts"])
+            merge_keywords(keywords, load_keywords(output))
+
+        # One streaming pass writes the full counts, and the n-grams each model keeps to a file per field
+        counts_path = os.path.join(output, COUNTS_FILE)
+        previous = counts_path if manifest is not None else None
+        vocabularies: Dict[str, List[str]] = {field: [] for field in TEXT_FIELDS}
+        surfaces: List[Tuple[str, int]] = []
+        kept = {field: open(os.path.join(spill_dir, f"kept-{field}.tsv"), "w", encoding="utf-8") for field in TEXT_FIELDS}
+        temporary = os.path.join(spill_dir, COUNTS_FILE)
+        try:
+            with gzip.open(temporary, "wt", encoding="utf-8", compresslevel=3) as f:
+                for key, count in merger.sorted_counts(previous):
+                    f.write(f"{key}\t{count}\n")
+                    if count < min_count:
+                        continue
+                    field, _, gram = key.partition("\t")
+                    if field == SURFACE_KEY:
+                        surfaces.append((gram, count))
+                        continue
+                    kept[field].write(f"{gram}\t{count}\n")
+                    if " " not in gram:
+                        vocabularies[field].append(gram)
+        finally:
+            for f in kept.values():
+                f.close()
+        os.replace(temporary, counts_path)
+
+        # Keys sort with tokens separated by a space, which sorts before any token
+        # character, so each file is in the order of its token tuples
+        written = {}
+        chosen = choose_surfaces(surfaces, min_count)
+        for field, vocabulary in vocabularies.items():
+            if not vocabulary:
+                continue
+            model_path = os.path.join(output, f"{field}.ngram")
+            with ModelWriter(model_path, order, vocabulary, chosen, min_count, texts[field]) as writer, \
+                    open(os.path.join(spill_dir, f"kept-{field}.tsv"), encoding="utf-8") as f:
+                for gram, count in _parse_counts(f):
+                    writer.add(gram.split(" "), count)
+                written[field] = writer.close()
+
+    _write_json(os.path.join(output, KEYWORDS_FILE), {
+        kind: {"records": stats["records"], "categories": dict(stats["categories"].most_common()),
+               "subject_terms": dict(stats["subject_terms"].most_common())}
+        for kind, stats in keywords.items()
+    })
+    new_manifest = {
+        "format": ARTEFACT_FORMAT,
+        "order": order,
+        "min_count": min_count,
+        "organisation": organisation,
+        "records": (manifest["records"] if manifest else 0) + merger.records,
+        "texts": dict(texts),
+        "models": {field: f"{field}.ngram" for field in written},
+        "ngrams": written,
+        "inputs": (manifest["inputs"] if manifest else []) + entries,
+        "build_seconds": round(time.monotonic() - started, 2),
+    }
+    _write_json(os.path.join(output, MANIFEST_FILE), new_manifest)
+    return new_manifest
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build completion models and keyword statistics from exports")
+    parser.add_argument("inputs", nargs="+", metavar="PATH",
+                        help='JSONL or CSV exports, optionally gzipped, or "-" for JSONL on stdin')
+    parser.add_argument("--output", required=True, help="artefact directory")
+    parser.add_argument("--update", action="store_true", help="fold the inputs into the artefacts already in --output")
+    parser.add_argument("--pack", default=DEFAULT_PACK, help="template pack whose keyword classifiers are used")
+    parser.add_argument("--organisation", help="only count records with this organization_id")
+    parser.add_argument("--order", type=int, default=DEFAULT_ORDER, help=f"longest n-gram (default {DEFAULT_ORDER})")
+    parser.add_argument("--min-count", type=int, default=DEFAULT_MIN_COUNT,
+                        help=f"n-grams seen fewer times are left out of the models (default {DEFAULT_MIN_COUNT})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="counting processes (default: number of cores)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="records per chunk")
+    parser.add_argument("--spill-entries", type=int, default=DEFAULT_SPILL_ENTRIES,
+                        help="distinct n-grams held in memory before spilling a sorted run to disk")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest = build(args.inputs, args.output, args.pack, args.order, args.min_count, args.workers,
+                         args.chunk_size, args.spill_entries, args.update, args.organisation)
+    except (OSError, ValueError) as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 1
+
+    print(f"{manifest['records']} records in {args.output} ({len(manifest['inputs'])} inputs), "
+          f"built in {manifest['build_seconds']} s")
+    for field, kept in manifest["ngrams"].items():
+        print(f"  {field}.ngram: " + ", ".join(f"{n} {name}" for name, n in kept.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,177 @@
+"""
+Near-duplicate detection for the AI Suggestion Service
+MinHash signatures of item titles and descriptions, bucketed with
+locality-sensitive hashing so a check costs the same however many items exist
+"""
+
+import re
+import zlib
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows: pairs above a Jaccard similarity of about 0.5 share a bucket
+BANDS = 16
+ROWS = NUM_PERMUTATIONS // BANDS
+
+# Only the newest items of a bucket are kept as candidates, which bounds the cost of a check
+MAX_BUCKET = 32
+
+SHINGLE_SIZE = 3
+MAX_DESCRIPTION_WORDS = 100
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_random = np.random.default_rng(20240517)
+# Coefficients below 2**32 keep a * x + b within 64 bits for 32-bit x
+_A = _random.integers(1, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _random.integers(0, 1 << 32, NUM_PERMUTATIONS, dtype=np.uint64)
+_BAND_MULTIPLIERS = _random.integers(1, 1 << 63, ROWS, dtype=np.uint64) | np.uint64(1)
+_EMPTY = np.full(NUM_PERMUTATIONS, 0xFFFFFFFF, dtype=np.uint32)
+
+# Letters and digits of any script, so "Zürich" stays one word
+WORD_PATTERN = re.compile(r"[^\W_]+")
+
+
+def title_shingles(title: str) -> set:
+    """Character shingles of the normalised title, robust to typos and reordered punctuation"""
+    text = " ".join(WORD_PATTERN.findall(title.lower()))
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def description_shingles(description: str) -> set:
+    """Word pairs of the start of the description"""
+    words = WORD_PATTERN.findall(description.lower())[:MAX_DESCRIPTION_WORDS]
+    if len(words) < 2:
+        return set(words)
+    return {f"{first} {second}" for first, second in zip(words, words[1:])}
+
+
+def signature(shingles: set) -> np.ndarray:
+    """MinHash signature: the minimum of each permuted shingle hash"""
+    if not shingles:
+        return _EMPTY
+    hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64, count=len(shingles))
+    permuted = (np.outer(hashes, _A) + _B) % _MERSENNE_PRIME
+    return (permuted & np.uint64(0xFFFFFFFF)).astype(np.uint32).min(axis=0)
+
+
+def band_keys(title_signature: np.ndarray) -> List[int]:
+    bands = title_signature.reshape(BANDS, ROWS).astype(np.uint64)
+    return [int(key) for key in (bands * _BAND_MULTIPLIERS).sum(axis=1)]
+
+
+class DuplicateIndex:
+    """MinHash-LSH index over one organisation's open items of one kind
+
+    Title and description signatures are rows of two uint32 matrices,
+    indexed by slot. The matrices grow by doubling, and the slots of
+    removed items are reused. Each band of the title signature hashes to a
+    bucket of slots. A check looks up one bucket per band and compares the
+    signatures of at most BANDS * MAX_BUCKET candidates at once.
+    """
+
+    def __init__(self):
+        self._titles = np.empty((0, NUM_PERMUTATIONS), dtype=np.uint32)
+        self._descriptions = np.empty((0, NUM_PERMUTATIONS), dtype=np.uint32)
+        self._has_description = bytearray()
+        self._ids = array("q")
+        self._free: List[int] = []
+        self._slots: Dict[int, int] = {}
+        self._buckets: List[Dict[int, List[int]]] = [{} for _ in range(BANDS)]
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _allocate(self) -> int:
+        if self._free:
+            return self._free.pop()
+        slot = len(self._ids)
+        if slot == len(self._titles):
+            capacity = max(16, 2 * slot)
+            for name in ("_titles", "_descriptions"):
+                grown = np.empty((capacity, NUM_PERMUTATIONS), dtype=np.uint32)
+                grown[:slot] = getattr(self, name)
+                setattr(self, name, grown)
+        self._ids.append(-1)
+        self._has_description.append(0)
+        return slot
+
+    def add(self, item_id: int, title: str, description: str = "") -> None:
+        """Index an item, replacing any earlier version of it
+
+        A title without letters or digits, such as "!!!", has no shingles to
+        compare, so its item is left out rather than matching every other one.
+        """
+        self.remove(item_id)
+        title_signature = signature(title_shingles(title))
+        if title_signature is _EMPTY:
+            return
+        slot = self._allocate()
+        self._titles[slot] = title_signature
+        shingles = description_shingles(description)
+        self._descriptions[slot] = signature(shingles)
+        self._has_description[slot] = 1 if shingles else 0
+        self._ids[slot] = item_id
+        self._slots[item_id] = slot
+        for buckets, key in zip(self._buckets, band_keys(self._titles[slot])):
+            bucket = buckets.setdefault(key, [])
+            bucket.append(slot)
+            if len(bucket) > MAX_BUCKET:
+                del bucket[0]
+
+    def remove(self, item_id: int) -> bool:
+        slot = self._slots.pop(item_id, None)
+        if slot is None:
+            return False
+        for buckets, key in zip(self._buckets, band_keys(self._titles[slot])):
+            bucket = buckets.get(key)
+            if bucket is not None and slot in bucket:
+                bucket.remove(slot)
+                if not bucket:
+                    del buckets[key]
+        self._ids[slot] = -1
+        self._free.append(slot)
+        return True
+
+    def check(self, title: str, description: Optional[str], k: int, threshold: float,
+              exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Up to k (item id, estimated similarity) pairs at or above threshold, most similar first
+
+        Similarity is the Jaccard estimate of the titles, averaged with that of
+        the descriptions when both the check and the item have one.
+        """
+        query = signature(title_shingles(title))
+        if query is _EMPTY:
+            return []
+        candidates = set()
+        for buckets, key in zip(self._buckets, band_keys(query)):
+            candidates.update(buckets.get(key, ()))
+        if exclude is not None:
+            candidates.discard(self._slots.get(exclude))
+        if not candidates:
+            return []
+
+        slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+        similarity = (self._titles[slots] == query).mean(axis=1)
+        shingles = description_shingles(description or "")
+        if shingles:
+            described = np.frombuffer(self._has_description, dtype=np.bool_)[slots]
+            description_similarity = (self._descriptions[slots] == signature(shingles)).mean(axis=1)
+            similarity = np.where(described, (similarity + description_similarity) / 2, similarity)
+
+        keep = similarity >= threshold
+        slots, similarity = slots[keep], similarity[keep]
+        order = np.lexsort((-slots, -similarity))[:k]
+        return [(self._ids[slots[i]], float(similarity[i])) for i in order]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "items": len(self._slots),
+            "slots": len(self._ids),
+            "buckets": sum(len(buckets) for buckets in self._buckets),
+            "signature_bytes": self._titles.nbytes + self._descriptions.nbytes,
+        }
@@ -0,0 +1,307 @@
+"""
+Organisation item store for the AI Suggestion Service
+Holds each organisation's tasks, meetings and departments in memory, with
+a shared on-disk change log so every worker sees every change
+"""
+
+import fcntl
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger("ai_service.items")
+
+# The log is rewritten as a snapshot once it holds this many more entries than live items
+COMPACT_FACTOR = 2
+COMPACT_MIN_ENTRIES = 10000
+
+# Header of a compacted log. The fields are fixed-width, so the header can be written before the count is known.
+SNAPSHOT_HEADER = '{"op":"snapshot","seq":%20d,"count":%20d,"end":%20d}\n'
+SNAPSHOT_HEADER_LENGTH = len(SNAPSHOT_HEADER % (0, 0, 0))
+
+
+class StoredItem(NamedTuple):
+    title: str
+    description: str
+    open: bool
+
+
+class ChangeLog:
+    """Append-only JSON-lines log of one organisation's item changes
+
+    Every worker process replays the same file, so a change written by any
+    worker reaches the others the next time they read the organisation.
+    Each entry carries a sequence number. Writers hold an exclusive lock on
+    a sibling .lock file, catch up with the log and then append whole lines.
+
+    Compaction rewrites the log as a snapshot of the live items under the
+    same lock and renames it into place. A reader that still has the old
+    file open finishes reading it. If the snapshot then holds exactly what
+    the reader has applied, it skips to the end of the snapshot instead of
+    replaying it.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.seq = 0
+        self.entries = 0
+        self._file = None
+        self._inode: Optional[int] = None
+        self._offset = 0
+
+    def replay(self, apply: Callable[[dict], None], reset: Callable[[], None]) -> None:
+        """Apply the entries written since the last replay, starting over after reset() when needed"""
+        try:
+            inode: Optional[int] = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            inode = None
+
+        if self._file is not None and inode != self._inode:
+            # Compacted or removed: finish the file this worker was reading first
+            self._consume(apply)
+            self._file.close()
+            self._file = None
+            if inode is None:
+                reset()
+                self.seq = self.entries = 0
+
+        if self._file is None and inode is not None:
+            self._file = open(self.path, "rb")
+            self._inode = os.fstat(self._file.fileno()).st_ino
+            self._offset = 0
+            header = self._snapshot_header()
+            if header is not None and header["seq"] == self.seq:
+                self._offset = header["end"]
+                self.entries = header["count"]
+            else:
+                reset()
+                self.seq = self.entries = 0
+
+        if self._file is not None:
+            self._consume(apply)
+
+    def _snapshot_header(self) -> Optional[dict]:
+        self._file.seek(0)
+        line = self._file.readline()
+        if len(line) != SNAPSHOT_HEADER_LENGTH or not line.endswith(b"\n"):
+            return None
+        try:
+            header = json.loads(line)
+        except ValueError:
+            return None
+        return header if header.get("op") == "snapshot" else None
+
+    def _consume(self, apply: Callable[[dict], None]) -> None:
+        self._file.seek(self._offset)
+        for line in self._file:
+            # A line still being written is picked up by the next replay
+            if not line.endswith(b"\n"):
+                break
+            self._offset += len(line)
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                logger.warning("Skipping malformed entry at byte %d of %s", self._offset - len(line), self.path)
+                continue
+            if entry.get("op") == "snapshot":
+                self.seq = entry["seq"]
+                continue
+            self.entries += 1
+            self.seq = entry.get("seq", self.seq)
+            apply(entry)
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive lock for writing, held across every worker"""
+        fd = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    def write(self, entries: List[dict]) -> None:
+        """Append entries after the last one replayed; hold the lock and replay first"""
+        data = "".join(
+            json.dumps({"seq": self.seq + position, **entry}, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for position, entry in enumerate(entries, 1)
+        ).encode("utf-8")
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+    def compact(self, entries: Iterable[dict]) -> None:
+        """Replace the log with a snapshot of entries, as of the last entry replayed; hold the lock"""
+        temporary = f"{self.path}.compact"
+        count = 0
+        with open(temporary, "wb") as f:
+            f.write(SNAPSHOT_HEADER_LENGTH * b" ")
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n")
+                count += 1
+            end = f.tell()
+            f.seek(0)
+            f.write((SNAPSHOT_HEADER % (self.seq, count, end)).encode("ascii"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class OrganisationItems:
+    """One organisation's items, with the indexes built over them per kind
+
+    Index factories take no arguments and return an object with
+    add(item_id, title, description) and remove(item_id). Adding an id that
+    is already present replaces it. Indexes named in open_only hold only the
+    items that are still open. Hold lock while syncing, writing or reading
+    the items and indexes.
+    """
+
+    def __init__(self, organisation_id: int, log: ChangeLog, index_factories: Dict[str, Callable[[], Any]],
+                 open_only: Collection[str] = ()):
+        self.organisation_id = organisation_id
+        self.log = log
+        self.index_factories = index_factories
+        self.open_only = open_only
+        self.items: Dict[Tuple[str, int], StoredItem] = {}
+        self.indexes: Dict[str, Dict[str, Any]] = {}
+        self.lock = threading.Lock()
+
+    def index(self, kind: str, name: str) -> Any:
+        indexes = self.indexes.get(kind)
+        if indexes is None:
+            indexes = self.indexes[kind] = {index_name: factory() for index_name, factory in self.index_factories.items()}
+        return indexes[name]
+
+    def get(self, kind: str, item_id: int) -> Optional[StoredItem]:
+        return self.items.get((kind, item_id))
+
+    def _apply(self, entry: dict) -> None:
+        kind, item_id = entry["kind"], entry["id"]
+        if entry["op"] == "put":
+            item = StoredItem(entry["title"], entry.get("description") or "", entry.get("open", True))
+            self.items[(kind, item_id)] = item
+            for name in self.index_factories:
+                if item.open or name not in self.open_only:
+                    self.index(kind, name).add(item_id, item.title, item.description)
+                else:
+                    self.index(kind, name).remove(item_id)
+        elif entry["op"] == "delete":
+            if self.items.pop((kind, item_id), None) is not None:
+                for name in self.index_factories:
+                    self.index(kind, name).remove(item_id)
+
+    def _reset(self) -> None:
+        self.items = {}
+        self.indexes = {}
+
+    def sync(self) -> None:
+        """Catch up with changes written by any worker"""
+        self.log.replay(self._apply, self._reset)
+
+    def write(self, entries: List[dict]) -> None:
+        """Log entries and apply them, compacting the log when it has grown"""
+        with self.log.locked():
+            self.sync()
+            self.log.write(entries)
+            self.sync()
+            if self.log.entries > COMPACT_FACTOR * len(self.items) + COMPACT_MIN_ENTRIES:
+                self.log.compact(self._snapshot())
+                self.sync()
+
+    def _snapshot(self) -> Iterator[dict]:
+        for (kind, item_id), item in self.items.items():
+            yield {"op": "put", "kind": kind, "id": item_id, "title": item.title, "description": item.description, "open": item.open}
+
+
+class ItemStore:
+    """Every organisation's items, loaded from its change log on first use
+
+    Reads use organisation(), which replays anything other workers have
+    logged since; that costs one stat() when nothing has changed. Every
+    method reads or writes files, so call them off the event loop.
+    Organisations are kept in least-recently-used order; past
+    max_organisations (0 for no limit) the least recently used are dropped
+    and replayed again from their log when next used.
+    """
+
+    def __init__(self, directory: str, index_factories: Dict[str, Callable[[], Any]], open_only: Collection[str] = (),
+                 max_organisations: int = 0):
+        self.directory = directory
+        self.index_factories = index_factories
+        self.open_only = open_only
+        self.max_organisations = max_organisations
+        self.evictions = 0
+        self._organisations: "OrderedDict[int, OrganisationItems]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, organisation_id: int) -> str:
+        return os.path.join(self.directory, f"organisation-{int(organisation_id)}.log")
+
+    def _resident(self, organisation_id: int) -> OrganisationItems:
+        """The organisation's items as last synced, marked most recently used"""
+        evicted = []
+        with self._lock:
+            organisation = self._organisations.get(organisation_id)
+            if organisation is None:
+                organisation = OrganisationItems(
+                    organisation_id, ChangeLog(self._path(organisation_id)), self.index_factories, self.open_only
+                )
+                self._organisations[organisation_id] = organisation
+                while self.max_organisations and len(self._organisations) > self.max_organisations:
+                    evicted.append(self._organisations.popitem(last=False)[1])
+                    self.evictions += 1
+            else:
+                self._organisations.move_to_end(organisation_id)
+        for stale in evicted:
+            # A request still using it reopens the log, and the file closes with the last reference
+            with stale.lock:
+                stale.log.close()
+        return organisation
+
+    @contextmanager
+    def organisation(self, organisation_id: int) -> Iterator[OrganisationItems]:
+        """The organisation's items, caught up with every worker and locked while in use"""
+        organisation = self._resident(organisation_id)
+        with organisation.lock:
+            organisation.sync()
+            yield organisation
+
+    def put(self, organisation_id: int, items: List[dict]) -> None:
+        """Add or replace items, each a dict with kind, id, title, description and open"""
+        os.makedirs(self.directory, exist_ok=True)
+        with self.organisation(organisation_id) as organisation:
+            organisation.write([
+                {"op": "put", "kind": item["kind"], "id": item["id"], "title": item["title"],
+                 "description": item.get("description") or "", "open": item.get("open", True)}
+                for item in items
+            ])
+
+    def delete(self, organisation_id: int, kind: str, item_id: int) -> bool:
+        """Remove an item; False if it was not stored"""
+        with self.organisation(organisation_id) as organisation:
+            if organisation.get(kind, item_id) is None:
+                return False
+            organisation.write([{"op": "delete", "kind": kind, "id": item_id}])
+            return True
+
+    def loaded(self) -> int:
+        return len(self._organisations)
+
+    def item_count(self) -> int:
+        with self._lock:
+            organisations = list(self._organisations.values())
+        return sum(len(organisation.items) for organisation in organisations)
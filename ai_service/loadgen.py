@@ -0,0 +1,310 @@
+"""
+Keystroke-trace load generator for the AI Suggestion Service
+Replays typing traces as many concurrent virtual users from one asyncio
+loop and reports throughput and latency percentiles per endpoint
+
+Requests are fired the way the frontend hooks fire them (useAI.js): a
+description suggestion 500 ms after the title stops changing, and an inline
+completion 200 ms after the description stops changing, once the text is
+at least 3 characters long.
+
+    python loadgen.py --users 1000 --duration 30                  # in process
+    python loadgen.py --url http://127.0.0.1:8001 --users 500     # running server
+    python loadgen.py --save-traces traces.jsonl --trace-count 200
+    python loadgen.py --traces traces.jsonl
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from template_store import TemplateLibrary
+from templates import placeholder_values
+
+# Debounce delays and minimum lengths used by the frontend hooks
+DEBOUNCE_MS = {"title": 500, "description": 200, "agenda": 200}
+MIN_LENGTH = 3
+
+DEFAULT_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), "packs", "default.json")
+
+SAMPLE_TITLES = {
+    "task": [
+        "Review quarterly budget report", "Prepare onboarding pack", "Update staff handbook",
+        "Fix payroll export", "Organise team training", "Complete compliance audit",
+        "Create recruitment plan", "Schedule client presentation",
+    ],
+    "meeting": [
+        "Weekly team sync", "Project kickoff", "Quarterly planning session",
+        "One-to-one catch-up", "Client review call", "Sprint retrospective",
+    ],
+}
+
+SAMPLE_CONTEXTS = {
+    "task": [None, {"priority": "high"}, {"priority": "urgent"}, {"priority": "low"}],
+    "meeting": [None, {"duration": 30}, {"duration": 60}],
+}
+
+
+def type_text(rng: random.Random, text: str, field: str, start_ms: float, keystrokes: list) -> float:
+    """Append keystrokes typing text into field; return the time after the last one
+
+    Inter-key delays are log-normal around 170 ms, with occasional pauses
+    and corrected typos.
+    """
+    now = start_ms
+    typed = ""
+    for char in text:
+        if char.isalpha() and rng.random() < 0.03:
+            now += rng.lognormvariate(math.log(170), 0.4)
+            keystrokes.append([round(now), field, typed + rng.choice("qwertyuiop")])
+            now += rng.lognormvariate(math.log(300), 0.3)
+            keystrokes.append([round(now), field, typed])
+        now += rng.lognormvariate(math.log(170), 0.5)
+        if char == " " and rng.random() < 0.08:
+            now += rng.uniform(500, 2000)
+        typed += char
+        keystrokes.append([round(now), field, typed])
+    return now
+
+
+def synthetic_traces(count: int, seed: int = 0, pack_path: str = DEFAULT_PACK) -> List[dict]:
+    """Generate form-filling traces: a title, a pause, then a description
+
+    Descriptions are rendered from the template pack, so completions fire on
+    realistic text.
+    """
+    rng = random.Random(seed)
+    library = TemplateLibrary.from_file(pack_path)
+    traces = []
+    for _ in range(count):
+        kind = rng.choice(list(SAMPLE_TITLES))
+        title = rng.choice(SAMPLE_TITLES[kind])
+        context = rng.choice(SAMPLE_CONTEXTS[kind])
+        category = rng.choice(list(library.templates[kind]))
+        template = rng.choice(library.templates[kind][category])
+        description = template.render(placeholder_values(context, subject=title.lower()))
+        description = description[:rng.randint(40, max(40, min(len(description), 200)))]
+
+        keystrokes: list = []
+        now = type_text(rng, title, "title", 0.0, keystrokes)
+        type_text(rng, description, "description", now + rng.uniform(800, 2500), keystrokes)
+        traces.append({"type": kind, "context": context, "keystrokes": keystrokes})
+    return traces
+
+
+def load_traces(path: str) -> List[dict]:
+    """Read traces from a JSON Lines file, one trace per line
+
+    Each trace is {"type", "context", "keystrokes": [[ms, field, value], ...]},
+    so traces recorded from real sessions can be replayed as well.
+    """
+    traces = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            trace = json.loads(line)
+            if not isinstance(trace.get("keystrokes"), list):
+                raise ValueError(f"{path}:{line_number}: trace has no keystrokes list")
+            traces.append(trace)
+    if not traces:
+        raise ValueError(f"{path}: no traces")
+    return traces
+
+
+def save_traces(path: str, traces: List[dict]) -> None:
+    with open(path, "w") as f:
+        for trace in traces:
+            f.write(json.dumps(trace, separators=(",", ":")) + "\n")
+
+
+def debounced_calls(trace: dict) -> List[Tuple[float, float, str, dict]]:
+    """(fire ms, ms until the field next changes, path, body) for each request the trace triggers"""
+    kind = trace.get("type", "general")
+    keystrokes = sorted(trace["keystrokes"], key=lambda event: event[0])
+
+    calls = []
+    next_changes: Dict[str, float] = {}
+    for at, field, value in reversed(keystrokes):
+        next_change = next_changes.get(field)
+        next_changes[field] = at
+        debounce = DEBOUNCE_MS.get(field)
+        if debounce is None or len(value) < MIN_LENGTH:
+            continue
+        if next_change is not None and next_change - at < debounce:
+            continue
+
+        fire = at + debounce
+        until_change = math.inf if next_change is None else next_change - fire
+        if field == "title":
+            body = {"title": value, "type": kind, "context": trace.get("context"), "regenerate": False}
+            calls.append((fire, until_change, "/api/suggest/description", body))
+        else:
+            body = {"text": value, "field_type": field, "context_type": kind}
+            calls.append((fire, until_change, "/api/suggest/completion", body))
+    calls.reverse()
+    return calls
+
+
+class Recorder:
+    """Per-endpoint latencies, errors and late responses"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.late: Dict[str, int] = {}
+
+    def record(self, path: str, latency_ms: float, ok: bool, late: bool) -> None:
+        if ok:
+            self.latencies.setdefault(path, []).append(latency_ms)
+        else:
+            self.errors[path] = self.errors.get(path, 0) + 1
+        if late:
+            self.late[path] = self.late.get(path, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, dict]:
+        report = {}
+        for path in sorted(set(self.latencies) | set(self.errors)):
+            samples = sorted(self.latencies.get(path, []))
+            completed = len(samples)
+            report[path] = {
+                "requests": completed + self.errors.get(path, 0),
+                "errors": self.errors.get(path, 0),
+                "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": percentile(samples, 50),
+                "p95_ms": percentile(samples, 95),
+                "p99_ms": percentile(samples, 99),
+                "max_ms": round(samples[-1], 2) if samples else None,
+                "late": self.late.get(path, 0),
+            }
+        return report
+
+
+def percentile(samples: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted samples"""
+    if not samples:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(samples)))
+    return round(samples[rank - 1], 2)
+
+
+async def send(client: httpx.AsyncClient, recorder: Recorder, path: str, body: dict, until_change: float) -> None:
+    start = time.perf_counter()
+    try:
+        response = await client.post(path, json=body)
+        await response.aread()
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        ok = False
+    latency = (time.perf_counter() - start) * 1000
+    # A response is late when the user has typed again before it arrived
+    recorder.record(path, latency, ok, late=latency > until_change)
+
+
+async def virtual_user(client: httpx.AsyncClient, recorder: Recorder, traces: List[list], user: int,
+                       start_delay: float, deadline: float, rng: random.Random) -> None:
+    await asyncio.sleep(start_delay)
+    in_flight = set()
+    position = user % len(traces)
+    while time.monotonic() < deadline:
+        began = time.monotonic()
+        for fire, until_change, path, body in traces[position]:
+            fire_at = began + fire / 1000
+            if fire_at >= deadline:
+                break
+            wait = fire_at - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            task = asyncio.create_task(send(client, recorder, path, body, until_change))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        position = (position + 1) % len(traces)
+        # Time spent submitting the form before starting the next one
+        await asyncio.sleep(max(0.0, min(rng.uniform(1.0, 3.0), deadline - time.monotonic())))
+    if in_flight:
+        await asyncio.gather(*in_flight)
+
+
+async def run_load(traces: List[dict], users: int, duration: float, ramp: float,
+                   url: Optional[str], seed: int) -> Tuple[Dict[str, dict], float]:
+    calls = [debounced_calls(trace) for trace in traces]
+    calls = [trace_calls for trace_calls in calls if trace_calls]
+    if not calls:
+        raise ValueError("The traces do not trigger any requests")
+
+    if url:
+        limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+        client = httpx.AsyncClient(base_url=url, limits=limits, timeout=30.0)
+    else:
+        import main
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://loadgen", timeout=30.0)
+
+    rng = random.Random(seed)
+    recorder = Recorder()
+    started = time.monotonic()
+    deadline = started + ramp + duration
+    async with client:
+        await asyncio.gather(*(
+            virtual_user(client, recorder, calls, user, rng.uniform(0, ramp), deadline, random.Random(rng.random()))
+            for user in range(users)
+        ))
+    elapsed = time.monotonic() - started
+    return recorder.report(elapsed), elapsed
+
+
+def print_report(report: Dict[str, dict], elapsed: float, users: int) -> None:
+    print(f"\n{users} virtual users, {elapsed:.1f} s")
+    print(f"{'endpoint':<28} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9} {'late':>7}")
+    for path, row in report.items():
+        cells = [row[key] if row[key] is not None else "-" for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")]
+        late = f"{row['late'] / row['requests']:.1%}" if row["requests"] else "-"
+        print(f"{path:<28} {row['requests']:>9} {row['errors']:>7} {row['throughput_rps']:>9} "
+              f"{cells[0]:>9} {cells[1]:>9} {cells[2]:>9} {cells[3]:>9} {late:>7}")
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay keystroke traces against the AI Suggestion Service")
+    parser.add_argument("--url", help="base URL of a running service (default: run the app in process)")
+    parser.add_argument("--users", type=int, default=100, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds to run after the ramp-up")
+    parser.add_argument("--ramp", type=float, default=5.0, help="seconds over which users start")
+    parser.add_argument("--traces", metavar="PATH", help="JSON Lines trace file to replay")
+    parser.add_argument("--trace-count", type=int, default=100, help="synthetic traces to generate")
+    parser.add_argument("--save-traces", metavar="PATH", help="write the synthetic traces to a file and exit")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-delay", action="store_true", help="in process only: skip the artificial response delays")
+    parser.add_argument("--json", metavar="PATH", help="also write the report as JSON")
+    args = parser.parse_args(argv)
+
+    traces = load_traces(args.traces) if args.traces else synthetic_traces(args.trace_count, args.seed)
+    if args.save_traces:
+        save_traces(args.save_traces, traces)
+        print(f"Wrote {len(traces)} traces to {args.save_traces}")
+        return 0
+
+    load = run_load(traces, args.users, args.duration, args.ramp, args.url, args.seed)
+    if args.no_delay and not args.url:
+        from bench import without_response_delays
+        with without_response_delays():
+            report, elapsed = asyncio.run(load)
+    else:
+        report, elapsed = asyncio.run(load)
+
+    print_report(report, elapsed, args.users)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"users": args.users, "elapsed_s": round(elapsed, 2), "endpoints": report}, f, indent=2)
+            f.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
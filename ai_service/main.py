@@ -4,21 +4,59 @@ FastAPI-based LLM service for intelligent text suggestions
 Uses UK English as the primary language
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Callable, Iterable, Iterator, Optional, List, Tuple, Union
 import asyncio
 import re
 import random
 import hashlib
-import time
+import json
+import os
+import secrets
+import signal
+import threading
+from contextlib import asynccontextmanager
 from enum import Enum
+from itertools import islice
+
+from cache import TTLCache
+from coalesce import SingleFlight
+from duplicates import DuplicateIndex
+from item_store import ItemStore
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry, RequestMetricsMiddleware, suppressed as metrics_suppressed
+from profiler import ProfilerMiddleware, ProfilerUnavailable, ProfileSession, SamplingProfiler
+from serialisation import FastJSONResponse
+from similarity import SimilarityIndex
+from template_store import TemplateLibrary, TemplateStore
+from templates import CompiledTemplate, extract_subject, placeholder_values
+from tenants import TenantLibraries
+from text_index import CompletionCursor
+from timing import ServerTimingMiddleware, SlowRequestLog, describe_input, mark_stage
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up before serving, and watch the template pack while running"""
+    warm_up()
+    TEMPLATE_STORE.start()
+    report_drain_on_exit_signals()
+    READY.set()
+    try:
+        yield
+    finally:
+        READY.clear()
+        TEMPLATE_STORE.stop()
+        TENANT_LIBRARIES.stop()
+
 
 app = FastAPI(
     title="Staff Management AI Assistant",
     description="AI-powered suggestion service for tasks, meetings, and departments",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for React frontend
@@ -31,6 +69,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Metrics exposed at /metrics
+METRICS = Registry()
+HTTP_REQUESTS = METRICS.counter(
+    "ai_http_requests_total", "HTTP requests by method, route and status", ("method", "route", "status")
+)
+HTTP_REQUEST_DURATION = METRICS.histogram(
+    "ai_http_request_duration_seconds", "HTTP request duration until the last byte is sent", ("method", "route")
+)
+COMPLETION_STRATEGIES = METRICS.counter(
+    "ai_inline_completion_strategy_total", "Inline completions by the strategy that produced the answer", ("strategy",)
+)
+TEMPLATE_CATEGORIES = METRICS.counter(
+    "ai_template_category_total", "Template categories chosen by the keyword classifiers; \"default\" is the fallback", ("classifier", "category")
+)
+app.add_middleware(RequestMetricsMiddleware, requests=HTTP_REQUESTS, durations=HTTP_REQUEST_DURATION)
+
+# Slowest requests with their stage timings, exposed at /debug/slow-requests to AI_ADMIN_TOKEN holders
+SLOW_REQUESTS = SlowRequestLog(capacity=int(os.getenv("AI_SLOW_REQUEST_LOG", "50")))
+app.add_middleware(ServerTimingMiddleware, slow_log=SLOW_REQUESTS)
+
+# On-demand sampling profiler behind /debug/profile, enabled by setting AI_ADMIN_TOKEN
+ADMIN_TOKEN = os.getenv("AI_ADMIN_TOKEN", "")
+MAX_PROFILE_SECONDS = float(os.getenv("AI_PROFILE_MAX_SECONDS", "300"))
+PROFILER = SamplingProfiler()
+app.add_middleware(ProfilerMiddleware, profiler=PROFILER)
+
+# Largest number of items accepted by /api/suggest/batch
+MAX_BATCH_SIZE = int(os.getenv("AI_BATCH_MAX_ITEMS", "500"))
+
+# Response cache for non-regenerate description and alternatives requests
+RESPONSE_CACHE = TTLCache(
+    max_entries=int(os.getenv("AI_CACHE_MAX_ENTRIES", "4096")),
+    ttl=float(os.getenv("AI_CACHE_TTL", "600")),
+    max_size=int(os.getenv("AI_CACHE_MAX_BYTES", str(16 * 1024 * 1024))),
+    sizeof=lambda response: len(repr(response)),
+)
+
+# Identical non-regenerate description and alternatives requests in flight share one computation
+IN_FLIGHT_REQUESTS = SingleFlight()
+
+# Incremental completion state per (session id, field type), evicted when idle
+COMPLETION_SESSIONS = TTLCache(
+    max_entries=int(os.getenv("AI_COMPLETION_SESSIONS", "5000")),
+    ttl=float(os.getenv("AI_COMPLETION_SESSION_IDLE", "300")),
+    sliding=True,
+)
+
+# Each organisation's existing items, indexed for similar-item search and
+# (open items only) duplicate checks. Changes reach every worker through
+# per-organisation change logs in AI_ITEMS_DIR. The store reads and writes
+# files, so handlers call it from the threadpool.
+ITEM_STORE = ItemStore(
+    os.getenv("AI_ITEMS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "items")),
+    {"similar": SimilarityIndex, "duplicates": DuplicateIndex},
+    open_only=("duplicates",),
+    max_organisations=int(os.getenv("AI_ITEMS_MAX_ORGANISATIONS", "500")),
+)
+# Item endpoints return stored item text, so they need X-Items-Token; they are hidden when it is unset
+ITEMS_TOKEN = os.getenv("AI_ITEMS_TOKEN", "")
+MAX_ITEMS_PER_REQUEST = int(os.getenv("AI_ITEMS_MAX_PER_REQUEST", "1000"))
+# Default estimated similarity at which an open item is reported as a likely duplicate
+DUPLICATE_THRESHOLD = float(os.getenv("AI_DUPLICATE_THRESHOLD", "0.6"))
+
 
 class SuggestionType(str, Enum):
     TASK = "task"
@@ -45,6 +146,7 @@ class DescriptionRequest(BaseModel):
     type: SuggestionType = Field(default=SuggestionType.GENERAL)
     context: Optional[dict] = Field(default=None, description="Additional context like priority, department, etc.")
     regenerate: Optional[bool] = Field(default=False, description="Force a different suggestion")
+    organization_id: Optional[int] = Field(default=None, ge=0, description="Organisation whose own templates to use, when it has any")
 
 
 class InlineCompletionRequest(BaseModel):
@@ -53,6 +155,9 @@ class InlineCompletionRequest(BaseModel):
     field_type: str = Field(default="description", description="Type of field: title, description, agenda, etc.")
     context_type: SuggestionType = Field(default=SuggestionType.GENERAL)
     cursor_position: Optional[int] = Field(default=None)
+    session_id: Optional[str] = Field(default=None, max_length=128, description="Client session id for incremental completion across keystrokes")
+    top_k: Optional[int] = Field(default=None, ge=1, le=10, description="Also return up to this many ranked candidates")
+    organization_id: Optional[int] = Field(default=None, ge=0, description="Organisation whose own templates and models to use, when it has any")
 
 
 class DescriptionResponse(BaseModel):
@@ -69,476 +174,253 @@ class InlineCompletionResponse(BaseModel):
     confidence: float = Field(ge=0, le=1)
 
 
-# UK English templates and patterns for intelligent suggestions
-# Multiple variations for each template type to ensure variety
-
-TASK_TEMPLATES = {
-    "review": [
-        "Review and provide comprehensive feedback on {subject}. Ensure all key points are addressed and documented accordingly. Please complete this task by the specified deadline.",
-        "Conduct a thorough review of {subject}, identifying strengths, weaknesses, and areas requiring attention. Compile findings into a detailed report for stakeholder consideration.",
-        "Examine {subject} critically, ensuring compliance with established standards and best practices. Provide actionable recommendations for improvement where necessary.",
-        "Undertake a systematic review of {subject}, assessing quality, accuracy, and completeness. Highlight any discrepancies and propose corrective measures.",
-        "Perform an in-depth analysis and review of {subject}. Document observations, flag potential issues, and prepare a summary for team discussion.",
-    ],
-    "prepare": [
-        "Prepare all necessary documentation and materials for {subject}. Coordinate with relevant team members and ensure everything is organised properly.",
-        "Assemble and organise all required resources for {subject}. Verify completeness, accuracy, and adherence to organisational standards before distribution.",
-        "Develop comprehensive preparation materials for {subject}, including supporting documents, reference materials, and any prerequisite information needed.",
-        "Create a well-structured preparation pack for {subject}. Ensure all stakeholders have access to the necessary information in advance.",
-        "Compile essential materials and documentation for {subject}. Cross-reference requirements with relevant parties to ensure nothing is overlooked.",
-    ],
-    "complete": [
-        "Complete the assigned work on {subject}. Follow the established guidelines and maintain quality standards throughout the process.",
-        "Finalise all outstanding activities related to {subject}. Ensure deliverables meet the specified requirements and are ready for handover.",
-        "Bring {subject} to completion, adhering to agreed timelines and quality benchmarks. Document any challenges encountered and lessons learnt.",
-        "Execute and complete all tasks associated with {subject}. Perform quality checks before submission and obtain necessary approvals.",
-        "Deliver the finished work on {subject}, ensuring all acceptance criteria have been satisfied. Provide a completion summary for records.",
-    ],
-    "update": [
-        "Update the existing {subject} with the latest information. Verify accuracy and ensure all stakeholders are informed of the changes.",
-        "Refresh and revise {subject} to reflect current status and recent developments. Maintain version control and communicate updates appropriately.",
-        "Modify {subject} to incorporate new data, feedback, or requirements. Ensure consistency across related documents and systems.",
-        "Revise {subject} comprehensively, addressing outdated information and incorporating recent changes. Circulate the updated version to relevant parties.",
-        "Bring {subject} up to date with the latest standards and information. Track all changes made and notify affected stakeholders.",
-    ],
-    "create": [
-        "Create a new {subject} following the organisation's standards and best practices. Document all relevant details and seek approval where necessary.",
-        "Develop {subject} from scratch, ensuring alignment with project objectives and organisational guidelines. Include all required components and documentation.",
-        "Design and build {subject}, incorporating stakeholder requirements and industry best practices. Produce accompanying documentation as needed.",
-        "Establish {subject} with careful attention to detail and compliance requirements. Validate the output against specified criteria before finalisation.",
-        "Construct {subject} methodically, following approved templates and standards. Obtain feedback from key stakeholders during the development process.",
-    ],
-    "analyse": [
-        "Analyse {subject} thoroughly and prepare a detailed report. Identify key findings, trends, and actionable recommendations.",
-        "Conduct comprehensive analysis of {subject}, examining patterns, anomalies, and underlying factors. Present insights in a clear, structured format.",
-        "Investigate {subject} systematically, gathering relevant data and applying appropriate analytical methods. Summarise conclusions and next steps.",
-        "Perform detailed examination of {subject}, assessing performance metrics and identifying opportunities for improvement. Provide evidence-based recommendations.",
-        "Study {subject} in depth, evaluating strengths, weaknesses, and areas of concern. Deliver a comprehensive analysis report with supporting data.",
-    ],
-    "organise": [
-        "Organise {subject} efficiently, ensuring all components are properly arranged and accessible. Maintain clear documentation throughout.",
-        "Structure and coordinate {subject}, establishing logical workflows and clear responsibilities. Ensure effective communication channels are in place.",
-        "Arrange {subject} systematically, optimising for efficiency and ease of access. Create supporting materials to guide participants or users.",
-        "Coordinate {subject} comprehensively, addressing logistics, resources, and stakeholder engagement. Monitor progress and address issues promptly.",
-        "Set up and manage {subject}, ensuring smooth execution and proper resource allocation. Document procedures for future reference.",
-    ],
-    "coordinate": [
-        "Coordinate with team members regarding {subject}. Ensure clear communication and alignment on objectives and timelines.",
-        "Facilitate collaboration across teams on {subject}, managing dependencies and ensuring seamless integration of contributions.",
-        "Lead coordination efforts for {subject}, establishing regular check-ins and maintaining transparent communication with all parties involved.",
-        "Manage the coordination of {subject}, tracking progress, resolving conflicts, and ensuring collective alignment towards shared goals.",
-        "Oversee collaborative work on {subject}, ensuring all participants are informed, engaged, and working towards common objectives.",
-    ],
-    "implement": [
-        "Implement the planned changes for {subject}. Follow the approved approach and document any deviations or issues encountered.",
-        "Execute the implementation plan for {subject}, ensuring smooth transition and minimal disruption. Provide regular status updates to stakeholders.",
-        "Deploy {subject} according to specifications, conducting thorough testing and validation. Address any issues identified during rollout.",
-        "Carry out the implementation of {subject}, coordinating with affected teams and ensuring all prerequisites are satisfied beforehand.",
-        "Roll out {subject} systematically, following the established implementation roadmap. Monitor performance and gather feedback post-deployment.",
-    ],
-    "evaluate": [
-        "Evaluate {subject} against established criteria. Provide objective assessment and recommendations for improvement.",
-        "Assess {subject} comprehensively, measuring performance against benchmarks and identifying areas for enhancement. Document findings clearly.",
-        "Conduct thorough evaluation of {subject}, considering effectiveness, efficiency, and stakeholder satisfaction. Propose actionable improvements.",
-        "Review and assess {subject} objectively, using defined metrics and criteria. Prepare an evaluation report with supporting evidence.",
-        "Appraise {subject} systematically, identifying successes, challenges, and opportunities. Provide balanced recommendations based on findings.",
-    ],
-    "default": [
-        "Complete the task related to {subject}. Ensure all requirements are met and deliverables are of high quality. Please coordinate with relevant stakeholders as needed.",
-        "Address {subject} with attention to detail and adherence to established standards. Keep stakeholders informed of progress and any issues encountered.",
-        "Work on {subject} diligently, ensuring quality outcomes and timely delivery. Seek clarification on any ambiguous requirements and document your progress.",
-        "Execute tasks associated with {subject}, following best practices and maintaining clear communication. Deliver results that meet or exceed expectations.",
-        "Handle {subject} professionally, ensuring compliance with guidelines and standards. Provide regular updates and escalate concerns as appropriate.",
-    ]
-}
+class CompletionCandidate(BaseModel):
+    """One ranked inline completion candidate"""
+    completion: str
+    confidence: float = Field(ge=0, le=1)
+    strategy: str
 
-MEETING_TEMPLATES = {
-    "planning": [
-        "This meeting will focus on planning and strategising for {subject}. We shall review current status, discuss objectives, and establish clear action items. All participants are encouraged to come prepared with their updates.",
-        "Strategic planning session for {subject}. The agenda includes reviewing progress, identifying priorities, and defining the roadmap ahead. Please bring relevant data and proposals for discussion.",
-        "Planning meeting dedicated to {subject}. We will assess where we stand, determine key milestones, and allocate responsibilities. Active participation from all attendees is essential.",
-        "Collaborative planning discussion on {subject}. Topics include goal-setting, resource planning, and timeline establishment. Come prepared with your insights and suggestions.",
-        "This session aims to develop a comprehensive plan for {subject}. We will analyse requirements, discuss approaches, and agree on deliverables and deadlines.",
-    ],
-    "review": [
-        "A review session to assess progress on {subject}. We shall examine achievements, identify challenges, and determine necessary adjustments to our approach.",
-        "Progress review meeting for {subject}. We will evaluate completed work, discuss blockers, and refine our strategy moving forward. Please prepare status updates.",
-        "This meeting provides an opportunity to review {subject} in detail. We will celebrate successes, address concerns, and agree on corrective actions if needed.",
-        "Comprehensive review of {subject}. The session will cover performance metrics, lessons learnt, and recommendations for improvement. Data-driven insights are welcome.",
-        "Team review session focusing on {subject}. We will assess outcomes against objectives, discuss feedback, and plan subsequent steps.",
-    ],
-    "brainstorm": [
-        "An open discussion session to generate ideas and solutions for {subject}. All contributions are welcome, and we shall work collaboratively to find the best approaches.",
-        "Creative brainstorming meeting on {subject}. This is a safe space to share innovative ideas without judgement. Our goal is to explore possibilities and spark new thinking.",
-        "Ideation session dedicated to {subject}. We encourage free-flowing discussion and out-of-the-box thinking. All ideas will be captured and evaluated for feasibility.",
-        "Collaborative brainstorm for {subject}. Bring your creativity and enthusiasm as we explore solutions together. Diverse perspectives are highly valued.",
-        "This brainstorming session invites fresh thinking on {subject}. We will use structured techniques to generate, refine, and prioritise ideas for implementation.",
-    ],
-    "training": [
-        "Training session covering {subject}. Participants will gain practical knowledge and skills. Please bring any questions or specific topics you would like addressed.",
-        "Educational workshop on {subject}. This session aims to build competency through instruction and hands-on exercises. Materials will be provided.",
-        "Skill development training focusing on {subject}. Participants will learn key concepts, best practices, and practical applications. Interactive elements included.",
-        "Comprehensive training on {subject}. The session includes theoretical foundations, practical demonstrations, and Q&A. Attendance is encouraged for all relevant staff.",
-        "Learning session dedicated to {subject}. Our objective is to enhance understanding and capability in this area. Please come prepared to engage actively.",
-    ],
-    "update": [
-        "Regular update meeting regarding {subject}. Team members will share progress, raise concerns, and align on next steps.",
-        "Status update session on {subject}. This meeting provides visibility into current activities and upcoming priorities. Brief updates from each area are expected.",
-        "Team sync meeting focusing on {subject}. We will share updates, coordinate activities, and ensure everyone is aligned on key developments.",
-        "Periodic update on {subject}. The purpose is to maintain transparency, identify dependencies, and address any blockers. Please prepare concise updates.",
-        "Standing update meeting for {subject}. We will review what has been accomplished, what is in progress, and what requires attention going forward.",
-    ],
-    "kickoff": [
-        "Project kickoff meeting for {subject}. We shall establish objectives, assign responsibilities, and set expectations for the project timeline.",
-        "Launch meeting for {subject}. This session marks the formal start of the initiative. We will review scope, introduce team members, and outline the approach.",
-        "Kickoff session for {subject}. The agenda includes vision-setting, role clarification, and timeline discussion. This meeting sets the foundation for success.",
-        "Initiation meeting for {subject}. We will align on goals, discuss deliverables, and establish communication protocols for the duration of the project.",
-        "Formal kickoff for {subject}. Key topics include project charter review, stakeholder expectations, and team commitments. Full attendance is required.",
-    ],
-    "retrospective": [
-        "Retrospective meeting to reflect on {subject}. We shall discuss what went well, areas for improvement, and lessons learnt.",
-        "Team retrospective on {subject}. This is an opportunity to openly discuss experiences, celebrate achievements, and identify actionable improvements.",
-        "Reflection session for {subject}. We will review our journey, acknowledge contributions, and capture insights for future endeavours.",
-        "Post-mortem meeting on {subject}. Our aim is constructive analysis of outcomes, process evaluation, and continuous improvement. All perspectives are valued.",
-        "Retrospective discussion for {subject}. We will examine successes and challenges, fostering a culture of learning and growth within the team.",
-    ],
-    "one-on-one": [
-        "One-on-one discussion regarding {subject}. This is an opportunity to provide feedback, discuss career development, and address any concerns.",
-        "Personal meeting to discuss {subject}. Topics may include performance feedback, goal-setting, and professional development opportunities.",
-        "Individual catch-up on {subject}. This meeting provides dedicated time for open dialogue, support, and alignment on personal objectives.",
-        "One-on-one session covering {subject}. We will discuss progress, challenges, and how best to support your success and growth.",
-        "Private discussion regarding {subject}. This is a confidential space to share thoughts, receive guidance, and plan development activities.",
-    ],
-    "default": [
-        "Meeting to discuss {subject}. We shall cover key points, make decisions where necessary, and establish clear action items for follow-up.",
-        "Team meeting on {subject}. The session will address relevant topics, facilitate discussion, and ensure alignment across participants.",
-        "Discussion session regarding {subject}. We will review important matters, seek input from attendees, and determine next steps collaboratively.",
-        "Scheduled meeting for {subject}. The agenda includes topic discussion, decision-making, and action item assignment. Please come prepared to contribute.",
-        "General meeting covering {subject}. We will address outstanding items, share updates, and ensure everyone leaves with clarity on their responsibilities.",
-    ]
-}
 
-DEPARTMENT_TEMPLATES = {
-    "engineering": [
-        "The {name} team is responsible for technical development, innovation, and maintaining high-quality standards across all engineering projects. The team collaborates closely with other departments to deliver robust solutions.",
-        "The {name} department drives technical excellence, building and maintaining systems that power the organisation. Team members bring expertise in software development, architecture, and problem-solving.",
-        "{name} encompasses the technical workforce responsible for designing, developing, and deploying solutions. The team emphasises quality, innovation, and continuous improvement in all endeavours.",
-        "The {name} team delivers technical solutions aligned with business objectives. Responsibilities include system development, code quality assurance, and technological innovation.",
-        "{name} is the technical backbone of the organisation, responsible for engineering solutions that meet evolving business needs. The team values collaboration, craftsmanship, and continuous learning.",
-    ],
-    "marketing": [
-        "The {name} team drives brand awareness, customer engagement, and market growth initiatives. The team develops and executes strategic campaigns aligned with organisational objectives.",
-        "{name} is responsible for promoting the organisation's products and services, building brand equity, and generating demand. The team combines creativity with data-driven strategies.",
-        "The {name} department leads marketing strategy, content creation, and campaign execution. Team members work to enhance visibility and attract target audiences through various channels.",
-        "{name} focuses on communicating value to customers and prospects. The team manages brand identity, marketing communications, and digital presence to drive business growth.",
-        "The {name} team crafts compelling narratives and campaigns that resonate with audiences. Responsibilities include market research, campaign development, and performance analysis.",
-    ],
-    "sales": [
-        "The {name} team focuses on revenue generation, client relationships, and business development. The team works to identify opportunities and deliver value to customers.",
-        "{name} is responsible for driving sales growth and building lasting customer partnerships. Team members engage prospects, manage accounts, and close deals to meet revenue targets.",
-        "The {name} department leads commercial efforts, from lead generation to deal closure. The team combines relationship-building skills with product expertise to deliver results.",
-        "{name} drives the organisation's revenue engine through strategic selling and account management. The team is dedicated to understanding customer needs and delivering tailored solutions.",
-        "The {name} team is at the forefront of customer acquisition and retention. Responsibilities include prospecting, negotiation, and fostering long-term business relationships.",
-    ],
-    "hr": [
-        "The {name} team manages human resources, talent acquisition, employee relations, and organisational development. The team ensures a positive workplace culture and supports staff wellbeing.",
-        "{name} is dedicated to attracting, developing, and retaining top talent. The team handles recruitment, performance management, and employee engagement initiatives.",
-        "The {name} department oversees people operations, ensuring the organisation has the human capital needed to succeed. Team focus areas include hiring, training, and employee support.",
-        "{name} champions the employee experience, from onboarding to career development. The team fosters a culture of respect, inclusion, and continuous growth.",
-        "The {name} team supports organisational success through effective people management. Responsibilities include talent acquisition, policy development, and employee relations.",
-    ],
-    "finance": [
-        "The {name} team oversees financial planning, reporting, and compliance. The team ensures fiscal responsibility and provides strategic financial guidance.",
-        "{name} manages the organisation's financial health, including budgeting, accounting, and financial analysis. The team supports informed decision-making through accurate reporting.",
-        "The {name} department is responsible for financial stewardship, ensuring resources are managed effectively. Team activities include forecasting, compliance, and financial controls.",
-        "{name} provides financial leadership and oversight, supporting sustainable growth. The team handles treasury, reporting, and financial strategy.",
-        "The {name} team ensures sound financial management and transparency. Responsibilities include financial planning, audit support, and regulatory compliance.",
-    ],
-    "operations": [
-        "The {name} team manages day-to-day operational activities, process optimisation, and resource allocation. The team ensures efficient and effective business operations.",
-        "{name} is the operational backbone of the organisation, ensuring smooth execution of daily activities. The team focuses on process improvement and resource efficiency.",
-        "The {name} department oversees operational processes, logistics, and service delivery. Team members work to streamline operations and enhance productivity.",
-        "{name} ensures the organisation runs efficiently by managing operations, workflows, and resources. The team continuously seeks improvements to deliver better outcomes.",
-        "The {name} team coordinates operational activities across the organisation. Responsibilities include process management, capacity planning, and operational excellence.",
-    ],
-    "support": [
-        "The {name} team provides assistance and resolves issues for internal and external stakeholders. The team maintains high service standards and customer satisfaction.",
-        "{name} is dedicated to helping users and customers succeed by providing timely, effective support. The team handles enquiries, troubleshooting, and issue resolution.",
-        "The {name} department delivers responsive support services, ensuring positive experiences for all stakeholders. Team focus includes problem-solving and service excellence.",
-        "{name} serves as the frontline for customer and employee assistance. The team is committed to resolving issues efficiently while maintaining empathy and professionalism.",
-        "The {name} team ensures stakeholders receive the help they need promptly. Responsibilities include ticket management, knowledge sharing, and continuous service improvement.",
-    ],
-    "design": [
-        "The {name} team creates user-centred designs, visual assets, and brand materials. The team ensures consistency and excellence in all design deliverables.",
-        "{name} brings creativity and user focus to every project. The team is responsible for visual design, user experience, and brand identity across all touchpoints.",
-        "The {name} department crafts compelling designs that enhance user experiences and brand perception. Team expertise spans UI/UX design, graphics, and creative direction.",
-        "{name} transforms ideas into visually appealing and functional designs. The team collaborates across departments to deliver cohesive, impactful creative work.",
-        "The {name} team shapes the visual identity and user experience of products and communications. Responsibilities include design strategy, prototyping, and creative production.",
-    ],
-    "product": [
-        "The {name} team drives product strategy, roadmap development, and feature prioritisation. The team works cross-functionally to deliver products that meet customer needs.",
-        "{name} is responsible for defining and delivering products that create value for customers and the business. The team balances user needs with technical feasibility and business goals.",
-        "The {name} department leads product vision, planning, and execution. Team members work closely with engineering, design, and stakeholders to bring products to market.",
-        "{name} shapes the product portfolio through research, strategy, and prioritisation. The team ensures products evolve to meet changing market demands.",
-        "The {name} team owns the product lifecycle from concept to delivery. Responsibilities include market analysis, feature definition, and cross-functional coordination.",
-    ],
-    "default": [
-        "The {name} team plays a vital role in the organisation's success. The team collaborates effectively with other departments and maintains high standards of professionalism and delivery.",
-        "{name} contributes to organisational objectives through dedicated effort and teamwork. The team is committed to excellence and continuous improvement in its area of responsibility.",
-        "The {name} department supports the organisation's mission by delivering quality outcomes. Team members work collaboratively to achieve shared goals.",
-        "{name} is an integral part of the organisation, providing essential services and expertise. The team values collaboration, integrity, and results.",
-        "The {name} team is dedicated to excellence in its domain. Responsibilities include delivering quality work, supporting colleagues, and contributing to organisational success.",
-    ]
-}
+class RankedInlineCompletionResponse(InlineCompletionResponse):
+    """Inline completion with ranked candidates, returned when top_k is set"""
+    candidates: List[CompletionCandidate] = []
 
-# Sentence enhancers for more variety
-SENTENCE_ENHANCERS = [
-    "This initiative aligns with our strategic objectives and supports broader organisational goals.",
-    "Clear communication and collaboration are essential for successful delivery.",
-    "Regular progress updates will be provided to keep all stakeholders informed.",
-    "Quality assurance and attention to detail are paramount throughout this process.",
-    "Feedback and input from team members are welcome and encouraged.",
-    "Documentation should be maintained to support future reference and knowledge transfer.",
-    "Timely completion will enable subsequent activities to proceed as planned.",
-    "Please escalate any blockers or concerns promptly to ensure we stay on track.",
-    "This work contributes to our commitment to excellence and continuous improvement.",
-    "Cross-functional collaboration may be required to achieve the best outcomes.",
-]
-
-# Opening phrases for variety
-OPENING_PHRASES = [
-    "This {type} involves",
-    "The objective is to",
-    "This {type} focuses on",
-    "The purpose of this {type} is to",
-    "This {type} is designed to",
-    "The goal of this {type} is to",
-    "This {type} aims to",
-    "The scope of this {type} includes",
-]
-
-# Closing phrases for variety
-CLOSING_PHRASES = [
-    "Please ensure timely completion and maintain quality standards.",
-    "Coordinate with relevant stakeholders as needed.",
-    "Keep all parties informed of progress and any issues encountered.",
-    "Deliver results that meet or exceed expectations.",
-    "Document findings and outcomes for future reference.",
-    "Seek clarification on any ambiguous requirements.",
-    "Maintain clear communication throughout the process.",
-    "Ensure compliance with established guidelines and procedures.",
-]
-
-
-def get_random_seed():
-    """Generate a seed based on current time for randomization"""
-    return int(time.time() * 1000) % 10000
-
-
-def select_template_variation(templates: list, title: str, regenerate: bool = False) -> str:
-    """Select a template variation with randomization support"""
-    if regenerate:
-        # Use current time to ensure different selection
-        random.seed(get_random_seed())
-    else:
-        # Use title-based seed for consistency on first request
-        seed = int(hashlib.md5(title.encode()).hexdigest(), 16) % 10000
-        random.seed(seed)
-    
-    return random.choice(templates)
-
-# Inline completion patterns (UK English) - More comprehensive triggers
-INLINE_COMPLETIONS = {
-    "title": {
-        "review": " and provide feedback",
-        "prepare": " documentation for",
-        "update": " the existing records",
-        "create": " new resources for",
-        "complete": " the assigned work",
-        "schedule": " meeting with the team",
-        "organise": " the upcoming event",
-        "coordinate": " with team members",
-        "implement": " the planned changes",
-        "analyse": " and report findings",
-        "discuss": " the progress of",
-        "finalise": " the requirements",
-        "meet": "ing to discuss",
-        "call": " with stakeholders",
-        "sync": " up on progress",
-        "plan": "ning session for",
-        "train": "ing workshop",
-        "check": " the status of",
-        "fix": " the reported issue",
-        "debug": " and resolve",
-        "test": " the implementation",
-    },
-    "description": {
-        # Sentence starters
-        "this ": "task involves working on",
-        "this task": " requires careful attention to detail and",
-        "this meeting": " will cover important topics regarding",
-        "please ": "ensure all requirements are met and",
-        "please ensure": " that all stakeholders are informed",
-        "we need": " to complete this by the deadline",
-        "we should": " coordinate with the relevant teams",
-        "the goal": " is to achieve optimal results",
-        "the objective": " is to deliver high-quality outcomes",
-        "ensure ": "all stakeholders are informed of progress",
-        "ensure all": " documentation is updated accordingly",
-        "coordinate": " with the relevant department heads",
-        "review ": "all documentation and provide feedback",
-        "complete ": "all required steps before the deadline",
-        "prepare ": "the necessary materials and resources",
-        "submit ": "the final deliverables by end of day",
-        "all team": " members should be aware of this",
-        "the deadline": " for completion is",
-        "priority": " should be given to urgent items",
-        "key deliverables": " include comprehensive documentation",
-        # Common phrases
-        "in order to": " achieve our objectives",
-        "as part of": " this initiative",
-        "with regards to": " the discussed requirements",
-        "following up on": " our previous discussion",
-        "as discussed": " in the meeting",
-        "moving forward": " we shall implement",
-        "going forward": " the team will",
-        # Verb endings
-        "working on": " the assigned deliverables",
-        "focusing on": " achieving our targets",
-        "looking into": " potential solutions",
-        "responsible for": " ensuring quality and",
-        "accountable for": " delivering results",
-        # Action verbs
-        "will be": " responsible for completing",
-        "shall ": "ensure compliance with guidelines",
-        "must ": "be completed before the deadline",
-        "should ": "coordinate with relevant parties",
-        "need to": " address this as a priority",
-        "required to": " submit documentation",
-    },
-    "agenda": {
-        "welcome": " and introductions",
-        "review": " of previous action items",
-        "discuss": " key topics and updates",
-        "present": " findings and recommendations",
-        "q&a": " session and open discussion",
-        "next": " steps and action items",
-        "closing": " remarks and adjournment",
-        "brainstorm": " ideas and solutions",
-        "decision": " making on key matters",
-        "updates": " from team members",
-        "progress": " review and status",
-        "action": " items from last meeting",
-        "open": " discussion and questions",
-        "aob": " - any other business",
-        "summary": " and key takeaways",
-    }
+
+class BatchDescriptionRequest(BaseModel):
+    """Request model for bulk description suggestions
+
+    Items are validated individually so one bad item does not reject the batch.
+    """
+    items: List[Any] = Field(..., min_length=1)
+
+
+class BatchItemResult(BaseModel):
+    """Result for one item of a batch, in input order"""
+    index: int
+    result: Optional[DescriptionResponse] = None
+    error: Optional[str] = None
+
+
+class BatchDescriptionResponse(BaseModel):
+    """Response model for bulk description suggestions"""
+    results: List[BatchItemResult]
+
+
+class ItemKind(str, Enum):
+    TASK = "task"
+    MEETING = "meeting"
+    DEPARTMENT = "department"
+
+
+class Item(BaseModel):
+    """An existing task, meeting or department"""
+    kind: ItemKind
+    id: int = Field(..., ge=0)
+    title: str = Field(..., min_length=1, max_length=500)
+    description: Optional[str] = Field(default=None, max_length=20000)
+    open: bool = Field(default=True, description="False once the item is completed, cancelled or past")
+
+
+class ItemsRequest(BaseModel):
+    """Request model for adding or replacing an organisation's items"""
+    organization_id: int = Field(..., ge=0)
+    items: List[Item] = Field(..., min_length=1)
+
+
+class SimilarItemsRequest(BaseModel):
+    """Request model for similar existing items"""
+    organization_id: int = Field(..., ge=0)
+    title: str = Field(..., min_length=1, max_length=500)
+    type: ItemKind = Field(default=ItemKind.TASK)
+    top_k: int = Field(default=5, ge=1, le=20)
+    exclude_id: Optional[int] = Field(default=None, description="Leave out this item, such as the one being edited")
+
+
+class SimilarItem(BaseModel):
+    """One similar existing item"""
+    id: int
+    title: str
+    description: str
+    score: float
+
+
+class SimilarItemsResponse(BaseModel):
+    """Response model for similar existing items, most similar first"""
+    items: List[SimilarItem]
+
+
+class DuplicateCheckRequest(BaseModel):
+    """Request model for duplicate checks"""
+    organization_id: int = Field(..., ge=0)
+    title: str = Field(..., min_length=1, max_length=500)
+    description: Optional[str] = Field(default=None, max_length=20000)
+    type: ItemKind = Field(default=ItemKind.TASK)
+    exclude_id: Optional[int] = Field(default=None, description="Leave out this item, such as the one being edited")
+    top_k: int = Field(default=5, ge=1, le=20)
+    threshold: Optional[float] = Field(default=None, ge=0, le=1, description="Lowest estimated similarity to report")
+
+
+class DuplicateItem(BaseModel):
+    """One likely duplicate"""
+    id: int
+    title: str
+    similarity: float = Field(ge=0, le=1)
+
+
+class DuplicateCheckResponse(BaseModel):
+    """Response model for duplicate checks, most similar first"""
+    duplicates: List[DuplicateItem]
+
+
+class CategoryRequest(BaseModel):
+    """Request model for template category detection"""
+    title: str = Field(..., min_length=1, max_length=500)
+    type: ItemKind
+    organization_id: Optional[int] = Field(default=None, ge=0, description="Organisation whose own keywords to use, when it has any")
+
+
+class CategoryScore(BaseModel):
+    """One matching category with its summed keyword weight"""
+    category: str
+    weight: float
+
+
+class CategoryResponse(BaseModel):
+    """Response model for category detection"""
+    category: str
+    scores: List[CategoryScore]
+
+
+# UK English templates, keyword vocabularies and inline completion triggers
+# live in a versioned template pack (packs/default.json) that is validated,
+# compiled and hot-reloaded by TEMPLATE_STORE
+TEMPLATE_STORE = TemplateStore(
+    os.getenv("AI_TEMPLATE_PACK", os.path.join(os.path.dirname(os.path.abspath(__file__)), "packs", "default.json")),
+    poll_interval=float(os.getenv("AI_TEMPLATE_RELOAD_INTERVAL", "5")),
+)
+TEMPLATE_STORE.load()
+
+
+def drop_stale_state(library: TemplateLibrary) -> None:
+    """Forget cached responses and completion sessions built from an older pack"""
+    RESPONSE_CACHE.clear()
+    COMPLETION_SESSIONS.clear()
+
+
+TEMPLATE_STORE.on_swap(drop_stale_state)
+
+# Organisations with their own template pack, <organisation id>.json in
+# AI_TENANT_PACKS_DIR, get it instead of the default pack. Partitions are
+# loaded on first use and the least recently used are evicted beyond
+# AI_TENANT_MEMORY_BUDGET bytes.
+TENANT_LIBRARIES = TenantLibraries(
+    os.getenv("AI_TENANT_PACKS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "packs", "organisations")),
+    default=lambda: TEMPLATE_STORE.current,
+    budget=int(os.getenv("AI_TENANT_MEMORY_BUDGET", str(256 * 1024 * 1024))),
+    poll_interval=float(os.getenv("AI_TEMPLATE_RELOAD_INTERVAL", "5")),
+)
+TENANT_PARTITION_LOADS = METRICS.histogram(
+    "ai_tenant_partition_load_seconds", "Time to load an organisation's template pack and models, by outcome", ("outcome",)
+)
+TENANT_LIBRARIES.on_load(lambda outcome, seconds: TENANT_PARTITION_LOADS.observe(seconds, outcome))
+
+
+def tenant_library(organization_id: Optional[int]) -> TemplateLibrary:
+    """Template library for a request's organisation"""
+    library = TENANT_LIBRARIES.library(organization_id)
+    mark_stage("partition")
+    return library
+
+
+# Media types of the streaming suggestion endpoints
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
 }
 
+# Number of alternatives offered alongside a description suggestion
+DESCRIPTION_ALTERNATIVES = 3
 
-def extract_subject(title: str) -> str:
-    """Extract the main subject from a title"""
-    # Remove common action words to get the subject
-    action_words = [
-        "review", "prepare", "complete", "update", "create", "analyse", "analyze",
-        "organise", "organize", "coordinate", "implement", "evaluate", "schedule",
-        "plan", "discuss", "finalise", "finalize", "check", "verify", "confirm"
-    ]
-    
-    words = title.lower().split()
-    subject_words = [w for w in words if w not in action_words and len(w) > 2]
-    
-    if subject_words:
-        return " ".join(subject_words)
-    return title
 
+def request_rng(kind: str, title: str, context: Optional[dict] = None, regenerate: bool = False) -> random.Random:
+    """Create a request-scoped random generator from a stable request key
 
-def detect_template_key(title: str) -> str:
+    The same (kind, title, context) always yields the same sequence, so
+    identical requests produce identical suggestions and alternatives.
+    Regenerate requests mix in a fresh nonce to get a different result.
+    """
+    nonce = secrets.token_hex(8) if regenerate else ""
+    key = json.dumps([kind, title, context or {}, nonce], sort_keys=True, default=str)
+    seed = int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "big")
+    return random.Random(seed)
+
+
+def select_template_variation(templates: List[CompiledTemplate], rng: random.Random) -> CompiledTemplate:
+    """Select a template variation using the request's generator"""
+    return rng.choice(templates)
+
+
+def detect_template_key(title: str, library: Optional[TemplateLibrary] = None) -> str:
     """Detect which template to use based on title keywords"""
-    title_lower = title.lower()
-    
-    keywords_map = {
-        "review": ["review", "assess", "evaluate", "check", "audit"],
-        "prepare": ["prepare", "ready", "setup", "set up", "arrange"],
-        "complete": ["complete", "finish", "finalise", "finalize", "conclude"],
-        "update": ["update", "modify", "change", "revise", "edit"],
-        "create": ["create", "build", "develop", "design", "make", "new"],
-        "analyse": ["analyse", "analyze", "study", "examine", "investigate"],
-        "organise": ["organise", "organize", "arrange", "coordinate", "plan"],
-        "coordinate": ["coordinate", "sync", "align", "collaborate", "liaise"],
-        "implement": ["implement", "deploy", "execute", "launch", "roll out"],
-        "evaluate": ["evaluate", "assess", "measure", "gauge", "appraise"],
-    }
-    
-    for key, keywords in keywords_map.items():
-        for keyword in keywords:
-            if keyword in title_lower:
-                return key
-    
-    return "default"
+    category = (library or TEMPLATE_STORE.current).classifiers["task"].classify(title)
+    TEMPLATE_CATEGORIES.inc("task", category)
+    return category
 
 
-def detect_meeting_type(title: str) -> str:
+def detect_meeting_type(title: str, library: Optional[TemplateLibrary] = None) -> str:
     """Detect meeting type from title"""
-    title_lower = title.lower()
-    
-    meeting_types = {
-        "planning": ["planning", "strategy", "roadmap", "sprint"],
-        "review": ["review", "progress", "status", "check-in"],
-        "brainstorm": ["brainstorm", "ideation", "creative", "workshop"],
-        "training": ["training", "learning", "workshop", "onboarding"],
-        "update": ["update", "sync", "standup", "stand-up", "daily"],
-        "kickoff": ["kickoff", "kick-off", "launch", "initiation"],
-        "retrospective": ["retrospective", "retro", "post-mortem", "lessons"],
-        "one-on-one": ["one-on-one", "1:1", "1-1", "catch-up", "catch up"],
-    }
-    
-    for mtype, keywords in meeting_types.items():
-        for keyword in keywords:
-            if keyword in title_lower:
-                return mtype
-    
-    return "default"
+    category = (library or TEMPLATE_STORE.current).classifiers["meeting"].classify(title)
+    TEMPLATE_CATEGORIES.inc("meeting", category)
+    return category
 
 
-def detect_department_type(name: str) -> str:
+def detect_department_type(name: str, library: Optional[TemplateLibrary] = None) -> str:
     """Detect department type from name"""
-    name_lower = name.lower()
-    
-    dept_types = {
-        "engineering": ["engineering", "development", "tech", "software", "it"],
-        "marketing": ["marketing", "brand", "communications", "pr"],
-        "sales": ["sales", "business development", "revenue", "commercial"],
-        "hr": ["hr", "human resources", "people", "talent", "recruitment"],
-        "finance": ["finance", "accounting", "treasury", "fiscal"],
-        "operations": ["operations", "ops", "logistics", "supply chain"],
-        "support": ["support", "customer service", "helpdesk", "service"],
-        "design": ["design", "ux", "ui", "creative", "graphics"],
-        "product": ["product", "pm", "product management"],
-    }
-    
-    for dtype, keywords in dept_types.items():
-        for keyword in keywords:
-            if keyword in name_lower:
-                return dtype
-    
-    return "default"
+    category = (library or TEMPLATE_STORE.current).classifiers["department"].classify(name)
+    TEMPLATE_CATEGORIES.inc("department", category)
+    return category
 
 
-def generate_task_description(title: str, context: Optional[dict] = None, regenerate: bool = False) -> DescriptionResponse:
-    """Generate task description suggestion with variety"""
-    template_key = detect_template_key(title)
+def collect_description(events: Iterable[Tuple[str, Any]]) -> DescriptionResponse:
+    """Assemble a DescriptionResponse from description events"""
+    suggestion = ""
+    alternatives = []
+    confidence = 0.0
+    for event, value in events:
+        if event == "suggestion":
+            suggestion = value
+        elif event == "alternative":
+            alternatives.append(value)
+        elif event == "confidence":
+            confidence = value
+
+    return DescriptionResponse(
+        suggestion=suggestion,
+        alternatives=alternatives,
+        confidence=confidence
+    )
+
+
+def iter_task_description(title: str, context: Optional[dict] = None, regenerate: bool = False, rng: Optional[random.Random] = None, library: Optional[TemplateLibrary] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield task description events: the suggestion, each alternative, then the confidence"""
+    if rng is None:
+        rng = request_rng("task", title, context, regenerate)
+    library = library or TEMPLATE_STORE.current
+
+    template_key = detect_template_key(title, library)
+    mark_stage("classify")
     subject = extract_subject(title)
-    templates = TASK_TEMPLATES.get(template_key, TASK_TEMPLATES["default"])
+    mark_stage("subject")
+    values = placeholder_values(context, subject=subject)
+    templates = library.templates["task"].get(template_key, library.templates["task"]["default"])
     
     # Select a template variation
-    template = select_template_variation(templates, title, regenerate)
-    suggestion = template.format(subject=subject)
+    template = select_template_variation(templates, rng)
+    suggestion = template.render(values)
     
     # Optionally add an enhancer for regeneration requests
     if regenerate:
-        random.seed(get_random_seed())
-        enhancer = random.choice(SENTENCE_ENHANCERS)
+        enhancer = rng.choice(library.sentence_enhancers)
         suggestion = f"{suggestion} {enhancer}"
     
     # Add priority context if available
@@ -549,44 +431,45 @@ def generate_task_description(title: str, context: Optional[dict] = None, regene
         elif priority == "high":
             suggestion = f"{suggestion} This task has been marked as high priority."
     
+    mark_stage("template")
+    yield "suggestion", suggestion
+
     # Generate alternatives from different template variations
-    alternatives = []
-    all_templates = []
-    for key, tmpls in TASK_TEMPLATES.items():
-        if key != "default":
-            all_templates.extend([(key, t) for t in tmpls])
-    
-    random.seed(get_random_seed())
-    random.shuffle(all_templates)
-    
-    for key, tmpl in all_templates:
-        alt = tmpl.format(subject=subject)
-        if alt != suggestion and alt not in alternatives:
-            alternatives.append(alt)
-            if len(alternatives) >= 3:
-                break
-    
-    return DescriptionResponse(
-        suggestion=suggestion,
-        alternatives=alternatives,
-        confidence=0.85 if template_key != "default" else 0.7
+    sampled = library.alternative_pools["task"].iter_sample(
+        rng, lambda tmpl: tmpl.render(values), exclude=(suggestion,)
     )
+    for _, alt in islice(sampled, DESCRIPTION_ALTERNATIVES):
+        yield "alternative", alt
+    mark_stage("alternatives")
 
+    yield "confidence", 0.85 if template_key != "default" else 0.7
 
-def generate_meeting_description(title: str, context: Optional[dict] = None, regenerate: bool = False) -> DescriptionResponse:
-    """Generate meeting description/agenda suggestion with variety"""
-    meeting_type = detect_meeting_type(title)
+
+def generate_task_description(title: str, context: Optional[dict] = None, regenerate: bool = False, rng: Optional[random.Random] = None, library: Optional[TemplateLibrary] = None) -> DescriptionResponse:
+    """Generate task description suggestion with variety"""
+    return collect_description(iter_task_description(title, context, regenerate, rng, library))
+
+
+def iter_meeting_description(title: str, context: Optional[dict] = None, regenerate: bool = False, rng: Optional[random.Random] = None, library: Optional[TemplateLibrary] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield meeting description/agenda events: the suggestion, each alternative, then the confidence"""
+    if rng is None:
+        rng = request_rng("meeting", title, context, regenerate)
+    library = library or TEMPLATE_STORE.current
+
+    meeting_type = detect_meeting_type(title, library)
+    mark_stage("classify")
     subject = extract_subject(title)
-    templates = MEETING_TEMPLATES.get(meeting_type, MEETING_TEMPLATES["default"])
+    mark_stage("subject")
+    values = placeholder_values(context, subject=subject)
+    templates = library.templates["meeting"].get(meeting_type, library.templates["meeting"]["default"])
     
     # Select a template variation
-    template = select_template_variation(templates, title, regenerate)
-    suggestion = template.format(subject=subject)
+    template = select_template_variation(templates, rng)
+    suggestion = template.render(values)
     
     # Optionally add an enhancer for regeneration requests
     if regenerate:
-        random.seed(get_random_seed())
-        enhancer = random.choice(SENTENCE_ENHANCERS)
+        enhancer = rng.choice(library.sentence_enhancers)
         suggestion = f"{suggestion} {enhancer}"
     
     # Add duration context if available
@@ -594,147 +477,148 @@ def generate_meeting_description(title: str, context: Optional[dict] = None, reg
         duration = context["duration"]
         suggestion += f" The meeting is scheduled for {duration} minutes."
     
+    mark_stage("template")
+    yield "suggestion", suggestion
+
     # Generate alternatives from different template variations
-    alternatives = []
-    all_templates = []
-    for key, tmpls in MEETING_TEMPLATES.items():
-        if key != "default":
-            all_templates.extend([(key, t) for t in tmpls])
-    
-    random.seed(get_random_seed())
-    random.shuffle(all_templates)
-    
-    for key, tmpl in all_templates:
-        alt = tmpl.format(subject=subject)
-        if alt != suggestion and alt not in alternatives:
-            alternatives.append(alt)
-            if len(alternatives) >= 3:
-                break
-    
-    return DescriptionResponse(
-        suggestion=suggestion,
-        alternatives=alternatives,
-        confidence=0.85 if meeting_type != "default" else 0.7
+    sampled = library.alternative_pools["meeting"].iter_sample(
+        rng, lambda tmpl: tmpl.render(values), exclude=(suggestion,)
     )
+    for _, alt in islice(sampled, DESCRIPTION_ALTERNATIVES):
+        yield "alternative", alt
+    mark_stage("alternatives")
 
+    yield "confidence", 0.85 if meeting_type != "default" else 0.7
 
-def generate_department_description(name: str, context: Optional[dict] = None, regenerate: bool = False) -> DescriptionResponse:
-    """Generate department description suggestion with variety"""
-    dept_type = detect_department_type(name)
-    templates = DEPARTMENT_TEMPLATES.get(dept_type, DEPARTMENT_TEMPLATES["default"])
+
+def generate_meeting_description(title: str, context: Optional[dict] = None, regenerate: bool = False, rng: Optional[random.Random] = None, library: Optional[TemplateLibrary] = None) -> DescriptionResponse:
+    """Generate meeting description/agenda suggestion with variety"""
+    return collect_description(iter_meeting_description(title, context, regenerate, rng, library))
+
+
+def iter_department_description(name: str, context: Optional[dict] = None, regenerate: bool = False, rng: Optional[random.Random] = None, library: Optional[TemplateLibrary] = None) -> Iterator[Tuple[str, Any]]:
+    """Yield department description events: the suggestion, each alternative, then the confidence"""
+    if rng is None:
+        rng = request_rng("department", name, context, regenerate)
+    library = library or TEMPLATE_STORE.current
+
+    dept_type = detect_department_type(name, library)
+    mark_stage("classify")
+    values = placeholder_values(context, name=name)
+    templates = library.templates["department"].get(dept_type, library.templates["department"]["default"])
     
     # Select a template variation
-    template = select_template_variation(templates, name, regenerate)
-    suggestion = template.format(name=name)
+    template = select_template_variation(templates, rng)
+    suggestion = template.render(values)
     
+    mark_stage("template")
+    yield "suggestion", suggestion
+
     # Generate alternatives from different template variations
-    alternatives = []
-    all_templates = []
-    for key, tmpls in DEPARTMENT_TEMPLATES.items():
-        if key != "default":
-            all_templates.extend([(key, t) for t in tmpls])
-    
-    random.seed(get_random_seed())
-    random.shuffle(all_templates)
-    
-    for key, tmpl in all_templates:
-        alt = tmpl.format(name=name)
-        if alt != suggestion and alt not in alternatives:
-            alternatives.append(alt)
-            if len(alternatives) >= 3:
-                break
-    
-    return DescriptionResponse(
-        suggestion=suggestion,
-        alternatives=alternatives,
-        confidence=0.85 if dept_type != "default" else 0.7
+    sampled = library.alternative_pools["department"].iter_sample(
+        rng, lambda tmpl: tmpl.render(values), exclude=(suggestion,)
     )
+    for _, alt in islice(sampled, DESCRIPTION_ALTERNATIVES):
+        yield "alternative", alt
+    mark_stage("alternatives")
 
+    yield "confidence", 0.85 if dept_type != "default" else 0.7
+
+
+def generate_department_description(name: str, context: Optional[dict] = None, regenerate: bool = False, rng: Optional[random.Random] = None, library: Optional[TemplateLibrary] = None) -> DescriptionResponse:
+    """Generate department description suggestion with variety"""
+    return collect_description(iter_department_description(name, context, regenerate, rng, library))
+
+
+def fallback_completion(text_lower: str, context_type: SuggestionType) -> str:
+    """Context-specific completion used when no trigger matches"""
+    if context_type == SuggestionType.TASK:
+        if "deadline" in text_lower:
+            return ". Please ensure timely completion."
+        elif "urgent" in text_lower or "asap" in text_lower:
+            return " and requires immediate attention."
+        else:
+            return ". Please coordinate with relevant stakeholders."
+    elif context_type == SuggestionType.MEETING:
+        if "discuss" in text_lower:
+            return " and agree on next steps."
+        elif "review" in text_lower:
+            return " and provide feedback."
+        else:
+            return ". All participants are encouraged to contribute."
+    elif context_type == SuggestionType.DEPARTMENT:
+        return " and supports the organisation's objectives."
+    else:
+        return ". Further details will be provided."
+
+
+def completion_cursor(session_id: str, field_type: str, library: Optional[TemplateLibrary] = None) -> CompletionCursor:
+    """Return the incremental completion state for a client session and field"""
+    index = (library or TEMPLATE_STORE.current).completion_index(field_type)
+    key = (session_id, field_type)
+    cursor = COMPLETION_SESSIONS.get(key)
+    if cursor is None or cursor.index is not index:
+        cursor = CompletionCursor(index)
+        COMPLETION_SESSIONS.set(key, cursor)
+    return cursor
+
+
+def generate_inline_completion(text: str, field_type: str, context_type: SuggestionType, cursor: Optional[CompletionCursor] = None, library: Optional[TemplateLibrary] = None) -> InlineCompletionResponse:
+    """Generate inline text completion - more aggressive matching
+
+    The field's n-gram model, when the template pack has one, is tried
+    first; the trigger table and the context fallback answer when it is not
+    confident. With a cursor, only the characters changed since the
+    previous call for that session are processed; the result is the same
+    either way.
+    """
+    model = (library or TEMPLATE_STORE.current).completion_model(field_type)
+    if model is not None:
+        predicted = model.complete(text)
+        mark_stage("model")
+        if predicted is not None:
+            completion, confidence = predicted
+            COMPLETION_STRATEGIES.inc("ngram")
+            return InlineCompletionResponse(
+                completion=completion,
+                full_text=text + completion,
+                confidence=confidence
+            )
+
+    if cursor is not None:
+        match = cursor.match(text)
+        if cursor.is_blank:
+            COMPLETION_STRATEGIES.inc("none")
+            return InlineCompletionResponse(completion="", full_text="", confidence=0)
+        text_lower = None
+    else:
+        text_lower = text.lower().strip()
+        if not text_lower:
+            COMPLETION_STRATEGIES.inc("none")
+            return InlineCompletionResponse(completion="", full_text="", confidence=0)
+
+        # Strategies 1-4 (exact ending, partial word, substring, after space)
+        # are answered by the compiled trigger index in a single pass
+        index = (library or TEMPLATE_STORE.current).completion_index(field_type)
+        match = index.match(text_lower, text.endswith(" "))
+    mark_stage("match")
 
-def generate_inline_completion(text: str, field_type: str, context_type: SuggestionType) -> InlineCompletionResponse:
-    """Generate inline text completion - more aggressive matching"""
-    text_lower = text.lower().strip()
-    
-    if not text_lower:
-        return InlineCompletionResponse(completion="", full_text="", confidence=0)
-    
-    completions = INLINE_COMPLETIONS.get(field_type, INLINE_COMPLETIONS["description"])
-    
     best_match = ""
     best_confidence = 0.0
+    strategy = "none"
+    if match:
+        best_match, best_confidence, strategy = match
+
+    # Fallback: provide context-specific suggestions after enough text
+    if not best_match and len(text) >= 15:
+        if text_lower is None:
+            text_lower = text.lower().strip()
+        best_match = fallback_completion(text_lower, context_type)
+        best_confidence = 0.55
+        strategy = "fallback"
+        mark_stage("fallback")
     
-    # Get the last portion of text for matching (last 30 chars for better context)
-    last_portion = text_lower[-30:] if len(text_lower) > 30 else text_lower
-    
-    # Strategy 1: Exact ending match (highest confidence)
-    for trigger, completion in completions.items():
-        if last_portion.endswith(trigger):
-            best_match = completion
-            best_confidence = 0.95
-            break
-    
-    # Strategy 2: Match last word if it's incomplete (medium confidence)
-    if not best_match and len(text_lower) >= 3:
-        words = text_lower.split()
-        if words:
-            last_word = words[-1]
-            # Look for triggers that start with the last word (partial word completion)
-            for trigger, completion in completions.items():
-                trigger_first_word = trigger.split()[0] if ' ' in trigger else trigger
-                if trigger_first_word.startswith(last_word) and len(last_word) >= 3:
-                    # Complete the word plus the rest
-                    word_completion = trigger_first_word[len(last_word):]
-                    best_match = word_completion + completion
-                    best_confidence = 0.85
-                    break
-    
-    # Strategy 3: Check if any trigger word appears in last 20 characters
-    if not best_match:
-        for trigger, completion in completions.items():
-            if trigger in last_portion:
-                # Only suggest if the trigger is near the end
-                idx = last_portion.rfind(trigger)
-                if idx >= len(last_portion) - len(trigger) - 5:
-                    best_match = completion
-                    best_confidence = 0.75
-                    break
-    
-    # Strategy 4: Smart context-based suggestions if still no match
-    if not best_match:
-        # Check if user just finished typing a word (ends with space)
-        if text.endswith(" "):
-            words = text_lower.strip().split()
-            if words:
-                last_word = words[-1]
-                # Suggest based on last complete word
-                for trigger, completion in completions.items():
-                    if trigger.startswith(last_word):
-                        best_match = completion
-                        best_confidence = 0.65
-                        break
-        
-        # Fallback: provide context-specific suggestions after enough text
-        if not best_match and len(text) >= 15:
-            if context_type == SuggestionType.TASK:
-                if "deadline" in text_lower:
-                    best_match = ". Please ensure timely completion."
-                elif "urgent" in text_lower or "asap" in text_lower:
-                    best_match = " and requires immediate attention."
-                else:
-                    best_match = ". Please coordinate with relevant stakeholders."
-            elif context_type == SuggestionType.MEETING:
-                if "discuss" in text_lower:
-                    best_match = " and agree on next steps."
-                elif "review" in text_lower:
-                    best_match = " and provide feedback."
-                else:
-                    best_match = ". All participants are encouraged to contribute."
-            elif context_type == SuggestionType.DEPARTMENT:
-                best_match = " and supports the organisation's objectives."
-            else:
-                best_match = ". Further details will be provided."
-            best_confidence = 0.55
-    
+    COMPLETION_STRATEGIES.inc(strategy)
     return InlineCompletionResponse(
         completion=best_match,
         full_text=text + best_match,
@@ -742,6 +626,59 @@ def generate_inline_completion(text: str, field_type: str, context_type: Suggest
     )
 
 
+def generate_ranked_completions(text: str, field_type: str, context_type: SuggestionType, top_k: int, cursor: Optional[CompletionCursor] = None, library: Optional[TemplateLibrary] = None) -> RankedInlineCompletionResponse:
+    """Generate up to top_k ranked inline completions from a single index scan
+
+    The first candidate is the completion generate_inline_completion returns:
+    n-gram model candidates come first, then trigger table matches, and the
+    context fallback is offered last once the text is long enough.
+    """
+    model = (library or TEMPLATE_STORE.current).completion_model(field_type)
+    predicted = []
+    if model is not None:
+        predicted = model.rank(text, top_k)
+        mark_stage("model")
+
+    if cursor is not None:
+        ranked = cursor.rank(text, top_k)
+        blank = cursor.is_blank
+    else:
+        text_lower = text.lower().strip()
+        blank = not text_lower
+        index = (library or TEMPLATE_STORE.current).completion_index(field_type)
+        ranked = [] if blank else index.rank(text_lower, text.endswith(" "), top_k)
+    mark_stage("match")
+
+    if blank:
+        COMPLETION_STRATEGIES.inc("none")
+        return RankedInlineCompletionResponse(completion="", full_text="", confidence=0)
+
+    candidates = [
+        CompletionCandidate(completion=completion, confidence=confidence, strategy="ngram")
+        for completion, confidence in predicted
+    ]
+    offered = {candidate.completion for candidate in candidates}
+    for completion, confidence, strategy in ranked:
+        if len(candidates) >= top_k:
+            break
+        if completion not in offered:
+            candidates.append(CompletionCandidate(completion=completion, confidence=confidence, strategy=strategy))
+    if len(candidates) < top_k and len(text) >= 15:
+        fallback = fallback_completion(text.lower().strip(), context_type)
+        if all(candidate.completion != fallback for candidate in candidates):
+            candidates.append(CompletionCandidate(completion=fallback, confidence=0.55, strategy="fallback"))
+        mark_stage("fallback")
+
+    best = candidates[0] if candidates else None
+    COMPLETION_STRATEGIES.inc(best.strategy if best else "none")
+    return RankedInlineCompletionResponse(
+        completion=best.completion if best else "",
+        full_text=text + (best.completion if best else ""),
+        confidence=best.confidence if best else 0.0,
+        candidates=candidates
+    )
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -753,6 +690,187 @@ async def root():
     }
 
 
+# Set once the worker has warmed up, cleared as soon as it starts draining
+READY = threading.Event()
+
+
+def warm_up() -> None:
+    """Run every generator and completion index once before taking traffic
+
+    The template pack is already loaded and compiled at import; this also
+    fails startup early if a pack that validated cannot actually render.
+    Metrics are suppressed so restarts do not add synthetic traffic.
+    """
+    library = TEMPLATE_STORE.current
+    with metrics_suppressed():
+        for suggestion_type in SuggestionType:
+            generate_description("Review quarterly team meeting", suggestion_type, {"priority": "high", "duration": 30}, library=library)
+            list(iter_alternatives("Review quarterly team meeting", suggestion_type, library=library))
+        for field_type in library.inline_completions:
+            generate_inline_completion("Please ensure the review", field_type, SuggestionType.GENERAL, library=library)
+            generate_ranked_completions("Please ensure the review", field_type, SuggestionType.GENERAL, 3, library=library)
+
+
+def report_drain_on_exit_signals() -> None:
+    """Stop reporting ready as soon as SIGTERM or SIGINT arrives
+
+    Wraps the server's own handlers, which then drain in-flight requests.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(signum)
+        if not callable(previous):
+            continue
+
+        def handler(received, frame, previous=previous):
+            READY.clear()
+            previous(received, frame)
+
+        signal.signal(signum, handler)
+
+
+@app.get("/ready")
+async def ready():
+    """Readiness check: 200 once warmed up, 503 while starting or draining"""
+    if not READY.is_set():
+        raise HTTPException(status_code=503, detail="Not ready")
+    return {"status": "ready", "template_pack": TEMPLATE_STORE.current.version}
+
+
+def resolve_description_type(title: str, suggestion_type: SuggestionType) -> SuggestionType:
+    """Resolve general requests to the task, meeting or department generator"""
+    if suggestion_type != SuggestionType.GENERAL:
+        return suggestion_type
+
+    # General suggestion - try to detect type from title
+    title_lower = title.lower()
+    if any(word in title_lower for word in ["meeting", "session", "call", "sync"]):
+        return SuggestionType.MEETING
+    elif any(word in title_lower for word in ["team", "department", "group", "division"]):
+        return SuggestionType.DEPARTMENT
+    else:
+        return SuggestionType.TASK
+
+
+def iter_description(title: str, suggestion_type: SuggestionType, context: Optional[dict] = None, regenerate: bool = False, library: Optional[TemplateLibrary] = None) -> Iterator[Tuple[str, Any]]:
+    """Dispatch a description request to the matching event generator"""
+    library = library or TEMPLATE_STORE.current
+    resolved = resolve_description_type(title, suggestion_type)
+    if resolved == SuggestionType.MEETING:
+        return iter_meeting_description(title, context, regenerate, library=library)
+    elif resolved == SuggestionType.DEPARTMENT:
+        return iter_department_description(title, context, regenerate, library=library)
+    else:
+        return iter_task_description(title, context, regenerate, library=library)
+
+
+def generate_description(title: str, suggestion_type: SuggestionType, context: Optional[dict] = None, regenerate: bool = False, library: Optional[TemplateLibrary] = None) -> DescriptionResponse:
+    """Dispatch a description request to the matching generator"""
+    return collect_description(iter_description(title, suggestion_type, context, regenerate, library))
+
+
+def iter_alternatives(title: str, suggestion_type: SuggestionType, context: Optional[dict] = None, regenerate: bool = False, limit: int = 5, library: Optional[TemplateLibrary] = None) -> Iterator[Tuple[str, str]]:
+    """Yield up to limit (template type, description) alternatives"""
+    library = library or TEMPLATE_STORE.current
+    subject = extract_subject(title)
+    mark_stage("subject")
+    pool = library.alternative_pools.get(suggestion_type.value, library.alternative_pools["task"])
+
+    if suggestion_type == SuggestionType.DEPARTMENT:
+        values = placeholder_values(context, name=title)
+    else:
+        values = placeholder_values(context, subject=subject)
+    render = lambda template: template.render(values)
+
+    # Sample variations, rendering only the ones returned
+    rng = request_rng(f"alternatives:{suggestion_type.value}", title, context, regenerate)
+    return islice(pool.iter_sample(rng, render), limit)
+
+
+def generate_alternatives(title: str, suggestion_type: SuggestionType, context: Optional[dict] = None, regenerate: bool = False, library: Optional[TemplateLibrary] = None) -> dict:
+    """Generate multiple alternative descriptions"""
+    alternatives = [
+        {"type": key, "description": alt}
+        for key, alt in iter_alternatives(title, suggestion_type, context, regenerate, library=library)
+    ]
+    mark_stage("alternatives")
+
+    return {"alternatives": alternatives}
+
+
+def format_validation_error(error: ValidationError) -> str:
+    """Flatten a pydantic validation error into a single readable message"""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'item'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+def request_fingerprint(endpoint: str, request: DescriptionRequest, library: Optional[TemplateLibrary] = None) -> str:
+    """Normalised cache key for a description-style request
+    
+    Includes the template pack and its generation, so a reloaded pack never
+    serves responses rendered from the previous one. Organisations without
+    their own pack share the default pack's entries.
+    """
+    library = library or TEMPLATE_STORE.current
+    return json.dumps(
+        [endpoint, library.source, library.generation, request.type.value, request.title, request.context or {}],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+
+
+def cached_response(endpoint: str, request: DescriptionRequest, generate: Callable[[], Any], library: Optional[TemplateLibrary] = None) -> Any:
+    """Serve a non-regenerate request from RESPONSE_CACHE, generating on a miss"""
+    if request.regenerate:
+        return generate()
+
+    key = request_fingerprint(endpoint, request, library)
+    response = RESPONSE_CACHE.get(key)
+    mark_stage("cache")
+    if response is None:
+        response = generate()
+        RESPONSE_CACHE.set(key, response)
+    return response
+
+
+async def coalesced_response(endpoint: str, request: DescriptionRequest, generate: Callable[[], Any], library: Optional[TemplateLibrary] = None) -> Any:
+    """Serve a description-style request, sharing work with identical requests in flight
+
+    The delay, validation and cached generation run once per fingerprint;
+    identical requests arriving meanwhile wait for that result. regenerate
+    requests always run on their own.
+    """
+    async def respond():
+        # Simulate slight delay for realistic feel
+        await asyncio.sleep(0.1)
+        mark_stage("delay")
+
+        if not request.title.strip():
+            raise HTTPException(status_code=400, detail="Title cannot be empty")
+
+        return cached_response(endpoint, request, generate, library)
+
+    if request.regenerate:
+        return await respond()
+    response = await IN_FLIGHT_REQUESTS.run(request_fingerprint(endpoint, request, library), respond)
+    mark_stage("wait")
+    return response
+
+
+def describe_description_request(request: DescriptionRequest) -> None:
+    """Record the shape of a description-style request for the slow request log"""
+    describe_input(
+        type=request.type.value,
+        title_length=len(request.title),
+        context_keys=sorted(request.context or {})[:10],
+        regenerate=bool(request.regenerate)
+    )
+
+
 @app.post("/api/suggest/description", response_model=DescriptionResponse)
 async def suggest_description(request: DescriptionRequest):
     """
@@ -763,32 +881,21 @@ async def suggest_description(request: DescriptionRequest):
     - **context**: Additional context like priority, duration, etc.
     - **regenerate**: Force a different suggestion (for rewrite functionality)
     """
-    # Simulate slight delay for realistic feel
-    await asyncio.sleep(0.1)
-    
-    if not request.title.strip():
-        raise HTTPException(status_code=400, detail="Title cannot be empty")
-    
+    mark_stage("validation")
+    describe_description_request(request)
+
     regenerate = request.regenerate or False
+    library = tenant_library(request.organization_id)
     
-    if request.type == SuggestionType.TASK:
-        return generate_task_description(request.title, request.context, regenerate)
-    elif request.type == SuggestionType.MEETING:
-        return generate_meeting_description(request.title, request.context, regenerate)
-    elif request.type == SuggestionType.DEPARTMENT:
-        return generate_department_description(request.title, request.context, regenerate)
-    else:
-        # General suggestion - try to detect type from title
-        title_lower = request.title.lower()
-        if any(word in title_lower for word in ["meeting", "session", "call", "sync"]):
-            return generate_meeting_description(request.title, request.context, regenerate)
-        elif any(word in title_lower for word in ["team", "department", "group", "division"]):
-            return generate_department_description(request.title, request.context, regenerate)
-        else:
-            return generate_task_description(request.title, request.context, regenerate)
+    return FastJSONResponse(await coalesced_response(
+        "description",
+        request,
+        lambda: generate_description(request.title, request.type, request.context, regenerate, library),
+        library
+    ))
 
 
-@app.post("/api/suggest/completion", response_model=InlineCompletionResponse)
+@app.post("/api/suggest/completion", response_model=Union[RankedInlineCompletionResponse, InlineCompletionResponse])
 async def suggest_completion(request: InlineCompletionRequest):
     """
     Generate inline text completion suggestion
@@ -796,22 +903,141 @@ async def suggest_completion(request: InlineCompletionRequest):
     - **text**: Current text in the field
     - **field_type**: Type of field (title, description, agenda)
     - **context_type**: Context type (task, meeting, department)
+    - **session_id**: Optional client session id for incremental matching
+    - **top_k**: Optionally also return up to this many ranked candidates
     """
+    mark_stage("validation")
+    describe_input(
+        field_type=request.field_type[:32],
+        context_type=request.context_type.value,
+        text_length=len(request.text),
+        session=request.session_id is not None,
+        top_k=request.top_k
+    )
+
     # Simulate slight delay for realistic feel
     await asyncio.sleep(0.05)
+    mark_stage("delay")
     
     if not request.text.strip():
-        return InlineCompletionResponse(
+        empty = RankedInlineCompletionResponse if request.top_k else InlineCompletionResponse
+        return FastJSONResponse(empty(
             completion="",
             full_text="",
             confidence=0
-        )
+        ))
     
-    return generate_inline_completion(
+    library = tenant_library(request.organization_id)
+    cursor = completion_cursor(request.session_id, request.field_type, library) if request.session_id else None
+    if request.top_k:
+        return FastJSONResponse(generate_ranked_completions(
+            request.text,
+            request.field_type,
+            request.context_type,
+            request.top_k,
+            cursor,
+            library
+        ))
+    return FastJSONResponse(generate_inline_completion(
         request.text,
         request.field_type,
-        request.context_type
-    )
+        request.context_type,
+        cursor,
+        library
+    ))
+
+
+def completion_socket_reply(message: str, cursors: dict) -> dict:
+    """Answer one WebSocket completion message, tagged with its sequence id
+
+    Messages without a session_id share incremental state per field type
+    for the lifetime of the connection (held in cursors).
+    """
+    try:
+        payload = json.loads(message)
+    except ValueError:
+        return {"id": None, "error": "Message must be valid JSON"}
+    if not isinstance(payload, dict):
+        return {"id": None, "error": "Message must be a JSON object"}
+
+    sequence_id = payload.pop("id", None)
+    try:
+        request = InlineCompletionRequest.model_validate(payload)
+    except ValidationError as e:
+        return {"id": sequence_id, "error": format_validation_error(e)}
+
+    library = TENANT_LIBRARIES.library(request.organization_id)
+    if request.session_id:
+        cursor = completion_cursor(request.session_id, request.field_type, library)
+    else:
+        index = library.completion_index(request.field_type)
+        cursor = cursors.get(request.field_type)
+        if cursor is None or cursor.index is not index:
+            cursor = cursors[request.field_type] = CompletionCursor(index)
+
+    if request.top_k:
+        response = generate_ranked_completions(request.text, request.field_type, request.context_type, request.top_k, cursor, library)
+    else:
+        response = generate_inline_completion(request.text, request.field_type, request.context_type, cursor, library)
+    return {"id": sequence_id, **response.model_dump()}
+
+
+@app.websocket("/ws/suggest/completion")
+async def suggest_completion_socket(websocket: WebSocket):
+    """
+    Persistent inline completion channel
+
+    Each message is a JSON object with the InlineCompletionRequest fields
+    plus an **id** sequence number; each reply is an InlineCompletionResponse
+    tagged with the same id. When several keystrokes arrive while one is
+    being answered, only the newest is computed and the superseded ones are
+    dropped without a reply. A binary frame closes the channel with a
+    policy violation.
+    """
+    await websocket.accept()
+
+    pending = []
+    cursors = {}
+    ready = asyncio.Event()
+    closed = False
+    rejected = False
+
+    async def receive_messages():
+        nonlocal closed, rejected
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                text = message.get("text")
+                if text is None:
+                    rejected = True
+                    break
+                pending[:] = [text]
+                ready.set()
+        finally:
+            closed = True
+            ready.set()
+
+    receiver = asyncio.create_task(receive_messages())
+    try:
+        while True:
+            await ready.wait()
+            ready.clear()
+            if closed:
+                break
+            if not pending:
+                continue
+            message = pending.pop()
+            await websocket.send_text(json.dumps(completion_socket_reply(message, cursors), ensure_ascii=False))
+        if rejected:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Only text frames are accepted")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        # Retrieve the receiver's outcome so an error in it is not left unobserved
+        await asyncio.gather(receiver, return_exceptions=True)
 
 
 @app.post("/api/suggest/alternatives")
@@ -819,44 +1045,447 @@ async def suggest_alternatives(request: DescriptionRequest):
     """
     Generate multiple alternative descriptions
     """
-    await asyncio.sleep(0.1)
-    
+    mark_stage("validation")
+    describe_description_request(request)
+
+    library = tenant_library(request.organization_id)
+
+    return FastJSONResponse(await coalesced_response(
+        "alternatives",
+        request,
+        lambda: generate_alternatives(request.title, request.type, request.context, request.regenerate or False, library),
+        library
+    ))
+
+
+def description_stream_events(request: DescriptionRequest, library: Optional[TemplateLibrary] = None) -> Iterator[Tuple[str, dict]]:
+    """Yield stream events for a description request, filling the cache on completion"""
+    regenerate = request.regenerate or False
+    key = None if regenerate else request_fingerprint("description", request, library)
+    cached = RESPONSE_CACHE.get(key) if key else None
+
+    if cached is not None:
+        events = [("suggestion", cached.suggestion)]
+        events += [("alternative", alt) for alt in cached.alternatives]
+        events.append(("confidence", cached.confidence))
+    else:
+        events = iter_description(request.title, request.type, request.context, regenerate, library)
+
+    produced = []
+    alternative_index = 0
+    for event, value in events:
+        produced.append((event, value))
+        if event == "suggestion":
+            yield "suggestion", {"suggestion": value}
+        elif event == "alternative":
+            yield "alternative", {"index": alternative_index, "alternative": value}
+            alternative_index += 1
+        elif event == "confidence":
+            yield "done", {"confidence": value}
+
+    if key and cached is None:
+        RESPONSE_CACHE.set(key, collect_description(produced))
+
+
+def alternatives_stream_events(request: DescriptionRequest, library: Optional[TemplateLibrary] = None) -> Iterator[Tuple[str, dict]]:
+    """Yield stream events for an alternatives request, filling the cache on completion"""
+    regenerate = request.regenerate or False
+    key = None if regenerate else request_fingerprint("alternatives", request, library)
+    cached = RESPONSE_CACHE.get(key) if key else None
+
+    if cached is not None:
+        events = [(alt["type"], alt["description"]) for alt in cached["alternatives"]]
+    else:
+        events = iter_alternatives(request.title, request.type, request.context, regenerate, library=library)
+
+    alternatives = []
+    for key_type, description in events:
+        yield "alternative", {"index": len(alternatives), "type": key_type, "description": description}
+        alternatives.append({"type": key_type, "description": description})
+    yield "done", {"count": len(alternatives)}
+
+    if key and cached is None:
+        RESPONSE_CACHE.set(key, {"alternatives": alternatives})
+
+
+def encode_stream_event(event: str, payload: dict, stream_format: str) -> str:
+    """Encode one stream event as an NDJSON line or a Server-Sent Event"""
+    if stream_format == "sse":
+        return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    return json.dumps({"event": event, **payload}, ensure_ascii=False) + "\n"
+
+
+def streaming_suggestions(http_request: Request, events: Iterator[Tuple[str, dict]], stream_format: Optional[str]) -> StreamingResponse:
+    """Stream events to the client, stopping generation if it disconnects
+
+    Server-Sent Events are used when requested with ?format=sse or an
+    Accept: text/event-stream header; otherwise newline-delimited JSON.
+    """
+    if stream_format is None:
+        accept = http_request.headers.get("accept", "")
+        stream_format = "sse" if "text/event-stream" in accept else "ndjson"
+
+    async def body():
+        for event, payload in events:
+            if await http_request.is_disconnected():
+                break
+            yield encode_stream_event(event, payload, stream_format)
+            # Give the server a chance to notice a disconnect between events
+            await asyncio.sleep(0)
+
+    return StreamingResponse(body(), media_type=STREAM_MEDIA_TYPES[stream_format])
+
+
+@app.post("/api/suggest/description/stream")
+async def suggest_description_stream(
+    request: DescriptionRequest,
+    http_request: Request,
+    format: Optional[str] = Query(default=None, pattern="^(ndjson|sse)$"),
+):
+    """
+    Stream a description suggestion: the suggestion first, then each
+    alternative, then a final "done" event carrying the confidence
+
+    - **format**: "ndjson" (default) or "sse"
+    """
     if not request.title.strip():
         raise HTTPException(status_code=400, detail="Title cannot be empty")
-    
-    subject = extract_subject(request.title)
-    alternatives = []
-    
-    if request.type == SuggestionType.TASK:
-        templates = TASK_TEMPLATES
-    elif request.type == SuggestionType.MEETING:
-        templates = MEETING_TEMPLATES
-    elif request.type == SuggestionType.DEPARTMENT:
-        templates = DEPARTMENT_TEMPLATES
-    else:
-        templates = TASK_TEMPLATES
-    
-    # Collect all template variations
-    all_alternatives = []
-    for key, template_list in templates.items():
-        if key != "default":
-            for template in template_list:
-                if request.type == SuggestionType.DEPARTMENT:
-                    alt = template.format(name=request.title)
-                else:
-                    alt = template.format(subject=subject)
-                all_alternatives.append({
-                    "type": key,
-                    "description": alt
-                })
-    
-    # Shuffle and return top 5
-    random.seed(get_random_seed())
-    random.shuffle(all_alternatives)
-    
-    return {"alternatives": all_alternatives[:5]}
+
+    library = TENANT_LIBRARIES.library(request.organization_id)
+    return streaming_suggestions(http_request, description_stream_events(request, library), format)
+
+
+@app.post("/api/suggest/alternatives/stream")
+async def suggest_alternatives_stream(
+    request: DescriptionRequest,
+    http_request: Request,
+    format: Optional[str] = Query(default=None, pattern="^(ndjson|sse)$"),
+):
+    """
+    Stream alternative descriptions one event at a time, then a final
+    "done" event carrying the count
+
+    - **format**: "ndjson" (default) or "sse"
+    """
+    if not request.title.strip():
+        raise HTTPException(status_code=400, detail="Title cannot be empty")
+
+    library = TENANT_LIBRARIES.library(request.organization_id)
+    return streaming_suggestions(http_request, alternatives_stream_events(request, library), format)
+
+
+@app.post("/api/suggest/batch", response_model=BatchDescriptionResponse)
+async def suggest_batch(request: BatchDescriptionRequest):
+    """
+    Generate description suggestions for many items at once
+
+    - **items**: List of description requests (title, type, context, regenerate)
+
+    Identical non-regenerate items are generated once. Results are returned
+    in input order, with an error message in place of any item that failed.
+    """
+    if len(request.items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch cannot contain more than {MAX_BATCH_SIZE} items"
+        )
+
+    results = []
+    generated = {}
+    for index, raw_item in enumerate(request.items):
+        try:
+            item = DescriptionRequest.model_validate(raw_item)
+        except ValidationError as e:
+            results.append(BatchItemResult(index=index, error=format_validation_error(e)))
+            continue
+
+        if not item.title.strip():
+            results.append(BatchItemResult(index=index, error="Title cannot be empty"))
+            continue
+
+        library = TENANT_LIBRARIES.library(item.organization_id)
+        key = None if item.regenerate else request_fingerprint("description", item, library)
+        if key is not None and key in generated:
+            results.append(BatchItemResult(index=index, result=generated[key]))
+            continue
+
+        try:
+            response = cached_response(
+                "description",
+                item,
+                lambda: generate_description(item.title, item.type, item.context, item.regenerate or False, library),
+                library
+            )
+        except Exception as e:
+            results.append(BatchItemResult(index=index, error=str(e) or e.__class__.__name__))
+            continue
+
+        if key is not None:
+            generated[key] = response
+        results.append(BatchItemResult(index=index, result=response))
+
+    return FastJSONResponse(BatchDescriptionResponse(results=results))
+
+
+@app.post("/api/suggest/category", response_model=CategoryResponse)
+async def suggest_category(request: CategoryRequest):
+    """
+    Detect the template category of a title
+
+    - **title**: Title of the task or meeting, or the department name
+    - **type**: Kind of item (task, meeting, department)
+
+    Returns the category the description templates would use, plus every
+    matching category with its summed keyword weight, highest first.
+    """
+    mark_stage("validation")
+    describe_input(type=request.type.value, title_length=len(request.title))
+
+    library = tenant_library(request.organization_id)
+    classifier = library.classifiers[request.type.value]
+    category = classifier.classify(request.title)
+    scores = [CategoryScore(category=name, weight=weight) for name, weight in classifier.scores(request.title)]
+    mark_stage("classify")
+    return FastJSONResponse(CategoryResponse(category=category, scores=scores))
+
+
+def require_items_token(token: Optional[str]) -> None:
+    """Reject item requests without the items token; hide them entirely when none is configured"""
+    if not ITEMS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not secrets.compare_digest(token, ITEMS_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid items token")
+
+
+@app.post("/api/items")
+async def put_items(request: ItemsRequest, x_items_token: Optional[str] = Header(default=None)):
+    """
+    Add or replace an organisation's items for similar-item search
+
+    - **organization_id**: Organisation the items belong to
+    - **items**: Tasks, meetings or departments (kind, id, title, description)
+
+    Call it whenever an item is created or edited. Requires the X-Items-Token header.
+    """
+    require_items_token(x_items_token)
+    if len(request.items) > MAX_ITEMS_PER_REQUEST:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Request cannot contain more than {MAX_ITEMS_PER_REQUEST} items"
+        )
+    await run_in_threadpool(ITEM_STORE.put, request.organization_id, [item.model_dump(mode="json") for item in request.items])
+    return {"organization_id": request.organization_id, "items": len(request.items)}
+
+
+@app.delete("/api/items/{organization_id}/{kind}/{item_id}")
+async def delete_item(organization_id: int, kind: ItemKind, item_id: int, x_items_token: Optional[str] = Header(default=None)):
+    """Remove a deleted item from similar-item search. Requires the X-Items-Token header."""
+    require_items_token(x_items_token)
+    if not await run_in_threadpool(ITEM_STORE.delete, organization_id, kind.value, item_id):
+        raise HTTPException(status_code=404, detail="Item not found")
+    return {"deleted": True}
+
+
+@app.post("/api/suggest/similar", response_model=SimilarItemsResponse)
+async def suggest_similar(request: SimilarItemsRequest, x_items_token: Optional[str] = Header(default=None)):
+    """
+    Find the organisation's existing items most similar to a title, with their descriptions
+
+    - **organization_id**: Organisation to search
+    - **title**: Title of the item being written
+    - **type**: Kind of item to search (task, meeting, department)
+    - **top_k**: Number of items to return
+    - **exclude_id**: Item to leave out, such as the one being edited
+
+    Items are ranked by BM25 over their titles and descriptions. Requires the X-Items-Token header.
+    """
+    require_items_token(x_items_token)
+    mark_stage("validation")
+    describe_input(type=request.type.value, title_length=len(request.title), top_k=request.top_k)
+
+    def search() -> List[SimilarItem]:
+        with ITEM_STORE.organisation(request.organization_id) as organisation:
+            mark_stage("sync")
+            matches = organisation.index(request.type.value, "similar").search(request.title, request.top_k, exclude=request.exclude_id)
+            mark_stage("search")
+            items = []
+            for item_id, score in matches:
+                item = organisation.get(request.type.value, item_id)
+                items.append(SimilarItem(id=item_id, title=item.title, description=item.description, score=round(score, 4)))
+            return items
+
+    return FastJSONResponse(SimilarItemsResponse(items=await run_in_threadpool(search)))
+
+
+@app.post("/api/suggest/duplicates", response_model=DuplicateCheckResponse)
+async def suggest_duplicates(request: DuplicateCheckRequest, x_items_token: Optional[str] = Header(default=None)):
+    """
+    Find the organisation's open items that are likely duplicates of the one being created
+
+    - **organization_id**: Organisation to check
+    - **title**: Title of the new item
+    - **description**: Optional description of the new item
+    - **type**: Kind of item (task, meeting, department)
+    - **exclude_id**: Item to leave out, such as the one being edited
+    - **threshold**: Lowest estimated similarity to report (default AI_DUPLICATE_THRESHOLD)
+
+    Uses MinHash signatures with locality-sensitive hashing, so a check
+    costs the same however many items are open. Requires the X-Items-Token header.
+    """
+    require_items_token(x_items_token)
+    mark_stage("validation")
+    describe_input(type=request.type.value, title_length=len(request.title), description_length=len(request.description or ""))
+
+    threshold = DUPLICATE_THRESHOLD if request.threshold is None else request.threshold
+
+    def check() -> List[DuplicateItem]:
+        with ITEM_STORE.organisation(request.organization_id) as organisation:
+            mark_stage("sync")
+            matches = organisation.index(request.type.value, "duplicates").check(
+                request.title, request.description, request.top_k, threshold, exclude=request.exclude_id
+            )
+            mark_stage("search")
+            return [
+                DuplicateItem(id=item_id, title=organisation.get(request.type.value, item_id).title, similarity=round(similarity, 4))
+                for item_id, similarity in matches
+            ]
+
+    return FastJSONResponse(DuplicateCheckResponse(duplicates=await run_in_threadpool(check)))
+
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    """Response cache hit, miss and eviction counters"""
+    return RESPONSE_CACHE.stats()
+
+
+def cache_metric(field: str) -> Callable[[], dict]:
+    """Collect one TTLCache statistic for every cache, labelled by cache name"""
+    caches = {"responses": RESPONSE_CACHE, "completion_sessions": COMPLETION_SESSIONS}
+    return lambda: {(name,): cache.stats()[field] for name, cache in caches.items()}
+
+
+METRICS.callback("ai_cache_entries", "Entries held by each cache", ("cache",), cache_metric("entries"))
+METRICS.callback("ai_cache_size", "Size of each cache as measured by its sizeof function", ("cache",), cache_metric("size"))
+for field in ("hits", "misses", "evictions", "expirations"):
+    METRICS.callback(f"ai_cache_{field}_total", f"Cache {field} for each cache", ("cache",), cache_metric(field), kind="counter")
+METRICS.callback(
+    "ai_coalesced_in_flight", "Distinct description and alternatives computations in flight", (),
+    lambda: {(): IN_FLIGHT_REQUESTS.in_flight()}
+)
+METRICS.callback(
+    "ai_coalesced_requests_total", "Description and alternatives requests that computed a response (leader) or shared one in flight (follower)", ("role",),
+    lambda: {("leader",): IN_FLIGHT_REQUESTS.leaders, ("follower",): IN_FLIGHT_REQUESTS.followers}, kind="counter"
+)
+METRICS.callback(
+    "ai_item_organisations_loaded", "Organisations whose items this worker holds in memory", (),
+    lambda: {(): ITEM_STORE.loaded()}
+)
+METRICS.callback(
+    "ai_items_indexed", "Items held in memory by this worker across loaded organisations", (),
+    lambda: {(): ITEM_STORE.item_count()}
+)
+METRICS.callback(
+    "ai_item_organisation_evictions_total", "Organisations dropped from memory to stay within AI_ITEMS_MAX_ORGANISATIONS", (),
+    lambda: {(): ITEM_STORE.evictions}, kind="counter"
+)
+METRICS.callback(
+    "ai_tenant_partitions_resident", "Organisation template partitions held in memory by this worker", (),
+    lambda: {(): TENANT_LIBRARIES.resident()}
+)
+METRICS.callback(
+    "ai_tenant_partition_bytes", "Estimated memory of the resident organisation partitions", (),
+    lambda: {(): TENANT_LIBRARIES.size}
+)
+METRICS.callback(
+    "ai_tenant_partition_evictions_total", "Organisation partitions evicted to stay within AI_TENANT_MEMORY_BUDGET", (),
+    lambda: {(): TENANT_LIBRARIES.evictions}, kind="counter"
+)
+METRICS.callback(
+    "ai_tenant_partition_evicted_bytes_total", "Estimated memory released by evicting organisation partitions", (),
+    lambda: {(): TENANT_LIBRARIES.evicted_bytes}, kind="counter"
+)
+METRICS.callback(
+    "ai_template_pack_generation", "Generation of the loaded template pack, increased on every reload", (),
+    lambda: {(): TEMPLATE_STORE.current.generation}
+)
+METRICS.callback(
+    "ai_template_pack_reloads_total", "Template pack reloads by outcome", ("outcome",),
+    lambda: {("success",): TEMPLATE_STORE.reloads, ("failure",): TEMPLATE_STORE.failed_reloads}, kind="counter"
+)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: requests, latencies, completion strategies, template categories and caches"""
+    return Response(METRICS.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+def require_admin(token: Optional[str]) -> None:
+    """Reject debug requests without the admin token; hide them entirely when none is configured"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not token or not secrets.compare_digest(token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/debug/slow-requests")
+async def slow_requests(x_admin_token: Optional[str] = Header(default=None)):
+    """Slowest requests since startup with their stage timings and redacted input; requires the X-Admin-Token header"""
+    require_admin(x_admin_token)
+    return {"capacity": SLOW_REQUESTS.capacity, "requests": SLOW_REQUESTS.entries()}
+
+
+@app.post("/debug/profile")
+async def profile(
+    seconds: float = Query(default=10, gt=0, description="Stop after this many seconds"),
+    requests: Optional[int] = Query(default=None, ge=1, description="Stop after this many matching requests"),
+    route: Optional[str] = Query(default=None, description="Only profile requests to this path"),
+    format: str = Query(default="collapsed", pattern="^(collapsed|pstats)$"),
+    interval_ms: float = Query(default=5, ge=1, le=100, description="Sampling interval"),
+    x_admin_token: Optional[str] = Header(default=None),
+):
+    """
+    Sample this worker's event loop while it serves live requests
+
+    Responds when the time or request limit is reached, with collapsed
+    stacks (for flamegraph.pl or speedscope) or a pstats file (for
+    pstats or snakeviz). Requires the X-Admin-Token header.
+    """
+    require_admin(x_admin_token)
+    if seconds > MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds cannot exceed {MAX_PROFILE_SECONDS:g}")
+
+    session = ProfileSession(seconds, requests, route, interval_ms / 1000)
+    try:
+        started = PROFILER.start(session)
+    except ProfilerUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    try:
+        while not session.expired():
+            await asyncio.sleep(0.05)
+    finally:
+        PROFILER.stop(session)
+
+    headers = {
+        "X-Profile-Seconds": f"{session.elapsed():.3f}",
+        "X-Profile-Requests": str(session.requests),
+        "X-Profile-Samples": str(sum(session.samples.values())),
+    }
+    if format == "pstats":
+        headers["Content-Disposition"] = 'attachment; filename="profile.pstats"'
+        return Response(session.pstats(), media_type="application/octet-stream", headers=headers)
+    return Response(session.collapsed(), media_type="text/plain; charset=utf-8", headers=headers)
+
+
+@app.get("/api/templates/status")
+async def template_status():
+    """Version and reload counters of the loaded template pack, and the resident organisation partitions"""
+    return {**TEMPLATE_STORE.status(), "organisations": TENANT_LIBRARIES.status()}
 
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001, reload=True)
+    from serve import main_cli
+    main_cli()
@@ -0,0 +1,247 @@
+"""
+Metrics for the AI Suggestion Service
+Counters and histograms rendered in the Prometheus text exposition format
+
+Recording never takes a lock: every thread writes to its own shard, and
+shards are only merged when /metrics is scraped.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from sub-millisecond lookups to slow streams
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LabelValues = Tuple[str, ...]
+
+_RECORDING: ContextVar[bool] = ContextVar("metrics_recording", default=True)
+
+
+@contextmanager
+def suppressed() -> Iterator[None]:
+    """Drop counter and histogram updates made in this context, e.g. warm-up"""
+    token = _RECORDING.set(False)
+    try:
+        yield
+    finally:
+        _RECORDING.reset(token)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Sharded:
+    """Per-thread dicts keyed by label values, merged on collection
+
+    The owning thread is the only writer of a shard, so updates need no
+    lock; a reader copies each shard (an atomic operation on a dict) before
+    merging. The lock is only taken the first time a thread records.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[dict] = []
+        self._register_lock = threading.Lock()
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._register_lock:
+                self._shards.append(shard)
+            return shard
+
+    def _snapshots(self) -> List[dict]:
+        with self._register_lock:
+            shards = list(self._shards)
+        return [shard.copy() for shard in shards]
+
+
+class Counter(_Sharded):
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        if not _RECORDING.get():
+            return
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def values(self) -> Dict[LabelValues, float]:
+        merged: Dict[LabelValues, float] = {}
+        for shard in self._snapshots():
+            for key, value in shard.items():
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in sorted(self.values().items()):
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Histogram(_Sharded):
+    """Bucketed distribution of observations with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__()
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *label_values: str) -> None:
+        if not _RECORDING.get():
+            return
+        shard = self._shard()
+        state = shard.get(label_values)
+        if state is None:
+            # One count per bucket plus +Inf, then the sum
+            state = shard[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def values(self) -> Dict[LabelValues, List[float]]:
+        merged: Dict[LabelValues, List[float]] = {}
+        for shard in self._snapshots():
+            for key, state in shard.items():
+                state = list(state)
+                total = merged.get(key)
+                merged[key] = state if total is None else [a + b for a, b in zip(total, state)]
+        return merged
+
+    def samples(self) -> Iterable[str]:
+        for label_values, state in sorted(self.values().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels} {_format_value(state[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class CallbackMetric:
+    """Gauge or counter whose values are read from a callback at scrape time"""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[LabelValues, float]], kind: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self) -> Iterable[str]:
+        for label_values, value in sorted(self.collect().items()):
+            if value is not None:
+                yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+
+class Registry:
+    """Named metrics rendered together for a scrape"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def callback(self, name: str, documentation: str, labels: Sequence[str],
+                 collect: Callable[[], Dict[LabelValues, float]], kind: str = "gauge") -> CallbackMetric:
+        return self._register(CallbackMetric(name, documentation, labels, collect, kind))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware counting HTTP requests and timing them per route
+
+    Requests are labelled with the route's path template rather than the
+    raw path, so path parameters do not create new series. The duration
+    runs until the last body chunk is sent, which includes streaming.
+    """
+
+    def __init__(self, app, requests: Counter, durations: Histogram):
+        self.app = app
+        self.requests = requests
+        self.durations = durations
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record() -> None:
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            self.requests.inc(scope["method"], path, str(status))
+            self.durations.observe(time.perf_counter() - start, scope["method"], path)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
@@ -0,0 +1,684 @@
+"""
+N-gram completion model for the AI Suggestion Service
+Word n-gram counts learned from the organisation's own task, meeting and
+department texts, stored in a compact array-backed file that every worker
+memory-maps read-only, so the operating system keeps one shared copy
+
+    python ngram_model.py --output models/description.ngram descriptions.txt
+
+File layout: b"AINGRAM\\0", a uint32 header length, a JSON header, then the
+arrays it names, each aligned to 8 bytes. The model is a trie stored level
+by level. Level k holds the k-grams sorted by their token ids, so the
+continuations of any (k-1)-gram are one contiguous, sorted run of level k:
+
+    vocab_offsets, vocab   token strings sorted by their UTF-8 bytes; a
+                           token's id is its position
+    level{k}_tokens        id of the last token of each k-gram (k >= 2)
+    level{k}_counts        occurrences of each k-gram
+    level{k}_children      start of its run of continuations in level k + 1
+    level{k}_best          position of its most frequent continuation, or -1
+    surface_ids,           optional: the tokens most often written other
+    surface_offsets,       than in lowercase mid-sentence, such as
+    surface                "Friday" or "HR", and how they are written
+    prefix_keys,           optional: for each prefix matching more than
+    prefix_totals,         WIDE_PREFIX tokens, its token id range [start,
+    prefix_top             end) as start * (vocabulary + 1) + end, the
+                           total count of those tokens, and the PREFIX_TOP
+                           most frequent of them, best first
+
+Tokens are lowercased, so a completion is matched whatever the case the
+user types; it is shown with each word's surface form. Level 1 has one
+entry per token id. Files are replaced atomically, so
+workers still mapping the previous file are unaffected by a rebuild.
+"""
+
+import argparse
+import heapq
+import json
+import mmap
+import os
+import re
+import shutil
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+MAGIC = b"AINGRAM\0"
+MODEL_FORMAT = 1
+DEFAULT_ORDER = 4
+DEFAULT_MIN_COUNT = 2
+
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:['’][^\W_]+)*|[.,;:!?]")
+PUNCTUATION = frozenset(".,;:!?")
+SENTENCE_END = frozenset(".!?")
+
+# Prefixes matching more tokens than this have their most frequent tokens kept in the model file
+WIDE_PREFIX = 4096
+PREFIX_TOP = 16
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words (with inner apostrophes) and punctuation marks"""
+    return [token.lower() for token in TOKEN_PATTERN.findall(text)]
+
+
+def surface_forms(text: str) -> Iterator[str]:
+    """Words as written, except at the start of a sentence where the case says nothing"""
+    previous = None
+    for token in TOKEN_PATTERN.findall(text):
+        if previous is not None and previous not in SENTENCE_END and token not in PUNCTUATION:
+            yield token
+        previous = token
+
+
+def choose_surfaces(surfaces: Iterable[Tuple[str, int]], min_count: int = DEFAULT_MIN_COUNT) -> Dict[str, str]:
+    """Most common surface form of each token, for the tokens not most often written in lowercase
+
+    Forms seen fewer than min_count times are ignored; ties go to lowercase,
+    then to the form that sorts first.
+    """
+    best: Dict[str, Tuple[int, bool, str]] = {}
+    for surface, count in surfaces:
+        if count < min_count:
+            continue
+        token = surface.lower()
+        candidate = (count, surface == token, surface)
+        current = best.get(token)
+        if current is None or candidate[:2] > current[:2] or (candidate[:2] == current[:2] and surface < current[2]):
+            best[token] = candidate
+    return {token: surface for token, (_, _, surface) in best.items() if surface != token}
+
+
+def iter_ngrams(tokens: Sequence[str], order: int) -> Iterator[Tuple[str, ...]]:
+    """Every n-gram of orders 1 to order in a token sequence"""
+    length = len(tokens)
+    for start in range(length):
+        for end in range(start + 1, min(start + order, length) + 1):
+            yield tuple(tokens[start:end])
+
+
+class NgramCounts:
+    """Counts of every n-gram of orders 1 to order, within each text"""
+
+    def __init__(self, order: int = DEFAULT_ORDER):
+        if order < 2:
+            raise ValueError("An n-gram model needs an order of at least 2")
+        self.order = order
+        self.counts: Counter = Counter()
+        self.surfaces: Counter = Counter()
+        self.texts = 0
+
+    def add(self, text: str) -> None:
+        tokens = tokenize(text)
+        if not tokens:
+            return
+        self.texts += 1
+        self.counts.update(iter_ngrams(tokens, self.order))
+        self.surfaces.update(surface_forms(text))
+
+    def merge(self, other: "NgramCounts") -> None:
+        if other.order != self.order:
+            raise ValueError(f"Cannot merge order {other.order} counts into order {self.order}")
+        self.counts.update(other.counts)
+        self.surfaces.update(other.surfaces)
+        self.texts += other.texts
+
+
+def _aligned(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def wide_prefixes(vocabulary: Sequence[str], width: int = WIDE_PREFIX) -> List[Tuple[int, int]]:
+    """Token id ranges [start, end) of the prefixes matching more than width tokens, sorted
+
+    The tokens starting with a prefix are one contiguous run of the sorted
+    vocabulary, and the runs of its one-character extensions split it.
+    """
+    ranges = set()
+    pending = [(0, 0, len(vocabulary))]
+    while pending:
+        length, start, end = pending.pop()
+        position = start
+        while position < end:
+            token = vocabulary[position]
+            if len(token) <= length:
+                position += 1
+                continue
+            run_end = position + 1
+            while run_end < end and len(vocabulary[run_end]) > length and vocabulary[run_end][length] == token[length]:
+                run_end += 1
+            if run_end - position > width:
+                ranges.add((position, run_end))
+                pending.append((length + 1, position, run_end))
+            position = run_end
+    return sorted(ranges)
+
+
+class ModelWriter:
+    """Writes a model file from n-grams added in sorted order
+
+    N-grams must be added in the order of their token tuples, which puts
+    each one right after its prefix, and only with their prefixes kept.
+    The trie levels are then built in one pass: a node's continuations
+    start where the next level stands when the node is added, and its
+    most frequent one is known once the next node of its level arrives.
+    Level arrays go to temporary files as they fill, so memory holds the
+    vocabulary and one path through the trie, however many n-grams are
+    kept. The file is written next to path and renamed over it.
+    """
+
+    # Entries buffered per array before they are appended to its temporary file
+    BUFFER_ENTRIES = 1 << 16
+
+    def __init__(self, path: str, order: int, vocabulary: Sequence[str], surfaces: Dict[str, str],
+                 min_count: int, texts: int):
+        if order < 2:
+            raise ValueError("An n-gram model needs an order of at least 2")
+        self.path = path
+        self.order = order
+        self.vocabulary = vocabulary
+        self.surfaces = surfaces
+        self.min_count = min_count
+        self.texts = texts
+        self._ids = {token: position for position, token in enumerate(vocabulary)}
+        self._directory = tempfile.TemporaryDirectory(prefix=".ngram-", dir=os.path.dirname(os.path.abspath(path)))
+
+        self._sections: Dict[str, array] = {}
+        self._files = {}
+        self._lengths: Dict[str, int] = {}
+        for k in range(1, order + 1):
+            if k >= 2:
+                self._section(f"level{k}_tokens", "I")
+            self._section(f"level{k}_counts", "I")
+            if k < order:
+                self._section(f"level{k}_children", "I")
+                self._section(f"level{k}_best", "i")
+
+        self._sizes = [0] * (order + 2)
+        # Kept in memory too, like the vocabulary, to rank the tokens of wide prefixes
+        self._unigram_counts = array("I")
+        # The path to the last n-gram added: its tokens, and the best continuation of each open node so far
+        self._path: List[str] = []
+        self._best: List[Tuple[int, int]] = []
+
+    def __enter__(self) -> "ModelWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is not None:
+            self._discard()
+
+    def _discard(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._directory.cleanup()
+
+    def _section(self, name: str, typecode: str) -> None:
+        self._sections[name] = array(typecode)
+        self._files[name] = open(os.path.join(self._directory.name, name), "wb")
+        self._lengths[name] = 0
+
+    def _append(self, name: str, value: int) -> None:
+        values = self._sections[name]
+        values.append(value)
+        if len(values) >= self.BUFFER_ENTRIES:
+            self._flush(name)
+
+    def _flush(self, name: str) -> None:
+        values = self._sections[name]
+        values.tofile(self._files[name])
+        self._lengths[name] += len(values)
+        del values[:]
+
+    def _close_nodes(self, depth: int) -> None:
+        """Close the open nodes deeper than depth, recording their best continuations"""
+        while len(self._best) > depth:
+            k = len(self._best)
+            self._append(f"level{k}_best", self._best.pop()[0])
+        del self._path[depth:]
+
+    def add(self, gram: Sequence[str], count: int) -> None:
+        k = len(gram)
+        if not 1 <= k <= self.order:
+            raise ValueError(f"{' '.join(gram)!r} is not an n-gram of order 1 to {self.order}")
+        if tuple(self._path[:k - 1]) != tuple(gram[:-1]) or (len(self._path) >= k and self._path[:k] >= list(gram)):
+            raise ValueError(f"{' '.join(gram)!r} is out of order or its prefix was not added")
+        token_id = self._ids.get(gram[-1])
+        if token_id is None:
+            raise ValueError(f"{gram[-1]!r} is not in the vocabulary")
+
+        self._close_nodes(k - 1)
+        count = min(count, 0xFFFFFFFF)
+        position = self._sizes[k]
+        if k >= 2:
+            self._append(f"level{k}_tokens", token_id)
+            best_position, best_count = self._best[k - 2]
+            if best_position < 0 or count > best_count:
+                self._best[k - 2] = (position, count)
+        elif token_id != position:
+            raise ValueError(f"{gram[0]!r} is out of order or not in the vocabulary")
+        else:
+            self._unigram_counts.append(count)
+        self._append(f"level{k}_counts", count)
+        self._sizes[k] += 1
+        self._path.append(gram[-1])
+        if k < self.order:
+            self._append(f"level{k}_children", self._sizes[k + 1])
+            self._best.append((-1, 0))
+
+    def close(self) -> Dict[str, int]:
+        """Write the file and return the number of n-grams kept at each order"""
+        try:
+            self._close_nodes(0)
+            for k in range(1, self.order):
+                self._append(f"level{k}_children", self._sizes[k + 1])
+            for name in self._sections:
+                self._flush(name)
+                self._files[name].close()
+            self._write()
+        finally:
+            self._discard()
+        return {f"order_{k}": self._sizes[k] for k in range(1, self.order + 1)}
+
+    def _write(self) -> None:
+        sections: Dict[str, Tuple[str, int]] = {}
+        blob = bytearray()
+        offsets = array("I", [0])
+        for token in self.vocabulary:
+            blob += token.encode("utf-8")
+            offsets.append(len(blob))
+        small = {"vocab_offsets": offsets}
+
+        surface_blob = bytearray()
+        surface_ids = array("I")
+        surface_offsets = array("I", [0])
+        for token_id, token in enumerate(self.vocabulary):
+            if token in self.surfaces:
+                surface_ids.append(token_id)
+                surface_blob += self.surfaces[token].encode("utf-8")
+                surface_offsets.append(len(surface_blob))
+        if surface_ids:
+            small["surface_ids"] = surface_ids
+            small["surface_offsets"] = surface_offsets
+
+        counts = self._unigram_counts
+        prefix_keys = array("Q")
+        prefix_totals = array("Q")
+        prefix_top = array("I")
+        for start, end in wide_prefixes(self.vocabulary):
+            prefix_keys.append(start * (len(self.vocabulary) + 1) + end)
+            prefix_totals.append(sum(counts[start:end]))
+            prefix_top.extend(heapq.nsmallest(PREFIX_TOP, range(start, end), key=lambda token_id: (-counts[token_id], token_id)))
+        if prefix_keys:
+            small["prefix_keys"] = prefix_keys
+            small["prefix_totals"] = prefix_totals
+            small["prefix_top"] = prefix_top
+
+        for name, values in small.items():
+            sections[name] = (values.typecode, len(values))
+        for name, values in self._sections.items():
+            sections[name] = (values.typecode, self._lengths[name])
+
+        layout = {}
+        offset = 0
+        for name, (typecode, length) in sections.items():
+            layout[name] = [offset, typecode, length]
+            offset = _aligned(offset + length * array(typecode).itemsize)
+        layout["vocab"] = [offset, "B", len(blob)]
+        if surface_blob:
+            layout["surface"] = [_aligned(offset + len(blob)), "B", len(surface_blob)]
+
+        header = json.dumps({
+            "format": MODEL_FORMAT,
+            "order": self.order,
+            "min_count": self.min_count,
+            "texts": self.texts,
+            "byteorder": sys.byteorder,
+            "vocabulary": len(self.vocabulary),
+            "sections": layout,
+        }, separators=(",", ":")).encode("utf-8")
+
+        temporary = f"{self.path}.tmp-{os.getpid()}"
+        with open(temporary, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(4, "little"))
+            f.write(header)
+            data_start = _aligned(len(MAGIC) + 4 + len(header))
+            f.write(b"\0" * (data_start - f.tell()))
+            for name in sections:
+                f.seek(data_start + layout[name][0])
+                if name in small:
+                    small[name].tofile(f)
+                else:
+                    with open(os.path.join(self._directory.name, name), "rb") as section:
+                        shutil.copyfileobj(section, f)
+            f.seek(data_start + layout["vocab"][0])
+            f.write(blob)
+            if surface_blob:
+                f.seek(data_start + layout["surface"][0])
+                f.write(surface_blob)
+        os.replace(temporary, self.path)
+
+
+def write_model(counts: NgramCounts, path: str, min_count: int = DEFAULT_MIN_COUNT) -> Dict[str, int]:
+    """Prune n-grams seen fewer than min_count times and write the model file
+
+    A pruned n-gram's prefixes are at least as frequent, so every kept
+    n-gram has its prefix kept. Returns the number of n-grams kept at each
+    order.
+    """
+    # Tuples of strings sort by code point, which is the UTF-8 byte order token ids follow
+    kept = sorted((gram, count) for gram, count in counts.counts.items() if count >= min_count)
+    vocabulary = [gram[0] for gram, _ in kept if len(gram) == 1]
+    with ModelWriter(path, counts.order, vocabulary, choose_surfaces(counts.surfaces.items(), min_count),
+                     min_count, counts.texts) as writer:
+        for gram, count in kept:
+            writer.add(gram, count)
+        return writer.close()
+
+
+class NgramModel:
+    """Read-only view of a model file, predicting how a text continues
+
+    Nothing is copied out of the mapped file: lookups binary-search the
+    arrays in place, so resident memory is the shared page cache whatever
+    the number of workers. The next word is predicted from the longest
+    context seen at least MIN_SUPPORT times (stupid backoff, discounted by
+    BACKOFF per word dropped), and words are added while the probability
+    of the whole phrase stays at or above MIN_CONFIDENCE.
+    """
+
+    MIN_SUPPORT = 3
+    MIN_CONFIDENCE = 0.3
+    BACKOFF = 0.4
+    MAX_WORDS = 8
+    TAIL_LENGTH = 120
+    # Most candidates examined when ranking a large run of continuations;
+    # wider runs of single tokens are ranked from the prefix_top section
+    MAX_SCAN = WIDE_PREFIX
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self._map[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path}: not an n-gram model file")
+        header_length = int.from_bytes(self._map[len(MAGIC):len(MAGIC) + 4], "little")
+        header = json.loads(self._map[len(MAGIC) + 4:len(MAGIC) + 4 + header_length])
+        if header.get("format") != MODEL_FORMAT:
+            raise ValueError(f"{path}: unsupported model format {header.get('format')!r}")
+        if header.get("byteorder") != sys.byteorder:
+            raise ValueError(f"{path}: built on a {header.get('byteorder')}-endian machine")
+
+        self.order: int = header["order"]
+        self.texts: int = header["texts"]
+        self.vocabulary_size: int = header["vocabulary"]
+        self.size = len(self._map)
+
+        data_start = _aligned(len(MAGIC) + 4 + header_length)
+        view = memoryview(self._map)
+        arrays = {}
+        for name, (offset, typecode, length) in header["sections"].items():
+            start = data_start + offset
+            itemsize = array(typecode).itemsize
+            arrays[name] = view[start:start + length * itemsize].cast(typecode)
+
+        self._vocab = arrays["vocab"]
+        self._vocab_offsets = arrays["vocab_offsets"]
+        # Models without surface forms, including those built before they were kept, show every word in lowercase
+        self._surface_ids = arrays.get("surface_ids", ())
+        self._surface_offsets = arrays.get("surface_offsets")
+        self._surface = arrays.get("surface")
+        self._prefix_keys = arrays.get("prefix_keys", ())
+        self._prefix_totals = arrays.get("prefix_totals")
+        self._prefix_top = arrays.get("prefix_top")
+        self._tokens = [None, None] + [arrays[f"level{k}_tokens"] for k in range(2, self.order + 1)]
+        self._counts = [None] + [arrays[f"level{k}_counts"] for k in range(1, self.order + 1)]
+        self._children = [None] + [arrays[f"level{k}_children"] for k in range(1, self.order)]
+        self._best = [None] + [arrays[f"level{k}_best"] for k in range(1, self.order)]
+
+    # Vocabulary
+
+    def token(self, token_id: int) -> str:
+        offsets = self._vocab_offsets
+        return bytes(self._vocab[offsets[token_id]:offsets[token_id + 1]]).decode("utf-8")
+
+    def surface(self, token_id: int, token: Optional[str] = None) -> str:
+        """The token as most often written mid-sentence; token is its string, when already looked up"""
+        ids = self._surface_ids
+        position = bisect_left(ids, token_id)
+        if position == len(ids) or ids[position] != token_id:
+            return token if token is not None else self.token(token_id)
+        offsets = self._surface_offsets
+        return bytes(self._surface[offsets[position]:offsets[position + 1]]).decode("utf-8")
+
+    def _lower_bound(self, key: bytes) -> int:
+        """First token id whose bytes are not less than key"""
+        vocab = self._vocab
+        offsets = self._vocab_offsets
+        lo, hi = 0, self.vocabulary_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if vocab[offsets[mid]:offsets[mid + 1]].tobytes() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def token_id(self, token: str) -> Optional[int]:
+        key = token.encode("utf-8")
+        position = self._lower_bound(key)
+        if position < self.vocabulary_size:
+            offsets = self._vocab_offsets
+            if self._vocab[offsets[position]:offsets[position + 1]].tobytes() == key:
+                return position
+        return None
+
+    def prefix_range(self, prefix: str) -> Tuple[int, int]:
+        """Token ids [start, end) of the tokens starting with prefix"""
+        key = prefix.encode("utf-8")
+        # 0xFF never occurs in UTF-8, so it sorts after every continuation
+        return self._lower_bound(key), self._lower_bound(key + b"\xff")
+
+    def _wide_prefix(self, start: int, end: int) -> Optional[Tuple[Sequence[int], int]]:
+        """Most frequent token ids in [start, end), best first, and their total count, if kept"""
+        keys = self._prefix_keys
+        key = start * (self.vocabulary_size + 1) + end
+        position = bisect_left(keys, key)
+        if position == len(keys) or keys[position] != key:
+            return None
+        stride = len(self._prefix_top) // len(keys)
+        return self._prefix_top[position * stride:(position + 1) * stride], self._prefix_totals[position]
+
+    # Trie lookups
+
+    def _find(self, context: Sequence[int]) -> Optional[int]:
+        """Position of the n-gram context in level len(context), or None"""
+        node = context[0]
+        for k in range(1, len(context)):
+            children = self._children[k]
+            tokens = self._tokens[k + 1]
+            start, end = children[node], children[node + 1]
+            node = bisect_left(tokens, context[k], start, end)
+            if node == end or tokens[node] != context[k]:
+                return None
+        return node
+
+    def _context_node(self, context: Sequence[int], length: int) -> Optional[int]:
+        """Node of the last length ids of context, if seen often enough to predict from"""
+        node = self._find(context[-length:])
+        if node is None or self._counts[length][node] < self.MIN_SUPPORT:
+            return None
+        return node
+
+    def _next(self, context: List[int]) -> Optional[Tuple[int, float]]:
+        """Most likely next token id and its probability"""
+        longest = min(len(context), self.order - 1)
+        for length in range(longest, 0, -1):
+            node = self._context_node(context, length)
+            if node is None:
+                continue
+            best = self._best[length][node]
+            if best < 0:
+                continue
+            probability = self._counts[length + 1][best] / self._counts[length][node]
+            return self._tokens[length + 1][best], probability * self.BACKOFF ** (longest - length)
+        return None
+
+    def _first(self, context: List[int], prefix: Optional[str], k: int) -> List[Tuple[int, float]]:
+        """Up to k (token id, probability) candidates for the next token, best first
+
+        With a prefix, only tokens starting with it are candidates and the
+        probability is relative to those. Candidates all come from the
+        longest context that has any, so the best one never depends on k.
+        Single tokens of a wide prefix come from the precomputed prefix_top
+        section. A longer context with more than MAX_SCAN continuations
+        starting with the prefix, and models written without that section,
+        rank only the first MAX_SCAN in token order.
+        """
+        if prefix is not None:
+            lo, hi = self.prefix_range(prefix)
+            if lo >= hi:
+                return []
+
+        longest = min(len(context), self.order - 1)
+        shortest = 0 if prefix is not None else 1
+        for length in range(longest, shortest - 1, -1):
+            if length:
+                node = self._context_node(context, length)
+                if node is None:
+                    continue
+                start, end = self._children[length][node], self._children[length][node + 1]
+                tokens = self._tokens[length + 1]
+                if prefix is not None:
+                    start, end = bisect_left(tokens, lo, start, end), bisect_left(tokens, hi, start, end)
+            else:
+                start, end = lo, hi
+                if end - start > self.MAX_SCAN:
+                    wide = self._wide_prefix(start, end)
+                    if wide is not None:
+                        top, total = wide
+                        counts = self._counts[1]
+                        discount = self.BACKOFF ** longest
+                        return [(token_id, counts[token_id] / total * discount) for token_id in top[:k]]
+            if start >= end:
+                continue
+
+            counts = self._counts[length + 1]
+            end = min(end, start + self.MAX_SCAN)
+            total = sum(counts[start:end]) if prefix is not None else self._counts[length][node]
+            top = heapq.nsmallest(k, range(start, end), key=lambda position: (-counts[position], position))
+            discount = self.BACKOFF ** (longest - length)
+            token_ids = self._tokens[length + 1] if length else range(self.vocabulary_size)
+            return [(token_ids[position], counts[position] / total * discount) for position in top]
+        return []
+
+    # Completion
+
+    def rank(self, text: str, k: int = 1) -> List[Tuple[str, float]]:
+        """Up to k (completion, confidence) continuations of text, best first"""
+        tail = text[-self.TAIL_LENGTH:]
+        tokens = tokenize(tail)
+        if len(text) > len(tail) and tokens and tail[0].isalnum() and text[-len(tail) - 1].isalnum():
+            # The tail starts part-way through a word
+            tokens.pop(0)
+        if not tokens:
+            return []
+
+        prefix = None
+        if tail[-1].isalnum() and tokens[-1] not in PUNCTUATION:
+            prefix = tokens.pop()
+
+        context: List[int] = []
+        for token in reversed(tokens[-(self.order - 1):]):
+            token_id = self.token_id(token)
+            if token_id is None:
+                break
+            context.append(token_id)
+        context.reverse()
+        previous = tokens[-1] if tokens else None
+
+        ranked = []
+        for token_id, probability in self._first(context, prefix, k):
+            if probability < self.MIN_CONFIDENCE:
+                break
+            phrase = [token_id]
+            confidence = probability
+            history = context + phrase
+            while len(phrase) < self.MAX_WORDS:
+                if self.token(phrase[-1]) in SENTENCE_END:
+                    break
+                predicted = self._next(history[-(self.order - 1):])
+                if predicted is None or confidence * predicted[1] < self.MIN_CONFIDENCE:
+                    break
+                phrase.append(predicted[0])
+                history.append(predicted[0])
+                confidence *= predicted[1]
+
+            completion = self._render(phrase, prefix, previous, tail[-1].isspace())
+            if not completion.strip():
+                # The likeliest reading is that the word is already complete
+                if not ranked:
+                    break
+                continue
+            ranked.append((completion, round(confidence, 2)))
+        return ranked
+
+    def complete(self, text: str) -> Optional[Tuple[str, float]]:
+        """The most likely continuation of text, or None when not confident"""
+        ranked = self.rank(text, 1)
+        return ranked[0] if ranked else None
+
+    def _render(self, phrase: List[int], prefix: Optional[str], previous: Optional[str], after_space: bool) -> str:
+        parts = []
+        for position, token_id in enumerate(phrase):
+            token = self.token(token_id)
+            surface = self.surface(token_id, token)
+            if position == 0 and prefix is not None:
+                # The rest of the word, cased as written when lowercasing kept its length
+                parts.append((surface if len(surface) == len(token) else token)[len(prefix):])
+            elif token in PUNCTUATION:
+                parts.append(token)
+            else:
+                if previous is None or previous in SENTENCE_END:
+                    surface = surface[:1].upper() + surface[1:]
+                parts.append(surface if position == 0 and after_space else " " + surface)
+            previous = token
+        return "".join(parts)
+
+
+def read_texts(paths: Iterable[str]) -> Iterable[str]:
+    """One text per line from each file, or from stdin for "-" """
+    for path in paths:
+        if path == "-":
+            yield from sys.stdin
+            continue
+        with open(path, encoding="utf-8") as f:
+            yield from f
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build an n-gram completion model from texts, one per line")
+    parser.add_argument("inputs", nargs="+", metavar="PATH", help='text files, or "-" for stdin')
+    parser.add_argument("--output", required=True, help="model file to write")
+    parser.add_argument("--order", type=int, default=DEFAULT_ORDER, help=f"longest n-gram (default {DEFAULT_ORDER})")
+    parser.add_argument("--min-count", type=int, default=DEFAULT_MIN_COUNT,
+                        help=f"drop n-grams seen fewer times (default {DEFAULT_MIN_COUNT})")
+    args = parser.parse_args(argv)
+
+    counts = NgramCounts(args.order)
+    for text in read_texts(args.inputs):
+        counts.add(text)
+    kept = write_model(counts, args.output, args.min_count)
+    print(f"Wrote {args.output} from {counts.texts} texts: " + ", ".join(f"{n} {name}" for name, n in kept.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,198 @@
+"""
+On-demand sampling profiler for the AI Suggestion Service
+Samples the event loop while matching requests are being served and returns
+collapsed stacks (for flame graphs) or pstats data
+
+Samples are taken by a SIGPROF interval timer, which fires after every
+interval of CPU time and interrupts whatever Python code is running. (A
+sampling thread would mostly see the loop idle in select(), the only point
+where it reliably gets the GIL.) The loop must therefore run in the main
+thread, as it does under uvicorn, and the platform must have setitimer.
+"""
+
+import marshal
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, Optional
+
+
+class ProfileSession:
+    """One profiling run: which requests to sample, for how long, and the samples taken
+
+    Requests are matched on their path. Each matching request registers the
+    frame of its ProfilerMiddleware call; a sample of the loop thread is
+    kept only when that frame is on the stack, so the stack belongs to a
+    matching request, and it is recorded from that frame down.
+    """
+
+    def __init__(self, seconds: float, max_requests: Optional[int] = None,
+                 path: Optional[str] = None, interval: float = 0.005):
+        self.seconds = seconds
+        self.max_requests = max_requests
+        self.path = path
+        self.interval = interval
+
+        self.samples: Counter = Counter()
+        self.total_samples = 0
+        self.requests = 0
+        self.started = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.done = threading.Event()
+        self._active: Dict[int, FrameType] = {}
+
+    def wants(self, path: str) -> bool:
+        return not self.done.is_set() and (self.path is None or path == self.path)
+
+    def enter(self, frame: FrameType) -> None:
+        self._active[id(frame)] = frame
+
+    def leave(self, frame: FrameType) -> None:
+        self._active.pop(id(frame), None)
+        self.requests += 1
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            self.finish()
+
+    def finish(self) -> None:
+        if not self.done.is_set():
+            self.finished_at = time.monotonic()
+            self.done.set()
+
+    def elapsed(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started
+
+    def expired(self) -> bool:
+        if not self.done.is_set() and time.monotonic() - self.started >= self.seconds:
+            self.finish()
+        return self.done.is_set()
+
+    def sample(self, frame: Optional[FrameType]) -> None:
+        """Record the stack of the interrupted frame if it serves a matching request"""
+        if self.done.is_set():
+            return
+        self.total_samples += 1
+        active = self._active
+        stack = []
+        while frame is not None:
+            if id(frame) in active:
+                self.samples[tuple(reversed(stack))] += 1
+                return
+            stack.append(frame.f_code)
+            frame = frame.f_back
+
+    def collapsed(self) -> str:
+        """Samples in the collapsed stack format used by flamegraph.pl and speedscope"""
+        lines = []
+        for stack, count in sorted(self.samples.items(), key=lambda item: -item[1]):
+            if stack:
+                lines.append(f"{';'.join(frame_label(code) for code in stack)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats(self) -> bytes:
+        """Samples as a marshalled pstats table, loadable with pstats.Stats or snakeviz
+
+        Times are sample counts multiplied by the sampling interval; call
+        counts are sample counts.
+        """
+        interval = self.interval
+        stats: Dict[tuple, list] = {}
+
+        def entry(code: CodeType) -> list:
+            key = (code.co_filename, code.co_firstlineno, code.co_name)
+            if key not in stats:
+                stats[key] = [0, 0, 0.0, 0.0, {}]
+            return stats[key]
+
+        for stack, count in self.samples.items():
+            if not stack:
+                continue
+            seen = set()
+            for position, code in enumerate(stack):
+                row = entry(code)
+                leaf = position == len(stack) - 1
+                if code not in seen:
+                    seen.add(code)
+                    row[0] += count
+                    row[1] += count
+                    row[3] += count * interval
+                if leaf:
+                    row[2] += count * interval
+                if position:
+                    caller = stack[position - 1]
+                    caller_key = (caller.co_filename, caller.co_firstlineno, caller.co_name)
+                    nc, cc, tt, ct = row[4].get(caller_key, (0, 0, 0.0, 0.0))
+                    row[4][caller_key] = (nc + count, cc + count, tt + (count * interval if leaf else 0.0), ct + count * interval)
+
+        return marshal.dumps({key: tuple(row) for key, row in stats.items()})
+
+
+def frame_label(code: CodeType) -> str:
+    qualname = getattr(code, "co_qualname", code.co_name)
+    return f"{qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class ProfilerUnavailable(RuntimeError):
+    """Raised when sampling cannot run in this process"""
+
+
+class SamplingProfiler:
+    """Holds the running ProfileSession, at most one at a time
+
+    start() and stop() must be called from the main thread.
+    """
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self._previous_handler = None
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def start(self, session: ProfileSession) -> bool:
+        """Start sampling; False if a session is already running"""
+        if not self.available():
+            raise ProfilerUnavailable("Profiling needs setitimer and an event loop in the main thread")
+        if self.session is not None:
+            return False
+
+        self.session = session
+        self._previous_handler = signal.signal(signal.SIGPROF, lambda signum, frame: session.sample(frame))
+        signal.setitimer(signal.ITIMER_PROF, session.interval, session.interval)
+        return True
+
+    def stop(self, session: ProfileSession) -> None:
+        session.finish()
+        if self.session is not session:
+            return
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self._previous_handler or signal.SIG_DFL)
+        self.session = None
+
+
+class ProfilerMiddleware:
+    """ASGI middleware registering requests with the running profile session
+
+    When no session is running this is a single attribute check per request.
+    """
+
+    def __init__(self, app, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        session = self.profiler.session
+        if session is None or scope["type"] != "http" or not session.wants(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        frame = sys._getframe()
+        session.enter(frame)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session.leave(frame)
@@ -0,0 +1,42 @@
+"""
+Fast JSON responses for the AI Suggestion Service
+Encodes already-validated responses straight to bytes, skipping FastAPI's
+response_model revalidation and jsonable_encoder
+
+The bytes are identical to what FastAPI sends for the same value: a
+response model is encoded by pydantic's serialiser, as FastAPI does for
+routes with a response_model, and any other payload by the standard library
+encoder with the settings of starlette's JSONResponse. Payloads must
+therefore be plain JSON types (str, int, float, bool, None, list, dict with
+str keys) or response models.
+"""
+
+import json
+from typing import Any
+
+from pydantic import BaseModel
+from starlette.responses import Response
+
+# starlette's JSONResponse settings, used by FastAPI for routes without a response_model
+_encoder = json.JSONEncoder(ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":"))
+
+
+def dumps(content: Any) -> bytes:
+    """Encode a response model or a plain JSON payload"""
+    if isinstance(content, BaseModel):
+        # What model_dump_json() does, without decoding the bytes to str
+        return content.__pydantic_serializer__.to_json(content)
+    return _encoder.encode(content).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response for content that is already valid
+
+    Returned from a route, it is sent as is: FastAPI does not validate it
+    against the route's response_model, which still documents the schema.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,62 @@
+"""
+Production launcher for the AI Suggestion Service
+Runs uvicorn with one worker per core, uvloop and httptools when installed,
+and a graceful drain on SIGTERM
+
+    python serve.py                          # production, one worker per core
+    python serve.py --workers 4 --port 8001
+    python serve.py --reload                 # development: one process, restart on changes
+
+Each worker loads and compiles its own copy of the template pack and warms
+up before it reports ready at /ready; / stays a plain liveness check. Only
+n-gram models are memory-mapped and shared between workers.
+"""
+
+import argparse
+import importlib.util
+import os
+import sys
+from typing import List, Optional
+
+import uvicorn
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+def main_cli(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the AI Suggestion Service")
+    parser.add_argument("--host", default=os.getenv("AI_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("AI_PORT", "8001")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("AI_WORKERS", str(os.cpu_count() or 1))),
+                        help="worker processes (default: number of cores)")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("AI_GRACEFUL_TIMEOUT", "30")),
+                        help="seconds to let in-flight requests finish after SIGTERM")
+    parser.add_argument("--log-level", default=os.getenv("AI_LOG_LEVEL", "info"))
+    parser.add_argument("--reload", action="store_true",
+                        help="development mode: a single process that restarts when files change")
+    args = parser.parse_args(argv)
+
+    loop = "uvloop" if sys.platform != "win32" and installed("uvloop") else "asyncio"
+    http = "httptools" if installed("httptools") else "h11"
+
+    uvicorn.run(
+        "main:app",
+        app_dir=SERVICE_DIR,
+        host=args.host,
+        port=args.port,
+        workers=None if args.reload else max(1, args.workers),
+        reload=args.reload,
+        reload_dirs=[SERVICE_DIR] if args.reload else None,
+        loop=loop,
+        http=http,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,192 @@
+"""
+Similar item search for the AI Suggestion Service
+BM25 ranking over the titles and descriptions of existing items, scored
+with NumPy over posting arrays that are updated in place
+"""
+
+import re
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Letters and digits of any script, so "Zürich" stays one term
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+# Too common in titles and descriptions to say anything about similarity
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or our that the this to was we will with".split()
+)
+
+# A title term counts as this many description terms
+TITLE_WEIGHT = 3
+# Only the start of a long description is indexed
+MAX_DESCRIPTION_TERMS = 200
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Posting lists are scored in full, rarest first, until this many postings
+# have been scored. Longer lists only add to the best MAX_CANDIDATES
+# documents found so far.
+MAX_SCORED_POSTINGS = 50_000
+MAX_CANDIDATES = 10_000
+
+# Deleted and replaced documents stay in the posting lists until this many
+# have piled up and they outnumber the live ones
+COMPACT_MIN_DEAD = 4096
+
+
+def index_terms(text: str) -> List[str]:
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+
+class SimilarityIndex:
+    """Inverted index with BM25 scoring over one organisation's items of one kind
+
+    Each document gets a slot. Per-slot lengths, item ids and live flags are
+    compact arrays. Each term's posting list holds two arrays: slots in
+    ascending order and term weights. Adding a document appends to them.
+    Deleting one only clears its live flag. Replacing one deletes it and
+    appends a new slot. Queries view the arrays through NumPy without
+    copying them. Document frequencies count deleted documents until the
+    next compaction, which drops them from every list.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._ids = array("q")
+        self._lengths = array("f")
+        self._alive = bytearray()
+        self._slots: Dict[int, int] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, item_id: int, title: str, description: str = "") -> None:
+        """Index an item, replacing any earlier version of it"""
+        self.remove(item_id)
+        weights: Counter = Counter()
+        for term in index_terms(title):
+            weights[term] += TITLE_WEIGHT
+        weights.update(index_terms(description)[:MAX_DESCRIPTION_TERMS])
+
+        slot = len(self._ids)
+        length = float(sum(weights.values()))
+        self._ids.append(item_id)
+        self._lengths.append(length)
+        self._alive.append(1)
+        self._slots[item_id] = slot
+        self._total_length += length
+        for term, weight in weights.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("i"), array("f"))
+            postings[0].append(slot)
+            postings[1].append(weight)
+
+    def remove(self, item_id: int) -> bool:
+        slot = self._slots.pop(item_id, None)
+        if slot is None:
+            return False
+        self._alive[slot] = 0
+        self._total_length -= self._lengths[slot]
+        dead = len(self._ids) - len(self._slots)
+        if dead >= COMPACT_MIN_DEAD and dead > len(self._slots):
+            self.compact()
+        return True
+
+    def compact(self) -> None:
+        """Drop deleted documents from every array and renumber the slots"""
+        alive = np.frombuffer(self._alive, dtype=np.bool_)
+        remap = np.cumsum(alive, dtype=np.int64) - 1
+        for term in list(self._postings):
+            docs, weights = self._postings[term]
+            slots = np.frombuffer(docs, dtype=np.int32)
+            keep = alive[slots]
+            if not keep.any():
+                del self._postings[term]
+                continue
+            self._postings[term] = (
+                array("i", remap[slots[keep]].astype(np.int32).tobytes()),
+                array("f", np.frombuffer(weights, dtype=np.float32)[keep].tobytes()),
+            )
+        ids = np.frombuffer(self._ids, dtype=np.int64)[alive]
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)[alive]
+        del alive
+        self._ids = array("q", ids.tobytes())
+        self._lengths = array("f", lengths.tobytes())
+        self._alive = bytearray(b"\x01" * len(ids))
+        self._slots = {int(item_id): slot for slot, item_id in enumerate(ids)}
+        self._total_length = float(lengths.sum(dtype=np.float64))
+
+    def search(self, text: str, k: int, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """Up to k (item id, BM25 score) pairs, best first"""
+        terms = set(index_terms(text))
+        postings = sorted((self._postings[term] for term in terms if term in self._postings), key=lambda p: len(p[0]))
+        if not postings or not self._slots:
+            return []
+
+        documents = len(self._ids)
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        average_length = self._total_length / len(self._slots)
+
+        def score(posting_slots: np.ndarray, weights: np.ndarray, frequency: int) -> np.ndarray:
+            idf = np.log1p((documents - frequency + 0.5) / (frequency + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[posting_slots] / average_length)
+            return idf * weights * (BM25_K1 + 1) / (weights + norm)
+
+        # The rarest lists, which carry the most weight, choose the candidates.
+        # When even the rarest list is over budget only its newest postings count.
+        budget = MAX_SCORED_POSTINGS
+        slot_parts, score_parts = [], []
+        for docs, weights in postings:
+            if slot_parts and len(docs) > budget:
+                break
+            take = min(len(docs), budget)
+            budget -= take
+            slots = np.frombuffer(docs, dtype=np.int32)[len(docs) - take:]
+            slot_parts.append(slots)
+            score_parts.append(score(slots, np.frombuffer(weights, dtype=np.float32)[len(docs) - take:], len(docs)))
+        scored = len(slot_parts)
+        if scored == 1:
+            candidates, scores = slot_parts[0], score_parts[0]
+        else:
+            # Each list is sorted, so a stable sort only merges runs
+            slots = np.concatenate(slot_parts)
+            order = np.argsort(slots, kind="stable")
+            slots, partial = slots[order], np.concatenate(score_parts)[order]
+            starts = np.flatnonzero(np.concatenate(([True], slots[1:] != slots[:-1])))
+            candidates, scores = slots[starts], np.add.reduceat(partial, starts)
+        if len(postings) > scored and len(candidates) > MAX_CANDIDATES:
+            best = np.sort(np.argpartition(-scores, MAX_CANDIDATES - 1)[:MAX_CANDIDATES])
+            candidates, scores = candidates[best], scores[best]
+
+        # Common terms only add to the candidates; their slots are sorted, so look them up
+        for docs, weights in postings[scored:]:
+            slots = np.frombuffer(docs, dtype=np.int32)
+            positions = np.minimum(np.searchsorted(slots, candidates), len(slots) - 1)
+            found = slots[positions] == candidates
+            if found.any():
+                scores[found] += score(candidates[found], np.frombuffer(weights, dtype=np.float32)[positions[found]], len(docs))
+
+        keep = np.frombuffer(self._alive, dtype=np.bool_)[candidates]
+        if exclude is not None and exclude in self._slots:
+            keep &= candidates != self._slots[exclude]
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            candidates, scores = candidates[best], scores[best]
+        order = np.lexsort((candidates, -scores))
+        ids = np.frombuffer(self._ids, dtype=np.int64)
+        return [(int(ids[candidates[i]]), float(scores[i])) for i in order]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "documents": len(self._slots),
+            "slots": len(self._ids),
+            "terms": len(self._postings),
+            "postings": sum(len(docs) for docs, _ in self._postings.values()),
+        }
@@ -0,0 +1,279 @@
+"""
+Template pack store for the AI Suggestion Service
+Loads versioned on-disk template packs, compiles their indexes and swaps
+them in atomically when the file changes
+
+Every worker parses and compiles the pack itself. Compiling dominates
+loading and yields Python objects, so the pack is read plainly rather
+than memory-mapped; the n-gram models are what workers share.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+from ngram_model import NgramModel
+from templates import CONTEXT_PLACEHOLDERS, CompiledTemplate, TemplatePool
+from text_index import CompletionIndex, KeywordClassifier, compile_completion_indexes
+
+logger = logging.getLogger("ai_service.templates")
+
+PACK_FORMAT = 1
+
+# Placeholders each template library may use
+TEMPLATE_FIELDS = {
+    "task": {"subject", *CONTEXT_PLACEHOLDERS},
+    "meeting": {"subject", *CONTEXT_PLACEHOLDERS},
+    "department": {"name", *CONTEXT_PLACEHOLDERS},
+}
+
+
+class TemplatePackError(ValueError):
+    """Raised when a template pack is malformed"""
+
+
+def _require(condition: bool, message: str) -> None:
+    if not condition:
+        raise TemplatePackError(message)
+
+
+def _compile_template(template: str, allowed: set, where: str) -> CompiledTemplate:
+    try:
+        return CompiledTemplate(template, allowed)
+    except ValueError as e:
+        raise TemplatePackError(f"{where}: {e}") from e
+
+
+def _string_list(value, where: str) -> List[str]:
+    _require(isinstance(value, list) and all(isinstance(item, str) for item in value), f"{where} must be a list of strings")
+    return value
+
+
+def _is_keyword(entry) -> bool:
+    """A keyword string, or a [keyword, weight] pair"""
+    if isinstance(entry, str):
+        return True
+    return (
+        isinstance(entry, list) and len(entry) == 2 and isinstance(entry[0], str)
+        and isinstance(entry[1], (int, float)) and not isinstance(entry[1], bool)
+    )
+
+
+class TemplateLibrary:
+    """One validated, compiled template pack
+
+    Instances are never modified after construction, so a request that takes
+    a reference at the start sees one consistent library throughout.
+    """
+
+    def __init__(self, pack: dict, source: str = "", generation: int = 0):
+        _require(isinstance(pack, dict), "Template pack must be a JSON object")
+        _require(pack.get("format") == PACK_FORMAT, f"Unsupported template pack format {pack.get('format')!r}")
+
+        self.version: str = str(pack.get("version", "unversioned"))
+        self.source = source
+        self.generation = generation
+
+        templates = pack.get("templates")
+        _require(isinstance(templates, dict), "templates must be an object")
+        self.templates: Dict[str, Dict[str, List[CompiledTemplate]]] = {}
+        for kind, allowed in TEMPLATE_FIELDS.items():
+            library = templates.get(kind)
+            _require(isinstance(library, dict) and library, f"templates.{kind} must be a non-empty object")
+            _require("default" in library, f"templates.{kind} needs a default category")
+            compiled = {}
+            for category, entries in library.items():
+                where = f"templates.{kind}.{category}"
+                _require(len(_string_list(entries, where)) > 0, f"{where} cannot be empty")
+                compiled[category] = [
+                    _compile_template(template, allowed, f"{where}[{position}]")
+                    for position, template in enumerate(entries)
+                ]
+            self.templates[kind] = compiled
+
+        keywords = pack.get("keywords")
+        _require(isinstance(keywords, dict), "keywords must be an object")
+        self.keywords: Dict[str, Dict[str, list]] = {}
+        for kind in TEMPLATE_FIELDS:
+            vocabulary = keywords.get(kind)
+            _require(isinstance(vocabulary, dict), f"keywords.{kind} must be an object")
+            for category, entries in vocabulary.items():
+                _require(
+                    isinstance(entries, list) and all(_is_keyword(entry) for entry in entries),
+                    f"keywords.{kind}.{category} must be a list of keywords or [keyword, weight] pairs"
+                )
+            self.keywords[kind] = vocabulary
+
+        self.sentence_enhancers = _string_list(pack.get("sentence_enhancers"), "sentence_enhancers")
+        _require(len(self.sentence_enhancers) > 0, "sentence_enhancers cannot be empty")
+        self.opening_phrases = _string_list(pack.get("opening_phrases", []), "opening_phrases")
+        self.closing_phrases = _string_list(pack.get("closing_phrases", []), "closing_phrases")
+
+        inline_completions = pack.get("inline_completions")
+        _require(isinstance(inline_completions, dict), "inline_completions must be an object")
+        _require("description" in inline_completions, "inline_completions needs a description table")
+        for field_type, table in inline_completions.items():
+            _require(
+                isinstance(table, dict) and all(isinstance(v, str) for v in table.values()),
+                f"inline_completions.{field_type} must map triggers to strings"
+            )
+        self.inline_completions: Dict[str, Dict[str, str]] = inline_completions
+
+        # Compiled indexes
+        try:
+            self.completion_indexes: Dict[str, CompletionIndex] = compile_completion_indexes(inline_completions)
+            self.classifiers: Dict[str, KeywordClassifier] = {
+                kind: KeywordClassifier(vocabulary) for kind, vocabulary in self.keywords.items()
+            }
+        except (TypeError, ValueError) as e:
+            raise TemplatePackError(str(e)) from e
+        self.alternative_pools: Dict[str, TemplatePool] = {
+            kind: TemplatePool(library) for kind, library in self.templates.items()
+        }
+
+        # Optional n-gram models per field type, paths relative to the pack
+        completion_models = pack.get("completion_models", {})
+        _require(
+            isinstance(completion_models, dict) and all(isinstance(v, str) for v in completion_models.values()),
+            "completion_models must map field types to model file paths"
+        )
+        self.completion_models: Dict[str, NgramModel] = {}
+        for field_type, model_path in completion_models.items():
+            model_path = os.path.join(os.path.dirname(os.path.abspath(source)) if source else "", model_path)
+            try:
+                self.completion_models[field_type] = NgramModel(model_path)
+            except (OSError, ValueError, KeyError) as e:
+                raise TemplatePackError(f"completion_models.{field_type}: {e}") from e
+
+    def completion_index(self, field_type: str) -> CompletionIndex:
+        """Compiled trigger index for a field type, defaulting to description"""
+        return self.completion_indexes.get(field_type, self.completion_indexes["description"])
+
+    def completion_model(self, field_type: str) -> Optional[NgramModel]:
+        """N-gram model for a field type, defaulting to description; None without one"""
+        return self.completion_models.get(field_type, self.completion_models.get("description"))
+
+    @classmethod
+    def from_file(cls, path: str, generation: int = 0) -> "TemplateLibrary":
+        """Read, validate and compile a template pack file"""
+        with open(path, "rb") as f:
+            data = f.read()
+        try:
+            # An empty file is invalid JSON too, as it briefly is while the pack is rewritten in place
+            pack = json.loads(data)
+        except ValueError as e:
+            raise TemplatePackError(f"{path}: invalid JSON ({e})") from e
+        return cls(pack, source=path, generation=generation)
+
+
+class TemplateStore:
+    """Holds the current TemplateLibrary and hot-reloads it from disk
+
+    A background thread polls the pack file; a changed file is loaded and
+    compiled off the request path and only swapped in once it is complete.
+    A pack that fails validation is logged and the current one is kept.
+    """
+
+    def __init__(self, path: str, poll_interval: float = 5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.current: Optional[TemplateLibrary] = None
+        self.reloads = 0
+        self.failed_reloads = 0
+        self.last_error: Optional[str] = None
+
+        self._signature = None
+        self._listeners: List[Callable[[TemplateLibrary], None]] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stat_signature(path: str):
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _file_signature(self):
+        """Signature of the pack file and of the model files the current pack maps"""
+        models = self.current.completion_models.values() if self.current else ()
+        return self._stat_signature(self.path), tuple(self._stat_signature(model.path) for model in models)
+
+    def on_swap(self, listener: Callable[[TemplateLibrary], None]) -> None:
+        """Call listener with the new library after every successful swap"""
+        self._listeners.append(listener)
+
+    def load(self) -> TemplateLibrary:
+        """Load the pack now, raising TemplatePackError if it is invalid"""
+        with self._lock:
+            pack_signature = self._stat_signature(self.path)
+            generation = self.current.generation + 1 if self.current else 0
+            library = TemplateLibrary.from_file(self.path, generation)
+            # Model signatures are taken from the files as they were mapped
+            self._signature = pack_signature, tuple(model.signature for model in library.completion_models.values())
+            self.current = library
+        for listener in self._listeners:
+            listener(library)
+        return library
+
+    def reload_if_changed(self) -> bool:
+        """Reload when the file has changed; return whether a new pack was swapped in"""
+        try:
+            if self._file_signature() == self._signature:
+                return False
+            library = self.load()
+        except (OSError, TemplatePackError) as e:
+            self.failed_reloads += 1
+            self.last_error = str(e)
+            logger.error("Template pack reload failed, keeping version %s: %s",
+                         self.current.version if self.current else None, e)
+            try:
+                self._signature = self._file_signature()
+            except OSError:
+                pass
+            return False
+
+        self.reloads += 1
+        self.last_error = None
+        logger.info("Loaded template pack %s (generation %d)", library.version, library.generation)
+        return True
+
+    def start(self) -> None:
+        """Start polling the pack file for changes"""
+        if self._thread is not None or self.poll_interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="template-pack-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop polling"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval + 1)
+            self._thread = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload_if_changed()
+            except Exception:
+                # Keep watching; the next change may well load
+                logger.exception("Template pack watcher failed, keeping version %s",
+                                 self.current.version if self.current else None)
+
+    def status(self) -> dict:
+        """Version and reload counters of the current pack"""
+        return {
+            "path": self.path,
+            "version": self.current.version if self.current else None,
+            "generation": self.current.generation if self.current else None,
+            "completion_models": {
+                field_type: {"path": model.path, "order": model.order, "vocabulary": model.vocabulary_size, "bytes": model.size}
+                for field_type, model in self.current.completion_models.items()
+            } if self.current else {},
+            "reloads": self.reloads,
+            "failed_reloads": self.failed_reloads,
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,156 @@
+"""
+Template pools for the AI Suggestion Service
+Precompiled templates and flattened template libraries with sampling that
+only renders what it returns
+"""
+
+import random
+import string
+from typing import Callable, Collection, Dict, Iterator, List, Mapping, Optional, Tuple
+
+# Placeholders every template may use besides its subject, filled from the
+# request context, with the text used when the context has no value
+CONTEXT_PLACEHOLDERS = {
+    "priority": "normal",
+    "duration": "the allotted time",
+    "department": "the department",
+    "assignee": "the assigned staff member",
+}
+
+
+class CompiledTemplate:
+    """A template parsed once into literal text and placeholder slots
+
+    Only plain {name} placeholders are supported. Conversions, format specs,
+    attribute or index lookups and names outside allowed are rejected with
+    ValueError when the template is compiled, never while rendering.
+    """
+
+    __slots__ = ("source", "fields", "_pieces", "_slots")
+
+    def __init__(self, source: str, allowed: Optional[Collection[str]] = None):
+        pieces: List[str] = []
+        slots: List[Tuple[int, str]] = []
+        for literal, field, spec, conversion in string.Formatter().parse(source):
+            if literal:
+                pieces.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"unsupported placeholder {{{field}{'!' + conversion if conversion else ''}{':' + spec if spec else ''}}}")
+            if allowed is not None and field not in allowed:
+                raise ValueError(f"unknown placeholder {{{field}}}")
+            slots.append((len(pieces), field))
+            pieces.append("")
+
+        if not slots:
+            pieces = ["".join(pieces)]
+
+        self.source = source
+        self.fields = frozenset(field for _, field in slots)
+        self._pieces = pieces
+        self._slots = tuple(slots)
+
+    def render(self, values: Mapping[str, str]) -> str:
+        """Fill the placeholders from values and join the pieces"""
+        if not self._slots:
+            return self._pieces[0]
+        pieces = self._pieces[:]
+        for position, field in self._slots:
+            pieces[position] = values[field]
+        return "".join(pieces)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompiledTemplate) and other.source == self.source
+
+    def __hash__(self) -> int:
+        return hash(self.source)
+
+    def __repr__(self) -> str:
+        return f"CompiledTemplate({self.source!r})"
+
+
+def placeholder_values(context: Optional[dict] = None, **values: str) -> Dict[str, str]:
+    """Placeholder values for one request: the given subject values plus the context placeholders"""
+    filled = dict(CONTEXT_PLACEHOLDERS)
+    if context:
+        for field in CONTEXT_PLACEHOLDERS:
+            value = context.get(field)
+            if value is None or value == "":
+                continue
+            if field == "duration" and isinstance(value, (int, float)) and not isinstance(value, bool):
+                value = f"{value} minutes"
+            filled[field] = str(value)
+    filled.update(values)
+    return filled
+
+
+# Action words dropped from a title to leave its subject
+ACTION_WORDS = frozenset({
+    "review", "prepare", "complete", "update", "create", "analyse", "analyze",
+    "organise", "organize", "coordinate", "implement", "evaluate", "schedule",
+    "plan", "discuss", "finalise", "finalize", "check", "verify", "confirm"
+})
+
+
+def extract_subject(title: str) -> str:
+    """Extract the main subject from a title"""
+    # Remove common action words to get the subject
+    words = title.lower().split()
+    subject_words = [w for w in words if w not in ACTION_WORDS and len(w) > 2]
+
+    if subject_words:
+        return " ".join(subject_words)
+    return title
+
+
+class TemplatePool:
+    """Flattened, deduplicated (category, template) entries of a template library
+
+    Built once per template pack. The "default" category is excluded,
+    matching the alternatives that have always been offered.
+    """
+
+    def __init__(self, library: Dict[str, List[CompiledTemplate]], exclude: Tuple[str, ...] = ("default",)):
+        self.entries: List[Tuple[str, CompiledTemplate]] = []
+        seen = set()
+        for key, templates in library.items():
+            if key in exclude:
+                continue
+            for template in templates:
+                if template not in seen:
+                    seen.add(template)
+                    self.entries.append((key, template))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def iter_random(self, rng: random.Random) -> Iterator[Tuple[str, CompiledTemplate]]:
+        """Yield entries in random order without replacement
+
+        A sparse Fisher-Yates shuffle: each draw is O(1) and only the swapped
+        positions are remembered, so taking k entries costs O(k) regardless of
+        the pool size.
+        """
+        entries = self.entries
+        size = len(entries)
+        swapped: Dict[int, int] = {}
+        for position in range(size):
+            chosen = rng.randrange(position, size)
+            index = swapped.get(chosen, chosen)
+            swapped[chosen] = swapped.get(position, position)
+            yield entries[index]
+
+    def iter_sample(self, rng: random.Random, render: Callable[[CompiledTemplate], str], exclude: Tuple[str, ...] = ()) -> Iterator[Tuple[str, str]]:
+        """Lazily yield distinct (category, rendered text) pairs in random order
+
+        Only the entries drawn are rendered; rendered texts equal to one in
+        exclude or already yielded are skipped.
+        """
+        seen = set(exclude)
+        for key, template in self.iter_random(rng):
+            text = render(template)
+            if text in seen:
+                continue
+            seen.add(text)
+            yield key, text
@@ -0,0 +1,247 @@
+"""
+Per-organisation template partitions for the AI Suggestion Service
+Loads an organisation's own template pack and models in the background on
+first use and keeps the most recently used partitions within a memory budget
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, FrozenSet, List, Optional, Set
+
+from template_store import TemplateLibrary
+
+logger = logging.getLogger("ai_service.tenants")
+
+# A compiled template library takes about this many times the size of its pack file
+PACK_MEMORY_FACTOR = 24
+
+
+def _stat_signature(path: str):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+class TenantPartition:
+    """One organisation's loaded library and what it was loaded from"""
+
+    __slots__ = ("library", "size", "signature", "checked_at")
+
+    def __init__(self, library: TemplateLibrary, size: int, signature, checked_at: float):
+        self.library = library
+        self.size = size
+        self.signature = signature
+        self.checked_at = checked_at
+
+
+class TenantLibraries:
+    """Template libraries of the organisations that have their own pack
+
+    An organisation's partition is the pack <directory>/<organisation id>.json.
+    Its completion_models paths are relative to the directory, for example
+    "12/description.ngram". Organisations without a pack get the default
+    library itself, so they share its caches and cost nothing extra.
+
+    library() never touches the disk, so it is safe on the event loop.
+    Listing the directory, checking a resident partition for changes and
+    loading a pack all run on a loader thread. Until an organisation's
+    pack has loaded, it gets the default library, or the last good version
+    of its own. Partitions are kept in least-recently-used order, with
+    sizes estimated from their pack and model files. When the total passes
+    the budget, the least recently used are evicted. The listing and each
+    resident partition are checked at most every poll_interval seconds. A
+    pack that fails to load is logged and retried after poll_interval. With
+    a poll_interval of 0, the directory is listed once and packs are loaded
+    once.
+    """
+
+    def __init__(self, directory: str, default: Callable[[], TemplateLibrary], budget: int, poll_interval: float = 5.0):
+        self.directory = directory
+        self.default = default
+        self.budget = budget
+        self.poll_interval = poll_interval
+        self.size = 0
+        self.loads = 0
+        self.failed_loads = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+        self._partitions: "OrderedDict[int, TenantPartition]" = OrderedDict()
+        self._failed: Dict[int, float] = {}
+        self._custom: FrozenSet[int] = frozenset()
+        self._listed_at = 0.0
+        self._listeners: List[Callable[[str, float], None]] = []
+        # Every load gets a new generation, so a partition reloaded after eviction never matches older cache keys
+        self._generations = itertools.count()
+        self._lock = threading.Lock()
+        # Organisations queued or being loaded; None stands for listing the directory
+        self._pending: Set[Optional[int]] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._list()
+
+    def on_load(self, listener: Callable[[str, float], None]) -> None:
+        """Call listener with the outcome ("success" or "failure") and duration of every load"""
+        self._listeners.append(listener)
+
+    def path(self, organisation_id: int) -> str:
+        return os.path.join(self.directory, f"{int(organisation_id)}.json")
+
+    def _due(self, since: float, now: float) -> bool:
+        return self.poll_interval > 0 and now - since >= self.poll_interval
+
+    def library(self, organisation_id: Optional[int]) -> TemplateLibrary:
+        """The organisation's own library once loaded, otherwise the default one"""
+        if organisation_id is None:
+            return self.default()
+        now = time.monotonic()
+        with self._lock:
+            if self._due(self._listed_at, now):
+                self._listed_at = now
+                self._schedule(None)
+            if organisation_id not in self._custom:
+                return self.default()
+
+            partition = self._partitions.get(organisation_id)
+            if partition is not None:
+                self._partitions.move_to_end(organisation_id)
+                if self._due(partition.checked_at, now):
+                    partition.checked_at = now
+                    self._schedule(organisation_id)
+                return partition.library
+
+            failed_at = self._failed.get(organisation_id)
+            if failed_at is None or self._due(failed_at, now):
+                self._schedule(organisation_id)
+            return self.default()
+
+    def _schedule(self, key: Optional[int]) -> None:
+        """Queue a listing (None) or an organisation's check and load; hold the lock"""
+        if key in self._pending:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tenant-pack-loader")
+        self._pending.add(key)
+        self._executor.submit(self._run, key)
+
+    def stop(self) -> None:
+        """Cancel queued loads; one already running finishes in the background"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._pending.clear()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    # Loader thread
+
+    def _run(self, key: Optional[int]) -> None:
+        try:
+            if key is None:
+                self._list()
+            else:
+                self._refresh(key)
+        except Exception:
+            logger.exception("Organisation template pack task failed")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _list(self) -> None:
+        custom = set()
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    stem, extension = os.path.splitext(entry.name)
+                    if extension == ".json" and stem.isdigit():
+                        custom.add(int(stem))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._custom = frozenset(custom)
+            self._listed_at = time.monotonic()
+            # Packs that were removed
+            for organisation_id in [organisation_id for organisation_id in self._partitions if organisation_id not in custom]:
+                self.size -= self._partitions.pop(organisation_id).size
+
+    def _file_signature(self, organisation_id: int, library: TemplateLibrary):
+        return _stat_signature(self.path(organisation_id)), tuple(_stat_signature(model.path) for model in library.completion_models.values())
+
+    def _refresh(self, organisation_id: int) -> None:
+        """Load the organisation's pack unless its resident partition is current"""
+        with self._lock:
+            partition = self._partitions.get(organisation_id)
+        if partition is not None:
+            try:
+                if self._file_signature(organisation_id, partition.library) == partition.signature:
+                    return
+            except OSError:
+                pass
+        self._load(organisation_id)
+
+    def _load(self, organisation_id: int) -> None:
+        started = time.perf_counter()
+        path = self.path(organisation_id)
+        try:
+            pack_signature = _stat_signature(path)
+            library = TemplateLibrary.from_file(path, next(self._generations))
+            size = PACK_MEMORY_FACTOR * pack_signature[1] + sum(model.size for model in library.completion_models.values())
+        except Exception as e:
+            # Whatever went wrong, record it so the pack is not retried before poll_interval
+            with self._lock:
+                self.failed_loads += 1
+                self._failed[organisation_id] = time.monotonic()
+            self._notify("failure", time.perf_counter() - started)
+            logger.error("Template pack for organisation %s failed to load: %s", organisation_id, e)
+            return
+
+        signature = pack_signature, tuple(model.signature for model in library.completion_models.values())
+        with self._lock:
+            self._failed.pop(organisation_id, None)
+            previous = self._partitions.pop(organisation_id, None)
+            if previous is not None:
+                self.size -= previous.size
+            self._partitions[organisation_id] = TenantPartition(library, size, signature, time.monotonic())
+            self.size += size
+            self.loads += 1
+            # The partition just loaded is kept even when it alone is over budget
+            while self.size > self.budget and len(self._partitions) > 1:
+                self._evict(next(iter(self._partitions)))
+        self._notify("success", time.perf_counter() - started)
+
+    def _evict(self, organisation_id: int) -> None:
+        partition = self._partitions.pop(organisation_id)
+        self.size -= partition.size
+        self.evictions += 1
+        self.evicted_bytes += partition.size
+
+    def _notify(self, outcome: str, seconds: float) -> None:
+        for listener in self._listeners:
+            listener(outcome, seconds)
+
+    def resident(self) -> int:
+        return len(self._partitions)
+
+    def status(self) -> dict:
+        """Resident partitions, most recently used last, with budget and counters"""
+        with self._lock:
+            partitions = [
+                {"organization_id": organisation_id, "version": partition.library.version,
+                 "generation": partition.library.generation, "bytes": partition.size}
+                for organisation_id, partition in self._partitions.items()
+            ]
+            loading = sum(1 for key in self._pending if key is not None)
+        return {
+            "directory": self.directory,
+            "custom": len(self._custom),
+            "resident": partitions,
+            "loading": loading,
+            "bytes": self.size,
+            "budget": self.budget,
+            "loads": self.loads,
+            "failed_loads": self.failed_loads,
+            "evictions": self.evictions,
+            "evicted_bytes": self.evicted_bytes,
+        }
@@ -0,0 +1,473 @@
+"""
+Compiled text indexes for the AI Suggestion Service
+Trigger tables are compiled once at startup so per-keystroke work does not
+grow with the number of triggers
+"""
+
+from array import array
+from bisect import insort
+from typing import Dict, List, Optional, Tuple
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton where every pattern carries an integer priority
+
+    Each state stores the lowest priority among all patterns ending at it
+    (including those reached through dictionary suffix links), so the best
+    match ending at any position is available in O(1).
+    """
+
+    def __init__(self, patterns: List[Tuple[str, int]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._own: List[List[int]] = [[]]
+        self._dict_link: List[int] = [-1]
+        self._best: List[Optional[int]] = [None]
+        self._depth: List[int] = [0]
+
+        for pattern, priority in patterns:
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = self._new_state(self._depth[state] + 1)
+                    self._goto[state][char] = nxt
+                state = nxt
+            self._own[state].append(priority)
+
+        self._build_links()
+
+    def _new_state(self, depth: int) -> int:
+        self._depth.append(depth)
+        self._goto.append({})
+        self._fail.append(0)
+        self._own.append([])
+        self._dict_link.append(-1)
+        self._best.append(None)
+        return len(self._goto) - 1
+
+    def _build_links(self) -> None:
+        queue = []
+        for state in self._goto[0].values():
+            queue.append(state)
+            self._best[state] = min(self._own[state]) if self._own[state] else None
+
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                fail = self._goto[fallback].get(char, 0)
+                self._fail[nxt] = fail
+                self._dict_link[nxt] = fail if self._own[fail] else self._dict_link[fail]
+
+                candidates = list(self._own[nxt])
+                if self._best[fail] is not None:
+                    candidates.append(self._best[fail])
+                self._best[nxt] = min(candidates) if candidates else None
+
+    def step(self, state: int, char: str) -> int:
+        """Advance the automaton by one character"""
+        goto = self._goto
+        while state and char not in goto[state]:
+            state = self._fail[state]
+        return goto[state].get(char, 0)
+
+    def best(self, state: int) -> Optional[int]:
+        """Lowest priority among patterns ending at this state"""
+        return self._best[state]
+
+    def depth(self, state: int) -> int:
+        """Length of the text matched by this state"""
+        return self._depth[state]
+
+    def outputs(self, state: int) -> List[int]:
+        """All priorities of patterns ending at this state"""
+        found = list(self._own[state])
+        link = self._dict_link[state]
+        while link != -1:
+            found.extend(self._own[link])
+            link = self._dict_link[link]
+        return found
+
+
+class PrefixTrie:
+    """Character trie answering "lowest priority keys starting with this prefix"
+
+    Each node keeps the keep lowest priorities of the keys below it.
+    """
+
+    def __init__(self, keys: List[Tuple[str, int]], keep: int = 1):
+        self.keep = keep
+        self._children: List[Dict[str, int]] = [{}]
+        self._top: List[List[int]] = [[]]
+
+        for key, priority in keys:
+            state = 0
+            self._update(state, priority)
+            for char in key:
+                nxt = self._children[state].get(char)
+                if nxt is None:
+                    self._children.append({})
+                    self._top.append([])
+                    nxt = len(self._children) - 1
+                    self._children[state][char] = nxt
+                state = nxt
+                self._update(state, priority)
+
+    def _update(self, state: int, priority: int) -> None:
+        top = self._top[state]
+        if len(top) < self.keep or priority < top[-1]:
+            insort(top, priority)
+            del top[self.keep:]
+
+    def _walk(self, prefix: str) -> Optional[int]:
+        state = 0
+        children = self._children
+        for char in prefix:
+            state = children[state].get(char)
+            if state is None:
+                return None
+        return state
+
+    def best_with_prefix(self, prefix: str) -> Optional[int]:
+        """Lowest priority among keys that start with the prefix"""
+        state = self._walk(prefix)
+        if state is None or not self._top[state]:
+            return None
+        return self._top[state][0]
+
+    def top_with_prefix(self, prefix: str) -> List[int]:
+        """Up to keep lowest priorities among keys that start with the prefix"""
+        state = self._walk(prefix)
+        return [] if state is None else list(self._top[state])
+
+
+class CompletionIndex:
+    """Compiled form of one INLINE_COMPLETIONS field table
+
+    Reproduces the four matching strategies of generate_inline_completion,
+    where a trigger's priority is its position in the table:
+
+    1. exact ending - lowest trigger ending the last portion (0.95)
+    2. partial word - lowest trigger whose first word starts with the last word (0.85)
+    3. substring - lowest trigger whose last occurrence ends within 5 chars of the end (0.75)
+    4. after space - lowest trigger starting with the last complete word (0.65)
+
+    Strategies 1 and 3 share a single automaton pass over the last portion;
+    strategies 2 and 4 are a single walk of the last word through a prefix trie.
+    """
+
+    PORTION_LENGTH = 30
+    SUBSTRING_WINDOW = 5
+    MAX_TOP_K = 10
+
+    STRATEGY_CONFIDENCE = {
+        "exact_ending": 0.95,
+        "partial_word": 0.85,
+        "substring": 0.75,
+        "after_space": 0.65,
+    }
+
+    def __init__(self, completions: Dict[str, str]):
+        self.triggers: List[str] = []
+        self.completions: List[str] = []
+        self.first_words: List[str] = []
+
+        for trigger, completion in completions.items():
+            if not trigger.strip():
+                raise ValueError("Inline completion triggers cannot be blank")
+            if not completion:
+                raise ValueError(f"Inline completion for '{trigger}' cannot be empty")
+            self.triggers.append(trigger)
+            self.completions.append(completion)
+            self.first_words.append(trigger.split()[0] if ' ' in trigger else trigger)
+
+        self._automaton = AhoCorasick([(t, i) for i, t in enumerate(self.triggers)])
+        self._first_word_trie = PrefixTrie([(w, i) for i, w in enumerate(self.first_words)], self.MAX_TOP_K)
+        self._trigger_trie = PrefixTrie([(t, i) for i, t in enumerate(self.triggers)], self.MAX_TOP_K)
+
+    def match(self, text_lower: str, ends_with_space: bool) -> Optional[Tuple[str, float, str]]:
+        """Return (completion, confidence, strategy) for stripped lowercase text"""
+        states = self.window_states(text_lower[-self.PORTION_LENGTH:])
+        return self.resolve(states, self._last_word(text_lower), len(text_lower), ends_with_space)
+
+    def rank(self, text_lower: str, ends_with_space: bool, k: int) -> List[Tuple[str, float, str]]:
+        """Return up to k (completion, confidence, strategy) candidates, best first"""
+        states = self.window_states(text_lower[-self.PORTION_LENGTH:])
+        return self.rank_states(states, self._last_word(text_lower), len(text_lower), ends_with_space, k)
+
+    @staticmethod
+    def _last_word(text_lower: str) -> str:
+        words = text_lower.split()
+        return words[-1] if words else ""
+
+    def window_states(self, last_portion: str) -> List[int]:
+        """One automaton pass over the last portion
+
+        Returns the states after each of the final SUBSTRING_WINDOW + 1
+        characters; the last one is the state at the end of the portion.
+        """
+        automaton = self._automaton
+        window_start = len(last_portion) - self.SUBSTRING_WINDOW
+        state = 0
+        states = []
+        for position, char in enumerate(last_portion, 1):
+            state = automaton.step(state, char)
+            if position >= window_start:
+                states.append(state)
+        return states
+
+    def resolve(self, states: List[int], last_word: str, length: int, ends_with_space: bool) -> Optional[Tuple[str, float, str]]:
+        """Apply the strategies in order and return the first match"""
+        automaton = self._automaton
+
+        # Strategy 1: exact ending
+        exact = automaton.best(states[-1])
+        if exact is not None:
+            return self.completions[exact], 0.95, "exact_ending"
+
+        # Strategy 2: partial word completion
+        if length >= 3 and len(last_word) >= 3:
+            found = self._first_word_trie.best_with_prefix(last_word)
+            if found is not None:
+                word_completion = self.first_words[found][len(last_word):]
+                return word_completion + self.completions[found], 0.85, "partial_word"
+
+        # Strategy 3: trigger near the end of the last portion
+        near_end = None
+        for state in states:
+            found = automaton.best(state)
+            if found is not None and (near_end is None or found < near_end):
+                near_end = found
+        if near_end is not None:
+            return self.completions[near_end], 0.75, "substring"
+
+        # Strategy 4: the user has just finished a word
+        if ends_with_space and last_word:
+            found = self._trigger_trie.best_with_prefix(last_word)
+            if found is not None:
+                return self.completions[found], 0.65, "after_space"
+
+        return None
+
+    def rank_states(self, states: List[int], last_word: str, length: int, ends_with_space: bool, k: int) -> List[Tuple[str, float, str]]:
+        """Collect candidates from every strategy, ranked by confidence then table order
+
+        The first candidate is always the one resolve() returns. A completion
+        offered by more than one strategy is kept at its highest confidence.
+        """
+        k = min(k, self.MAX_TOP_K)
+        automaton = self._automaton
+        ranked: List[Tuple[str, float, str]] = []
+        seen = set()
+
+        def add(strategy: str, priorities: List[int], prefix_length: int = -1) -> None:
+            for priority in sorted(set(priorities)):
+                if len(ranked) >= k:
+                    return
+                if prefix_length >= 0:
+                    completion = self.first_words[priority][prefix_length:] + self.completions[priority]
+                else:
+                    completion = self.completions[priority]
+                if completion not in seen:
+                    seen.add(completion)
+                    ranked.append((completion, self.STRATEGY_CONFIDENCE[strategy], strategy))
+
+        add("exact_ending", automaton.outputs(states[-1]))
+        if length >= 3 and len(last_word) >= 3:
+            add("partial_word", self._first_word_trie.top_with_prefix(last_word), len(last_word))
+        add("substring", [priority for state in states for priority in automaton.outputs(state)])
+        if ends_with_space and last_word:
+            add("after_space", self._trigger_trie.top_with_prefix(last_word))
+        return ranked
+
+
+class CompletionCursor:
+    """Incremental matching state for one client's text field
+
+    Keeps the lowercased text and the automaton state after every character,
+    so a keystroke only steps the automaton over the characters that changed.
+    Results are identical to CompletionIndex.match on the whole text: stored
+    states are only reused when the trigger they match lies entirely within
+    the last portion, and text whose lowercasing is not one character per
+    character (e.g. a final sigma) falls back to a full match.
+    """
+
+    def __init__(self, index: CompletionIndex):
+        self.index = index
+        self.text = ""
+        self.is_blank = True
+        self._lowered = ""
+        self._states = array("i")
+        self._lead = 0
+
+    def match(self, text: str) -> Optional[Tuple[str, float, str]]:
+        """Return (completion, confidence, strategy) for the field's new text"""
+        window = self._window(text)
+        return None if window is None else self.index.resolve(*window)
+
+    def rank(self, text: str, k: int) -> List[Tuple[str, float, str]]:
+        """Return up to k ranked candidates for the field's new text"""
+        window = self._window(text)
+        return [] if window is None else self.index.rank_states(*window, k)
+
+    def _window(self, text: str) -> Optional[Tuple[List[int], str, int, bool]]:
+        """Window states, last word, stripped length and trailing space for new text"""
+        covered = self._advance(text)
+        ends_with_space = text.endswith(" ")
+
+        if covered < len(text):
+            text_lower = text.lower().strip()
+            self.is_blank = not text_lower
+            if self.is_blank:
+                return None
+            states = self.index.window_states(text_lower[-self.index.PORTION_LENGTH:])
+            return states, self.index._last_word(text_lower), len(text_lower), ends_with_space
+
+        lowered = self._lowered
+        end = len(lowered)
+        while end and lowered[end - 1].isspace():
+            end -= 1
+        if self._lead < 0 or self._lead >= end:
+            lead = 0
+            while lead < end and lowered[lead].isspace():
+                lead += 1
+            self._lead = lead
+        lead = self._lead
+
+        self.is_blank = lead >= end
+        if self.is_blank:
+            return None
+
+        boundary = end
+        while boundary > lead and not lowered[boundary - 1].isspace():
+            boundary -= 1
+
+        return self._window_states(lead, end), lowered[boundary:end], end - lead, ends_with_space
+
+    def _advance(self, text: str) -> int:
+        """Step the automaton over changed characters; return how many are covered"""
+        previous = self.text
+        if text.startswith(previous):
+            common = len(previous)
+        elif previous.startswith(text):
+            common = len(text)
+        else:
+            common = 0
+            for old_char, new_char in zip(previous, text):
+                if old_char != new_char:
+                    break
+                common += 1
+
+        valid = min(len(self._states), common)
+        if valid <= self._lead:
+            # The first non-whitespace character may have changed
+            self._lead = -1
+        del self._states[valid:]
+        self._lowered = self._lowered[:valid]
+        self.text = text
+
+        automaton = self.index._automaton
+        states = self._states
+        state = states[-1] if states else 0
+        added = []
+        for char in text[valid:]:
+            lowered = char.lower()
+            if len(lowered) != 1 or char == "\u03a3":
+                break
+            state = automaton.step(state, lowered)
+            states.append(state)
+            added.append(lowered)
+        self._lowered += "".join(added)
+        return len(states)
+
+    def _window_states(self, lead: int, end: int) -> List[int]:
+        """Window states from stored states, rescanning only if a match crosses the window"""
+        index = self.index
+        automaton = index._automaton
+        window = max(lead, end - index.PORTION_LENGTH)
+        first = max(window + 1, end - index.SUBSTRING_WINDOW)
+
+        states = []
+        for position in range(first, end + 1):
+            state = self._states[position - 1]
+            if automaton.depth(state) > position - window:
+                return index.window_states(self._lowered[window:end])
+            states.append(state)
+        return states
+
+
+def compile_completion_indexes(tables: Dict[str, Dict[str, str]]) -> Dict[str, CompletionIndex]:
+    """Compile every field table of INLINE_COMPLETIONS"""
+    return {field_type: CompletionIndex(table) for field_type, table in tables.items()}
+
+
+class KeywordClassifier:
+    """Single-pass keyword classifier over an ordered category vocabulary
+
+    Categories are checked in the order given and keywords in the order
+    listed, so classify() returns the same category as a nested
+    "first keyword found in the text" loop. Keywords may be plain strings
+    or (keyword, weight) pairs; weights are only used by scores().
+    """
+
+    def __init__(self, vocabulary: Dict[str, list], default: str = "default"):
+        self.default = default
+        self._categories: List[str] = []
+        self._keyword_category: List[int] = []
+        self._keyword_weight: List[float] = []
+
+        patterns = []
+        for category, keywords in vocabulary.items():
+            category_id = len(self._categories)
+            self._categories.append(category)
+            for entry in keywords:
+                keyword, weight = (entry, 1.0) if isinstance(entry, str) else entry
+                if not keyword:
+                    raise ValueError(f"Empty keyword in category '{category}'")
+                patterns.append((keyword, len(self._keyword_category)))
+                self._keyword_category.append(category_id)
+                self._keyword_weight.append(float(weight))
+
+        self._automaton = AhoCorasick(patterns)
+
+    def classify(self, text: str) -> str:
+        """Return the first matching category, or the default"""
+        automaton = self._automaton
+        state = 0
+        best = None
+        for char in text.lower():
+            state = automaton.step(state, char)
+            found = automaton.best(state)
+            if found is not None and (best is None or found < best):
+                best = found
+        if best is None:
+            return self.default
+        return self._categories[self._keyword_category[best]]
+
+    def scores(self, text: str) -> List[Tuple[str, float]]:
+        """Return every matching category with its summed keyword weight
+
+        Each keyword counts once however often it appears. Results are
+        ordered by weight, then by category priority.
+        """
+        automaton = self._automaton
+        state = 0
+        matched = set()
+        for char in text.lower():
+            state = automaton.step(state, char)
+            if automaton.best(state) is not None:
+                matched.update(automaton.outputs(state))
+
+        totals: Dict[int, float] = {}
+        for keyword_id in matched:
+            category_id = self._keyword_category[keyword_id]
+            totals[category_id] = totals.get(category_id, 0.0) + self._keyword_weight[keyword_id]
+
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        return [(self._categories[category_id], weight) for category_id, weight in ranked]
@@ -0,0 +1,154 @@
+"""
+Request stage timing for the AI Suggestion Service
+Per-request stage timers reported in a Server-Timing header, and a fixed-size
+log of the slowest requests
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+
+class StageTimer:
+    """Splits one request's time into named stages
+
+    Each mark() closes the stage that started at the previous mark (or at
+    the start of the request). Repeated names accumulate, so a batch of
+    generations reports one total per stage.
+    """
+
+    __slots__ = ("started", "stages", "input", "_last")
+
+    def __init__(self):
+        self.started = self._last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.input: Optional[Dict[str, Any]] = None
+
+    def mark(self, name: str) -> None:
+        now = time.perf_counter()
+        self.stages[name] = self.stages.get(name, 0.0) + (now - self._last)
+        self._last = now
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def header(self) -> str:
+        """Server-Timing header value, durations in milliseconds"""
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.stages.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.3f}")
+        return ", ".join(parts)
+
+
+_current_timer: ContextVar[Optional[StageTimer]] = ContextVar("stage_timer", default=None)
+
+
+def mark_stage(name: str) -> None:
+    """Close the current stage of the request being served, if it is timed"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.mark(name)
+
+
+def describe_input(**fields: Any) -> None:
+    """Attach a redacted description of the request input to its timer
+
+    Callers pass shapes (lengths, types, keys), never the text itself.
+    """
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.input = fields
+
+
+class SlowRequestLog:
+    """The slowest requests seen, in a fixed number of slots
+
+    A min-heap keyed by duration: a request is only recorded when it is
+    slower than the fastest entry held, so the common case costs one
+    comparison.
+    """
+
+    def __init__(self, capacity: int = 50):
+        self.capacity = capacity
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def threshold(self) -> float:
+        """Duration a request must exceed to be recorded"""
+        heap = self._heap
+        return heap[0][0] if len(heap) >= self.capacity else 0.0
+
+    def record(self, duration: float, entry: Dict[str, Any]) -> None:
+        if self.capacity <= 0 or duration <= self.threshold():
+            return
+        with self._lock:
+            item = (duration, next(self._sequence), entry)
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, item)
+            elif duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Recorded requests, slowest first"""
+        with self._lock:
+            items = sorted(self._heap, reverse=True)
+        return [entry for _, _, entry in items]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+
+class ServerTimingMiddleware:
+    """ASGI middleware timing request stages
+
+    Makes a StageTimer current for the request, adds the stages marked so
+    far as a Server-Timing header when the response starts (closing a
+    "serialise" stage first), and offers the finished request to the slow
+    request log.
+    """
+
+    def __init__(self, app, slow_log: SlowRequestLog):
+        self.app = app
+        self.slow_log = slow_log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer()
+        token = _current_timer.set(timer)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if timer.stages:
+                    timer.mark("serialise")
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timer.header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timer.reset(token)
+            duration = timer.elapsed()
+            if duration > self.slow_log.threshold():
+                route = scope.get("route")
+                self.slow_log.record(duration, {
+                    "at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    "method": scope["method"],
+                    "route": getattr(route, "path", None) or "unmatched",
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 3),
+                    "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in timer.stages.items()},
+                    "input": timer.input,
+                })
@@ -95,6 +95,87 @@ export async function suggestCompletion(
     }
 }
 
+/**
+ * Open a persistent WebSocket channel for keystroke-level inline completion
+ *
+ * Each call to `suggest` sends one small frame tagged with a sequence id.
+ * When a newer keystroke is sent before the previous reply arrives, the
+ * older promise resolves with null and the server skips computing it.
+ * @returns {{suggest: function(string, string=, string=): Promise<{completion: string, full_text: string, confidence: number}|null>, close: function(): void}}
+ */
+export function createCompletionChannel() {
+    const socketUrl = `${AI_SERVICE_URL.replace(/^http/, "ws")}/ws/suggest/completion`;
+    let socket = null;
+    let sequence = 0;
+    let pending = null;
+
+    const settle = (result) => {
+        if (pending) {
+            pending.resolve(result);
+            pending = null;
+        }
+    };
+
+    const connect = () => {
+        if (socket && socket.readyState <= WebSocket.OPEN) {
+            return socket;
+        }
+
+        socket = new WebSocket(socketUrl);
+        socket.onmessage = (event) => {
+            const reply = JSON.parse(event.data);
+            if (!pending || reply.id !== pending.id) {
+                return;
+            }
+            if (reply.error) {
+                console.error("AI completion error:", reply.error);
+                settle({ completion: "", full_text: pending.text, confidence: 0 });
+                return;
+            }
+            const { id, ...completion } = reply;
+            settle(completion);
+        };
+        socket.onclose = () => settle(null);
+        socket.onerror = (error) => console.warn("AI completion channel error:", error);
+        return socket;
+    };
+
+    const suggest = (text, fieldType = "description", contextType = "general") => {
+        settle(null);
+        const id = ++sequence;
+        const message = JSON.stringify({
+            id,
+            text,
+            field_type: fieldType,
+            context_type: contextType,
+        });
+
+        return new Promise((resolve) => {
+            pending = { id, text, resolve };
+            const ws = connect();
+            if (ws.readyState === WebSocket.OPEN) {
+                ws.send(message);
+            } else {
+                ws.addEventListener("open", () => {
+                    if (pending && pending.id === id) {
+                        ws.send(message);
+                    }
+                }, { once: true });
+            }
+        });
+    };
+
+    const close = () => {
+        settle(null);
+        if (socket) {
+            socket.close();
+            socket = null;
+        }
+    };
+
+    return { suggest, close };
+}
+
 /**
  * Fetch alternative descriptions from AI service
  * @param {string} title - The title to generate alternatives for
@@ -150,6 +231,7 @@ export async function checkAIServiceHealth() {
 export default {
     suggestDescription,
     suggestCompletion,
+    createCompletionChannel,
     suggestAlternatives,
     checkAIServiceHealth,
 };